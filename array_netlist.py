@@ -0,0 +1,130 @@
+from typing import List, Dict, Tuple, TYPE_CHECKING
+import numpy as np
+
+if TYPE_CHECKING:
+    from circuitsimulator import CircuitSimulator
+
+gate_codes: Dict[str, int] = {"WIRE": 0, "AND": 1, "NAND": 2, "OR": 3, "NOR": 4, "XOR": 5, "XNOR": 6,
+                              "BUFF": 7, "NOT": 8, "DFF": 9}
+gate_names: Dict[int, str] = {code: name for name, code in gate_codes.items()}
+
+INTERMEDIATE, INPUT, OUTPUT = 0, 1, 2
+node_types = {"INTERM.": INTERMEDIATE, "INPUT": INPUT, "OUTPUT": OUTPUT}
+
+
+def gather(offsets: np.ndarray, values: np.ndarray, rows: np.ndarray) -> np.ndarray:
+    """Concatenation of the CSR rows, values[offsets[row]:offsets[row + 1]] for every row"""
+    starts = offsets[rows]
+    counts = offsets[rows + 1] - starts
+    total = int(counts.sum())
+    if not total:
+        return values[:0]
+    return values[np.repeat(starts - np.cumsum(counts) + counts, counts) + np.arange(total)]
+
+
+class ArrayNetlist:
+    """
+    Structure-of-arrays form of a netlist. Nets are numbered in bench order, and the fan-in of net n is
+    fanin[fanin_offsets[n]:fanin_offsets[n + 1]] (CSR); fan-out is kept the same way. Levels follow
+    CircuitSimulator.Nodes: inputs, flip flops and undriven nets are level 0, and order lists every other
+    net by level, level l being order[level_offsets[l - 1]:level_offsets[l]].
+    """
+
+    def __init__(self, names: List[str], gate_types: np.ndarray, io: np.ndarray,
+                 fanin_offsets: np.ndarray, fanin: np.ndarray):
+        self.names = names
+        self.index: Dict[str, int] = {name: n for n, name in enumerate(names)}
+        self.gate_types = gate_types
+        self.io = io
+        self.fanin_offsets = fanin_offsets
+        self.fanin = fanin
+        self.fanout_offsets, self.fanout = self.transpose()
+        self.inputs: np.ndarray = np.flatnonzero(io == INPUT)
+        self.outputs: np.ndarray = np.flatnonzero(io == OUTPUT)
+        self.flip_flops: np.ndarray = np.flatnonzero(gate_types == gate_codes["DFF"])
+        self.levels, self.sources, self.order, self.level_offsets = self.levelize()
+
+    def __len__(self):
+        return len(self.names)
+
+    @classmethod
+    def from_gates(cls, gates: 'CircuitSimulator.LineParser.Gates') -> 'ArrayNetlist':
+        return cls(gates.names, gates.gate_types, gates.io, gates.fanin_offsets, gates.fanin)
+
+    # Everything the constructor derives, so a stored netlist is rebuilt without levelizing again
+    array_names = ("gate_types", "io", "fanin_offsets", "fanin", "fanout_offsets", "fanout", "inputs", "outputs",
+                   "flip_flops", "levels", "sources", "order", "level_offsets")
+
+    @property
+    def arrays(self) -> Dict[str, np.ndarray]:
+        return {name: getattr(self, name) for name in self.array_names}
+
+    @classmethod
+    def from_arrays(cls, names: List[str], arrays: Dict[str, np.ndarray]) -> 'ArrayNetlist':
+        netlist = cls.__new__(cls)
+        netlist.names = names
+        netlist.index = {name: n for n, name in enumerate(names)}
+        for name in cls.array_names:
+            setattr(netlist, name, arrays[name])
+        return netlist
+
+    def transpose(self) -> Tuple[np.ndarray, np.ndarray]:
+        consumers = np.repeat(np.arange(len(self.names), dtype=np.int32), np.diff(self.fanin_offsets))
+        fanout = consumers[np.argsort(self.fanin, kind='stable')]
+        fanout_offsets = np.zeros(len(self.names) + 1, np.int64)
+        np.cumsum(np.bincount(self.fanin, minlength=len(self.names)), out=fanout_offsets[1:])
+        return fanout_offsets, fanout
+
+    def levelize(self) -> Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+        """One vectorized step per level: every net whose last input was just leveled joins the next level"""
+        pending = np.diff(self.fanin_offsets)
+        # Flip flops break the loops; a net caught in a combinational loop never gets a level
+        pending[self.flip_flops] = 0
+        levels = np.full(len(self.names), -1, np.int32)
+        frontier = np.flatnonzero(pending == 0)
+        sources = frontier
+        levels[frontier] = 0
+        is_flip_flop = self.gate_types == gate_codes["DFF"]
+        order: List[np.ndarray] = []
+        while frontier.size:
+            targets = gather(self.fanout_offsets, self.fanout, frontier)
+            targets = targets[~is_flip_flop[targets]]
+            np.subtract.at(pending, targets, 1)
+            frontier = np.unique(targets[pending[targets] == 0])
+            if frontier.size:
+                levels[frontier] = len(order) + 1
+                order.append(frontier)
+        level_offsets = np.zeros(len(order) + 1, np.int64)
+        np.cumsum([len(level) for level in order], out=level_offsets[1:])
+        return levels, sources, np.concatenate(order) if order else np.zeros(0, np.int64), level_offsets
+
+    def fanin_of(self, n: int) -> np.ndarray:
+        return self.fanin[self.fanin_offsets[n]:self.fanin_offsets[n + 1]]
+
+    def fanout_of(self, n: int) -> np.ndarray:
+        return self.fanout[self.fanout_offsets[n]:self.fanout_offsets[n + 1]]
+
+    def fanin_lists(self) -> List[List[int]]:
+        """Fan-in of every net as Python lists, for the engines that walk the netlist in Python"""
+        fanin = self.fanin.tolist()
+        offsets = self.fanin_offsets.tolist()
+        return [fanin[offsets[n]:offsets[n + 1]] for n in range(len(self.names))]
+
+    def fanout_lists(self) -> List[List[int]]:
+        fanout = self.fanout.tolist()
+        offsets = self.fanout_offsets.tolist()
+        return [fanout[offsets[n]:offsets[n + 1]] for n in range(len(self.names))]
+
+    def level_lists(self) -> List[List[int]]:
+        """Nets of every level, level 0 (the sources) first"""
+        order = self.order.tolist()
+        offsets = self.level_offsets.tolist()
+        return [self.sources.tolist(), *(order[offsets[n]:offsets[n + 1]] for n in range(len(offsets) - 1))]
+
+    def allocate_values(self, words: int) -> Tuple[np.ndarray, np.ndarray]:
+        """Per net ones and zeros rails of 64 pattern lanes per word, all U, plus the trailing pin slot"""
+        return np.zeros((len(self.names) + 1, words), np.uint64), np.zeros((len(self.names) + 1, words), np.uint64)
+
+    @property
+    def nbytes(self) -> int:
+        return sum(array.nbytes for array in self.arrays.values())
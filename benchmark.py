@@ -0,0 +1,184 @@
+import argparse
+import os
+import random
+import tempfile
+from time import time
+from typing import Dict, List
+from circuitsimulator import CircuitSimulator
+from scan_circuit_simulator import ScanCircuitSimulator
+from testvector import TestVector, TestVectorGenerator
+from vectorized import VectorizedKernel, to_words
+from parallel import pack
+from nodes import Node, AndGate, NandGate, OrGate, NorGate, XorGate, XnorGate, BuffGate, NotGate, \
+    value_0, value_1, value_D, value_DP, value_U
+
+gate_types = ["AND", "NAND", "OR", "NOR", "XOR", "XNOR", "NOT", "BUFF"]
+
+
+def wide_bench(path: str, inputs: int, width: int, depth: int, seed: int = 0, flip_flops: int = 0):
+    """
+    A circuit of depth levels with width gates each, every gate driven by the level below. Flip flops capture
+    gates of the last level and drive the first level along with the inputs.
+    """
+    rng = random.Random(seed)
+    lines = [f"INPUT(i{n})" for n in range(inputs)]
+    below = [f"i{n}" for n in range(inputs)] + [f"q{n}" for n in range(flip_flops)]
+    gates = []
+    for level in range(depth):
+        current = []
+        for n in range(width):
+            gate_type = rng.choice(gate_types)
+            fanin = rng.sample(below, 1 if gate_type in ("NOT", "BUFF") else rng.randint(2, 4))
+            gates.append(f"g{level}_{n} = {gate_type}({', '.join(fanin)})")
+            current.append(f"g{level}_{n}")
+        below = current
+    lines.extend(f"OUTPUT({name})" for name in below)
+    gates.extend(f"q{n} = DFF({below[n % len(below)]})" for n in range(flip_flops))
+    with open(path, 'w') as f:
+        f.write('\n'.join(lines + gates) + '\n')
+
+
+def time_good_machine(bench: str, vector_count: int, seed: int = 0) -> Dict[str, float]:
+    circuit = CircuitSimulator(bench=bench)
+    rng = random.Random(seed)
+    test_vectors = [
+        TestVector(''.join(rng.choice('01') for _ in circuit.nodes.input_nodes)) for _ in range(vector_count)
+    ]
+    timings: Dict[str, float] = {}
+    begin = time()
+    for test_vector in test_vectors:
+        circuit.apply_vector(test_vector)
+    timings["propagate"] = time() - begin
+    begin = time()
+    circuit.parallel_simulator.simulate(test_vectors)
+    timings["parallel"] = time() - begin
+    kernel = VectorizedKernel(circuit.netlist)
+    rails = pack(test_vectors, len(circuit.nodes.input_nodes))
+    words = -(-vector_count // 64)
+    ones, zeros = to_words([one for one, _ in rails], words), to_words([zero for _, zero in rails], words)
+    begin = time()
+    kernel.simulate(ones, zeros)
+    timings["vectorized"] = time() - begin
+    return timings
+
+
+def time_incremental(bench: str, vector_count: int, seed: int = 1) -> Dict[str, float]:
+    """Applying counter and LFSR vectors in full against re-evaluating only what each vector changes; an LFSR
+    seeded with 0 never leaves 0"""
+    circuit = CircuitSimulator(bench=bench)
+    incremental = CircuitSimulator(bench=bench, incremental=True)
+    input_bits = len(circuit.nodes.input_nodes)
+    sequences = {
+        "counter": TestVectorGenerator.from_counter(seed, input_bits, vector_count),
+        "lfsr": next(TestVectorGenerator(seed, input_bits, {2, 7}).batches(vector_count, vector_count)),
+    }
+    timings: Dict[str, float] = {}
+    for name, test_vectors in sequences.items():
+        begin = time()
+        for test_vector in test_vectors:
+            circuit.apply_vector(test_vector)
+        timings[f"{name} full"] = time() - begin
+        incremental.applied = False
+        saved = incremental.evaluations_saved
+        begin = time()
+        for test_vector in test_vectors:
+            incremental.apply_vector(test_vector)
+        timings[f"{name} incremental"] = time() - begin
+        timings[f"{name} saved"] = (incremental.evaluations_saved - saved) / (circuit.gate_count * len(test_vectors))
+    return timings
+
+
+def gate_evaluations_per_second(evaluations: int = 200000, seed: int = 0) -> Dict[str, float]:
+    """Five-valued evaluations per second of every gate type, over random 1 to 4 input values"""
+    rng = random.Random(seed)
+    values = [value_0, value_1, value_D, value_DP, value_U]
+    rates: Dict[str, float] = {}
+    for gate_class in (AndGate, NandGate, OrGate, NorGate, XorGate, XnorGate, BuffGate, NotGate):
+        gate = gate_class("g")
+        inputs = [[rng.choice(values) for _ in range(rng.randint(1, 4))] for _ in range(1000)]
+        begin = time()
+        for _ in range(evaluations // len(inputs)):
+            for input_values in inputs:
+                gate.evaluate(input_values)
+        rates[gate.type] = evaluations / (time() - begin)
+    faults = [(rng.choice(values), rng.choice([None, value_0, value_1])) for _ in range(1000)]
+    begin = time()
+    for _ in range(evaluations // len(faults)):
+        for value, stuck_at in faults:
+            Node.propagate_fault(value, stuck_at)
+    rates["propagate_fault"] = evaluations / (time() - begin)
+    return rates
+
+
+def time_scan_restore(bench: str, vector_count: int, fault_count: int = 1000, seed: int = 0) -> Dict[str, float]:
+    """
+    Mean cost per fault of putting the good machine back after a fault under scan: restoring every node, as
+    reset_state does, against restoring only the nodes the fault wrote, as apply_fault does
+    """
+    circuit = ScanCircuitSimulator(bench=bench)
+    rng = random.Random(seed)
+    test_vectors = [
+        TestVector(''.join(rng.choice('01') for _ in circuit.nodes.scan_in_nodes)) for _ in range(vector_count)
+    ]
+    faults = rng.sample(circuit.fault_list, min(fault_count, len(circuit.fault_list)))
+    full = differential = 0.0
+    for test_vector in test_vectors:
+        circuit.scan_test(test_vector)
+        begin = time()
+        for _ in faults:
+            circuit.nodes.reset_state()
+        full += time() - begin
+        begin = time()
+        for fault in faults:
+            circuit.nodes.restore(fault.node.written)
+        differential += time() - begin
+    restores = len(test_vectors) * len(faults)
+    return {
+        "nodes": len(circuit.nodes), "written": sum(len(fault.node.written) for fault in faults) / len(faults),
+        "full": full / restores * 1e6, "differential": differential / restores * 1e6
+    }
+
+
+def main(sizes: List[int], depth: int, vector_count: int):
+    for width in sizes:
+        with tempfile.TemporaryDirectory() as directory:
+            bench = os.path.join(directory, "wide.bench")
+            wide_bench(bench, width, width, depth)
+            timings = time_good_machine(bench, vector_count)
+        print(f"{width} gates x {depth} levels, {vector_count} vectors: " + ', '.join(
+            f"{name} {seconds:.4f}s" for name, seconds in timings.items()
+        ))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('benchmark', nargs='?', choices=['wide', 'gates', 'scan', 'incremental'], default='wide',
+                        help='good machine simulators on wide circuits, five-valued gate evaluations, restoring '
+                             'the good machine after a fault under scan, or applying vectors incrementally')
+    parser.add_argument('-w', '--widths', type=int, nargs='+', default=[100, 1000, 10000])
+    parser.add_argument('-d', '--depth', type=int, default=4)
+    parser.add_argument('-n', '--vectors', type=int, default=256)
+    args = parser.parse_args()
+    if args.benchmark == 'gates':
+        for name, rate in gate_evaluations_per_second().items():
+            print(f"{name}: {rate:,.0f} evaluations/s")
+    elif args.benchmark == 'scan':
+        for width in args.widths:
+            with tempfile.TemporaryDirectory() as directory:
+                bench = os.path.join(directory, "wide.bench")
+                wide_bench(bench, width, width, args.depth, flip_flops=width // 10)
+                timings = time_scan_restore(bench, args.vectors)
+            print(f"{timings['nodes']} nodes, {timings['written']:.1f} written per fault: restoring every node "
+                  f"{timings['full']:.2f}us, only the written ones {timings['differential']:.2f}us")
+    elif args.benchmark == 'incremental':
+        for width in args.widths:
+            with tempfile.TemporaryDirectory() as directory:
+                bench = os.path.join(directory, "wide.bench")
+                wide_bench(bench, width, width, args.depth)
+                timings = time_incremental(bench, args.vectors)
+            print(f"{width} gates x {args.depth} levels, {args.vectors} vectors: " + ', '.join(
+                f"{name} {timings[f'{name} full']:.4f}s in full, {timings[f'{name} incremental']:.4f}s incrementally "
+                f"({timings[f'{name} saved']:.0%} of evaluations saved)" for name in ("counter", "lfsr")
+            ))
+    else:
+        main(args.widths, args.depth, args.vectors)
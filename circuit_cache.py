@@ -0,0 +1,68 @@
+import hashlib
+import os
+import shutil
+import tempfile
+from typing import Dict, List, Optional
+import numpy as np
+
+# Bump whenever the layout of the cached arrays or the meaning of their contents changes
+cache_version = 3
+
+
+class CircuitCache:
+    """
+    Compiled circuits on disk, one directory per bench keyed by a hash of its contents and cache_version.
+    Every array is a .npy file of its own, so a load memory-maps it rather than reading it; the net names
+    are kept in names.txt. Entries are written to a temporary directory and renamed into place, so
+    processes compiling the same bench at once never see half an entry.
+    """
+
+    def __init__(self, directory: str):
+        self.directory = directory
+
+    @staticmethod
+    def key(bench: str) -> str:
+        digest = hashlib.sha256(f"{cache_version}\n".encode())
+        with open(bench, 'rb') as f:
+            for block in iter(lambda: f.read(1 << 20), b''):
+                digest.update(block)
+        return digest.hexdigest()
+
+    def path(self, key: str, name: str = '') -> str:
+        return os.path.join(self.directory, key, name)
+
+    def load(self, key: str, name: str) -> Optional[Dict[str, np.ndarray]]:
+        """The arrays stored under name, memory-mapped, or None on a miss"""
+        path = self.path(key, name)
+        if not os.path.isdir(path):
+            return None
+        return {
+            file[:-len(".npy")]: np.load(os.path.join(path, file), mmap_mode='r')
+            for file in os.listdir(path) if file.endswith(".npy")
+        }
+
+    def save(self, key: str, name: str, arrays: Dict[str, np.ndarray]):
+        os.makedirs(self.path(key), exist_ok=True)
+        temporary = tempfile.mkdtemp(dir=self.path(key))
+        for array_name, array in arrays.items():
+            np.save(os.path.join(temporary, f"{array_name}.npy"), np.ascontiguousarray(array))
+        try:
+            os.rename(temporary, self.path(key, name))
+        except OSError:
+            # Another process got there first
+            shutil.rmtree(temporary, ignore_errors=True)
+
+    def load_names(self, key: str) -> Optional[List[str]]:
+        try:
+            with open(self.path(key, "names.txt")) as f:
+                text = f.read()
+        except FileNotFoundError:
+            return None
+        return text.split('\n') if text else []
+
+    def save_names(self, key: str, names: List[str]):
+        os.makedirs(self.path(key), exist_ok=True)
+        file, temporary = tempfile.mkstemp(dir=self.path(key))
+        with os.fdopen(file, 'w') as f:
+            f.write('\n'.join(names))
+        os.replace(temporary, self.path(key, "names.txt"))
@@ -3,16 +3,32 @@ import collections
 from faults import *
 from nodes import *
 from testvector import *
-from re import match
+from array_netlist import ArrayNetlist, gate_codes, INTERMEDIATE, INPUT, OUTPUT
+from parallel import ParallelSimulator, ScanParallelSimulator
+from codegen import GeneratedKernel
+from vectorized import VectorizedKernel
+from deductive import DeductiveSimulator
+from concurrent_simulator import ConcurrentSimulator
+from critical_path import CriticalPathTracer
+from collapse import CollapsedFaults
+from circuit_cache import CircuitCache
+from fault_dictionary import FaultDictionary
+from diagnosis import SignatureIndex
+import array
 import itertools
 import functools
 import exceptions
+import os
+import tempfile
+import unittest
+import numpy as np
 from typing import Optional, DefaultDict, List, OrderedDict
-from contextlib import contextmanager
+from contextlib import contextmanager, nullcontext
+from concurrent.futures import ProcessPoolExecutor
 from dataclasses import dataclass
 
 
-def propagate(path: Iterable[Set[Node]]):
+def propagate(path: Iterable[List[Node]]):
     for nodes in path:
         for node in nodes:
             node.logic()
@@ -20,19 +36,63 @@ def propagate(path: Iterable[Set[Node]]):
             node.update()
 
 
+# The circuit of a run_batch worker process, compiled once by its initializer
+_shard_circuit: Optional['CircuitSimulator'] = None
+
+
+def _init_shard_worker(circuit_class: Type['CircuitSimulator'], kwargs: Dict[str, Any]):
+    global _shard_circuit
+    _shard_circuit = circuit_class(**kwargs)
+
+
+def _run_shard(test_vectors: List[str], engine: str, get_all_coverage: bool, get_list_coverage: bool,
+               shard: Tuple[List[int], List[int]]) -> Tuple[List[List[int]], List[List[int]]]:
+    """
+    Coverage of a shard of the faults: all coverage of the first faults of the shard, list coverage of the
+    second, the ones still remaining. Nodes and Values do not pickle, so faults travel as indices into
+    fault_list and vectors as strings.
+    """
+    fault_list = _shard_circuit.fault_list
+    faults = {fault_list[n] for n in shard[0]}
+    remaining_faults = {fault_list[n] for n in shard[1]}
+    test_vectors = [TestVector(test_vector) for test_vector in test_vectors]
+    simulator = _shard_circuit.engines[engine]
+    fault_ids = _shard_circuit.fault_ids
+    fault_coverage_all = [
+        [fault_ids[fault] for fault in detected] for _, detected in simulator.fault_coverage_all(test_vectors, faults)
+    ] if get_all_coverage else []
+    fault_coverage_list = [
+        [fault_ids[fault] for fault in detected]
+        for _, detected in simulator.fault_coverage_list(test_vectors, remaining_faults)
+    ] if get_list_coverage else []
+    return fault_coverage_all, fault_coverage_list
+
+
 class CircuitSimulator:
+    # Fraction of the gates past which apply_changes propagates the levels left in full, as an evaluation costs
+    # about twice as much once events are queued for it
+    incremental_limit = 0.5
+
     def __init__(self, **kwargs):
         self.faulty_node: Optional[Node, InputFault] = Node
         self.fault: Optional[Fault] = None
-        self.tv_lookup: DefaultDict[TestVector, Set[Fault]] = defaultdict(set)
+        self.overlay = FaultOverlay()
+        self.dictionary: Optional[FaultDictionary] = None
+        self.signature_indices: Dict[str, SignatureIndex] = {}
         self.nodes: CircuitSimulator.Nodes
         self.kwargs = kwargs
-        self.compile(self.LineParser(kwargs['bench']).parse_file())
+        self.cache: Optional[CircuitCache] = CircuitCache(kwargs['cache']) if kwargs.get('cache') else None
+        self.compile(*self.parse())
         self.tv: Union[None, TestVector] = None
+        # With the incremental keyword, apply_vector only re-evaluates what changed since the last vector it applied
+        self.incremental: bool = bool(kwargs.get('incremental'))
+        self.applied = False
+        # Gate evaluations incremental application has skipped, against propagating every vector in full
+        self.evaluations_saved = 0
 
     @staticmethod
     def local_faults(node: Node) -> List[Fault]:
-        """Node SA-0 and SA-1, and on input fault if the input node has fanout"""
+        """Node SA-0 and SA-1, and SA-0 and SA-1 on every input pin; CollapsedFaults merges redundant pins"""
         faults = [Fault(node, Value(0)), Fault(node, Value(1))]
         faults.extend(
             fault for faults in (
@@ -44,16 +104,36 @@ class CircuitSimulator:
         return faults
 
     @functools.cached_property
-    def faults(self) -> Set[Fault]:
-        """Full fault list of current circuit"""
-        return {
+    def fault_list(self) -> List[Fault]:
+        """Full fault list of current circuit, in node order; the same in every process compiling the bench"""
+        return [
             fault for faults in (
                 self.local_faults(node) for node in self.nodes
             )
             for fault in faults
-        }
+        ]
 
-    def propagate(self, path: Iterable[Set[Node]]):
+    @functools.cached_property
+    def faults(self) -> Set[Fault]:
+        """Full fault list of current circuit"""
+        return set(self.fault_list)
+
+    @functools.cached_property
+    def fault_ids(self) -> Dict[Fault, int]:
+        return {fault: n for n, fault in enumerate(self.fault_list)}
+
+    @functools.lru_cache(None)
+    def collapsed_faults(self, dominance: bool = False) -> CollapsedFaults:
+        name = "collapsed_dominance" if dominance else "collapsed"
+        arrays = self.cache.load(self.cache_key, name) if self.cache is not None else None
+        if arrays is not None:
+            return CollapsedFaults.from_arrays(self.fault_list, arrays)
+        collapsed_faults = CollapsedFaults(self.nodes, self.faults, dominance)
+        if self.cache is not None:
+            self.cache.save(self.cache_key, name, collapsed_faults.to_arrays(self.fault_list))
+        return collapsed_faults
+
+    def propagate(self, path: Iterable[List[Node]]):
         # TODO: If you want to have a pretty printout of values you can uncomment self.iteration_printer
         # self.iteration_printer = self.IterationPrinter(self.tv, self.fault, self.nodes)
         for nodes in path:
@@ -64,53 +144,188 @@ class CircuitSimulator:
             # self.iteration_printer(self.nodes)
         # print(self.iteration_printer)
 
-    @staticmethod
-    def propagate_generator(path: Iterable[Set[Node]]) -> Generator[Set[Node], None, None]:
-        for nodes in path:
-            for node in nodes:
-                node.logic()
-            for node in nodes:
-                node.update()
-            yield nodes
-
     def apply_vector(self, test_vector: TestVector):
         self.tv = test_vector
+        if self.incremental and self.applied:
+            self.apply_changes(test_vector)
+            return
         for node, value in zip(self.nodes.input_nodes.values(), test_vector):
             node.vector_assignment = value
             node.value = value
         self.propagate(self.nodes.full_propagation_path)
+        self.applied = True
+
+    @functools.cached_property
+    def gate_count(self) -> int:
+        """Gates evaluated when a vector is applied in full"""
+        return sum(map(len, self.nodes.full_propagation_path))
+
+    def apply_changes(self, test_vector: TestVector):
+        """
+        Apply a vector over the good machine of the last one, only evaluating the gates downstream of the inputs
+        it changes. Events are queued in one bucket per level and the buckets are drained lowest first, so a gate
+        is evaluated once all of its changed inputs are settled, and a gate whose value stays the same queues
+        nothing. Once incremental_limit of the gates have been evaluated, the levels left are propagated in full.
+        """
+        path = self.nodes.full_propagation_path
+        pending: List[List[Node]] = [[] for _ in range(len(path) + 1)]
+        # Nodes hash by name, which is slow, so the queued ones are kept by identity
+        queued: Set[int] = set()
+
+        def queue(node: Node):
+            for output_node in node.outputs_that_are_not_flip_flops:
+                if id(output_node) not in queued:
+                    queued.add(id(output_node))
+                    pending[output_node.level].append(output_node)
+
+        for node, value in zip(self.nodes.input_nodes.values(), test_vector):
+            if node.value is not value:
+                node.vector_assignment = value
+                node.value = value
+                queue(node)
+        evaluations = 0
+        limit = self.incremental_limit * self.gate_count
+        for level, nodes in enumerate(pending):
+            if evaluations > limit:
+                self.propagate(path[level - 1:])
+                evaluations += sum(map(len, path[level - 1:]))
+                break
+            for node in nodes:
+                node.logic()
+                evaluations += 1
+                if node.value_new is not node.value:
+                    node.update()
+                    queue(node)
+        self.evaluations_saved += self.gate_count - evaluations
+
+    @functools.cached_property
+    def parallel_simulator(self) -> ParallelSimulator:
+        return ParallelSimulator(self.netlist, self.kernel)
+
+    @functools.cached_property
+    def deductive_simulator(self) -> DeductiveSimulator:
+        return DeductiveSimulator(self.parallel_simulator, self.faults)
+
+    @functools.cached_property
+    def concurrent_simulator(self) -> ConcurrentSimulator:
+        return ConcurrentSimulator(self.parallel_simulator, self.faults)
+
+    @functools.cached_property
+    def critical_path_tracer(self) -> CriticalPathTracer:
+        return CriticalPathTracer(self.parallel_simulator, self.faults)
+
+    @functools.cached_property
+    def engines(self) -> Dict[str, Any]:
+        """Simulation engines that run_batch can use; each provides output_values and fault_coverage_*"""
+        return {"serial": self, "parallel": self.parallel_simulator, "ppsfp": self.parallel_simulator,
+                "deductive": self.deductive_simulator, "concurrent": self.concurrent_simulator,
+                "critical_path": self.critical_path_tracer}
+
+    def output_values(self, test_vectors: List[TestVector]) -> List[List[Value]]:
+        """Fault-free primary output values of each test vector"""
+        result = []
+        for test_vector in test_vectors:
+            self.apply_vector(test_vector)
+            result.append([node.value for node in self.nodes.output_nodes.values()])
+        return result
+
+    def good_outputs(self, test_vectors: List[TestVector], engine: str = "serial") -> List[List[Value]]:
+        return self.engines[engine].output_values(test_vectors)
 
     @contextmanager
-    def apply_fault(self, fault: Fault) -> Generator[Value, None, None]:
+    def apply_fault(self, fault: Fault, overlay: FaultOverlay = None) -> Generator[FaultOverlay, None, None]:
+        """
+        Lay the fault over the good machine left by apply_vector, which stays as it is. Threads sharing the
+        circuit pass an overlay each.
+        """
+        overlay = self.overlay if overlay is None else overlay
         self.fault = fault
-        if fault.input_node:
-            self.nodes.faulty_node = InputFault(fault.node, fault.input_node, fault.stuck_at)
-        else:
-            fault.node.stuck_at = fault.stuck_at
-            self.nodes.faulty_node = fault.node
-        backtrack = [nodes for nodes in self.propagate_generator(self.nodes.faulty_node.fault_propagation_path)]
-        yield
-        self.nodes.faulty_node.local_reset()
-        # TODO: Use an integer to specify how many sets should be traversed
-        self.propagate(backtrack)
-
-    def detect_fault(self, fault: Fault) -> bool:
-        with self.apply_fault(fault):
-            return any(node.value.propagates_fault for node in self.nodes.output_nodes.values())
-
-    def detect_faults(self, tv: TestVector) -> List[Fault]:
+        overlay.inject(fault.node, fault.stuck_at, fault.input_node)
+        yield overlay
+        overlay.clear()
+
+    def detect_fault(self, fault: Fault, overlay: FaultOverlay = None) -> bool:
+        with self.apply_fault(fault, overlay) as overlay:
+            return any(overlay.value(node).propagates_fault for node in self.nodes.output_nodes.values())
+
+    def detect_faults(self, tv: TestVector, faults: Iterable[Fault] = None) -> List[Fault]:
         self.apply_vector(tv)
-        self.propagate(self.nodes.full_propagation_path)
-        return [fault for fault in self.faults if self.detect_fault(fault)]
+        return [fault for fault in (self.faults if faults is None else faults) if self.detect_fault(fault)]
 
     def detect_and_eliminate_faults(self, tv: TestVector, faults: Set[Fault]) -> List[Fault]:
-        known_faults = self.tv_lookup[tv]
-        detected_faults = faults.intersection(known_faults)
-        undetected_faults = faults.difference(known_faults)
-        self.apply_vector(tv)
-        detected_faults.update(fault for fault in undetected_faults if self.detect_fault(fault))
+        detected_faults = self.known_faults(tv, faults)
+        if detected_faults is None:
+            self.apply_vector(tv)
+            detected_faults = [fault for fault in faults if self.detect_fault(fault)]
         faults.difference_update(detected_faults)
-        return list(detected_faults)
+        return detected_faults
+
+    def known_faults(self, tv: TestVector, faults: Set[Fault]) -> Optional[List[Fault]]:
+        """The given faults the vector detects, if the fault dictionary has simulated it"""
+        fault_ids = self.dictionary.get(tv) if self.dictionary is not None else None
+        if fault_ids is None:
+            return None
+        return [fault for fault in (self.fault_list[n] for n in fault_ids) if fault in faults]
+
+    def open_dictionary(self) -> FaultDictionary:
+        """
+        The fault dictionary of the circuit, kept in the cache next to the compiled bench. From now on run_batch
+        and detect_and_eliminate_faults read the faults of every vector it has from it, rather than simulating.
+        """
+        if self.cache is None:
+            raise ValueError("The fault dictionary is kept in the circuit cache, which is not enabled")
+        self.dictionary = FaultDictionary(
+            self.cache.path(self.cache_key, f"dictionary_{type(self).__name__}"), len(self.fault_list),
+            len(self.nodes.scan_in_nodes)
+        )
+        return self.dictionary
+
+    def signature_index(self, test_vectors: Sequence[TestVector]) -> SignatureIndex:
+        """
+        The signatures of every fault over the test set, built with the parallel engine and cached by the vectors
+        and the simulator class, which decides what is observed
+        """
+        key = SignatureIndex.key(test_vectors)
+        try:
+            return self.signature_indices[key]
+        except KeyError:
+            pass
+        name = f"signatures_{type(self).__name__}_{key}"
+        arrays = self.cache.load(self.cache_key, name) if self.cache is not None else None
+        if arrays is not None:
+            signature_index = SignatureIndex.from_arrays(arrays)
+        else:
+            signature_index = SignatureIndex.build(self.parallel_simulator, test_vectors, self.fault_list)
+            if self.cache is not None:
+                self.cache.save(self.cache_key, name, signature_index.to_arrays())
+        self.signature_indices[key] = signature_index
+        return signature_index
+
+    def diagnose(self, test_vectors: Sequence[TestVector], failures: Iterable[Tuple[int, int]],
+                 count: int = 10) -> List[Tuple[Fault, float]]:
+        """
+        Candidate faults for a device that failed the test set, best first, with their scores (see
+        SignatureIndex.diagnose). failures are the (vector, output) pairs the device failed: indices into
+        test_vectors and the primary outputs, or the scan out nodes under scan.
+        """
+        return [
+            (self.fault_list[n], score)
+            for n, score in self.signature_index(test_vectors).diagnose(failures, count)
+        ]
+
+    def fault_coverage_all(self, test_vectors: List[TestVector],
+                           faults: Set[Fault]) -> List[Tuple[TestVector, List[Fault]]]:
+        return [
+            (test_vector, self.detect_faults(test_vector, faults))
+            for test_vector in test_vectors
+        ]
+
+    def fault_coverage_list(self, test_vectors: List[TestVector],
+                            remaining_faults: Set[Fault]) -> List[Tuple[TestVector, List[Fault]]]:
+        return [
+            (test_vector, self.detect_and_eliminate_faults(test_vector, remaining_faults))
+            for test_vector in test_vectors
+        ]
 
     @dataclass
     class Result:
@@ -118,42 +333,183 @@ class CircuitSimulator:
         remaining_faults: Set[Fault]
         fault_coverage_all: List
         fault_coverage_list: List
+        good_outputs: List
 
-        def __init__(self, remaining_faults, fault_coverage_all, fault_coverage_list):
+        def __init__(self, remaining_faults, fault_coverage_all, fault_coverage_list, good_outputs=None):
             self.remaining_faults = remaining_faults
             self.fault_coverage_all = fault_coverage_all
             self.fault_coverage_list = fault_coverage_list
+            self.good_outputs = good_outputs if good_outputs is not None else []
 
-    def run_batch(self, seed: int, taps: Set[int], lookup_dict: Dict[TestVector, Set[Fault]] = None,
-                  get_all_coverage=True, get_list_coverage=True, sequential=False) -> Result:
+    def vector_width(self, engine: str = "serial") -> int:
+        """Bits of the vectors engine is given, one for every scan in node"""
+        return len(self.nodes.scan_in_nodes)
+
+    def test_vector_batches(self, seed: int, taps: Set[int], count: Optional[int] = None,
+                            batch_size: int = 4096, engine: str = "serial") -> Iterator[TestVectorBatch]:
+        """The vectors of run_batch, batch_size at a time, cut to the width of the vectors of engine"""
+        input_bits = self.vector_width(engine)
+        batches = TestVectorGenerator(seed, input_bits, taps).batches(count, batch_size) if taps else \
+            TestVectorGenerator.counter(seed, input_bits, count, batch_size)
+        for batch in batches:
+            yield batch.cut(input_bits)
+
+    def run_batch(self, seed: int, taps: Set[int], get_all_coverage=True, get_list_coverage=True, sequential=False,
+                  get_good_outputs=False, engine: str = "serial", collapse=False, dominance=False,
+                  processes: int = 1, vector_count: Optional[int] = None, batch_size: int = 4096,
+                  target_coverage: Optional[float] = None, effective_only=False,
+                  log: Optional[VectorLog] = None) -> Result:
         """
         taps = {} -> counter is used
         taps = {1} -> LFSR with no taps is used
         taps = {2, 3, 5} -> LFSR with taps at 2, 3, and 5 is used
+        engine = "serial" -> one vector at a time through the netlist, one fault at a time
+        engine = "parallel" or "ppsfp" -> vectors packed into the bit lanes of ints; faults are
+            simulated one at a time against the whole batch (parallel-pattern single-fault propagation)
+        engine = "deductive" -> fault lists propagated alongside the good machine, one pass per vector
+        engine = "concurrent" -> event-driven; only gates downstream of inputs that changed since the
+            previous vector are re-evaluated
+        engine = "critical_path" -> criticality traced backward from the primary outputs, one pass per batch
+            of vectors; only fanout stems are simulated forward
+        collapse -> only one fault of every class of equivalent faults is simulated, and the coverage is
+            expanded back to every fault
+        dominance -> on top of collapse, faults dominating the input faults of their gate are not simulated
+            either; they are credited along with the input faults, see CollapsedFaults
+        processes > 1 -> the faults are split into shards simulated by a pool of worker processes, each
+            compiling the circuit once; a fault's first detection does not depend on the other faults,
+            so merging the shards gives the same coverage
+        vector_count -> how many vectors to generate (2^inputs, at most 100, by default); they are generated
+            and simulated batch_size at a time, so only the results are held on to
+        target_coverage -> stop after the batch in which list coverage of the simulated faults reaches it;
+            1.0 stops once every fault is detected
+        effective_only -> list coverage only keeps the vectors that detect new faults
+        log -> every vector simulated is written to it
+        With a fault dictionary open (see open_dictionary), vectors it does not have are simulated against every
+        fault and added to it, and coverage is read from it.
         """
-        if lookup_dict is None:
-            lookup_dict = {}
-
-        input_bits = len(self.nodes.scan_in_nodes)
-        test_vectors = TestVectorGenerator(seed, input_bits, taps)() if taps else \
-            TestVectorGenerator.from_counter(seed, input_bits)
-        test_vectors = [test_vector[:input_bits] for test_vector in test_vectors]
-        remaining_faults = self.faults.copy()
+        if self.dictionary is not None and dominance:
+            raise ValueError("The fault dictionary needs exact coverage, which dominance does not give")
+        collapsed_faults = self.collapsed_faults(dominance) if collapse or dominance else None
+        faults = self.faults if collapsed_faults is None else collapsed_faults.representatives
+        # Coverage read from the dictionary is of every fault, so it needs no expanding
+        expand = collapsed_faults is not None and self.dictionary is None
+        remaining_faults = set(faults if expand else self.faults)
+        target_count = len(remaining_faults)
         fault_coverage_all: List[Tuple[TestVector, List[Fault]]] = []
         fault_coverage_list: List[Tuple[TestVector, List[Fault]]] = []
+        good_outputs: List[Tuple[TestVector, List[Value]]] = []
         tv: TestVector
         # remaining_faults: List[Fault]
-        if get_all_coverage:
-            fault_coverage_all = [
-                (test_vector, self.detect_faults(test_vector))
-                for test_vector in test_vectors
-            ]
-        if get_list_coverage:
-            fault_coverage_list = [
-                (test_vector, self.detect_and_eliminate_faults(test_vector, remaining_faults))
-                for test_vector in test_vectors
-            ]
-        return self.Result(remaining_faults, fault_coverage_all, fault_coverage_list)
+        if engine not in self.engines:
+            raise ValueError(f"{type(self).__name__} has no {engine} engine")
+        simulator = self.engines[engine]
+        with self.shard_pool(processes) if processes > 1 else nullcontext() as pool:
+            for test_vectors in self.test_vector_batches(seed, taps, vector_count, batch_size, engine):
+                if log is not None:
+                    log.write(test_vectors)
+                if self.dictionary is not None:
+                    batch_all, batch_list = self.dictionary_coverage(
+                        test_vectors, remaining_faults, faults, collapsed_faults, simulator, pool, engine, processes,
+                        get_all_coverage, get_list_coverage
+                    )
+                elif pool is not None:
+                    batch_all, batch_list = self.run_shards(
+                        pool, test_vectors, faults, remaining_faults, engine, processes, get_all_coverage,
+                        get_list_coverage
+                    )
+                else:
+                    batch_all = simulator.fault_coverage_all(test_vectors, faults) if get_all_coverage else []
+                    batch_list = simulator.fault_coverage_list(test_vectors, remaining_faults) \
+                        if get_list_coverage else []
+                fault_coverage_all.extend(batch_all)
+                if effective_only:
+                    batch_list = [(tv, detected) for tv, detected in batch_list if detected]
+                fault_coverage_list.extend(batch_list)
+                if get_good_outputs:
+                    good_outputs.extend(zip(test_vectors, simulator.output_values(test_vectors)))
+                if get_list_coverage and target_coverage is not None and \
+                        target_count - len(remaining_faults) >= target_coverage * target_count:
+                    break
+        if expand:
+            fault_coverage_all = collapsed_faults.expand_coverage_all(fault_coverage_all)
+            if get_list_coverage:
+                fault_coverage_list, remaining_faults = collapsed_faults.expand_coverage_list(fault_coverage_list)
+            else:
+                remaining_faults = set(self.faults)
+        return self.Result(remaining_faults, fault_coverage_all, fault_coverage_list, good_outputs)
+
+    def dictionary_coverage(self, test_vectors: List[TestVector], remaining_faults: Set[Fault], faults: Set[Fault],
+                            collapsed_faults: Optional[CollapsedFaults], simulator, pool: Optional[ProcessPoolExecutor],
+                            engine: str, processes: int, get_all_coverage: bool, get_list_coverage: bool) \
+            -> Tuple[List[Tuple[TestVector, List[Fault]]], List[Tuple[TestVector, List[Fault]]]]:
+        """Coverage of a batch of run_batch through the fault dictionary, simulating only the vectors new to it"""
+        dictionary = self.dictionary
+        new_vectors = list(dict.fromkeys(tv for tv in test_vectors if tv not in dictionary))
+        if new_vectors:
+            if pool is not None:
+                coverage, _ = self.run_shards(pool, new_vectors, faults, set(), engine, processes, True, False)
+            else:
+                coverage = simulator.fault_coverage_all(new_vectors, faults)
+            if collapsed_faults is not None:
+                coverage = collapsed_faults.expand_coverage_all(coverage)
+            for tv, detected in coverage:
+                dictionary.add(tv, (self.fault_ids[fault] for fault in detected))
+        fault_coverage_all: List[Tuple[TestVector, List[Fault]]] = []
+        fault_coverage_list: List[Tuple[TestVector, List[Fault]]] = []
+        for tv in test_vectors:
+            detected = [self.fault_list[n] for n in dictionary.get(tv)]
+            if get_all_coverage:
+                fault_coverage_all.append((tv, detected))
+            if get_list_coverage:
+                detected = [fault for fault in detected if fault in remaining_faults]
+                remaining_faults.difference_update(detected)
+                fault_coverage_list.append((tv, detected))
+        return fault_coverage_all, fault_coverage_list
+
+    def shard_pool(self, processes: int) -> ProcessPoolExecutor:
+        """A pool of workers that each compile the circuit once, for run_shards"""
+        # The workers parse the bench themselves, so only values that pickle are passed on, and none may be left out
+        forwarded = (str, int, float, bool, list, tuple, set, frozenset, type(None))
+        for key, value in self.kwargs.items():
+            if not isinstance(value, forwarded):
+                raise ValueError(f"{key} of {type(value).__name__} cannot be passed on to the shard workers")
+        kwargs = dict(self.kwargs)
+        return ProcessPoolExecutor(processes, initializer=_init_shard_worker, initargs=(type(self), kwargs))
+
+    def run_shards(self, pool: ProcessPoolExecutor, test_vectors: List[TestVector], faults: Set[Fault],
+                   remaining_faults: Set[Fault], engine: str, processes: int, get_all_coverage: bool,
+                   get_list_coverage: bool) \
+            -> Tuple[List[Tuple[TestVector, List[Fault]]], List[Tuple[TestVector, List[Fault]]]]:
+        """
+        run_batch over a process pool: all coverage of faults, and list coverage of remaining_faults, from which
+        the faults it detects are removed
+        """
+        fault_ids = sorted({self.fault_ids[fault] for fault in faults} | {
+            self.fault_ids[fault] for fault in remaining_faults
+        })
+        remaining_ids = {self.fault_ids[fault] for fault in remaining_faults}
+        all_ids = {self.fault_ids[fault] for fault in faults}
+        # More shards than workers, and strided, so that one slow region of the circuit does not hold up the pool
+        shard_count = min(len(fault_ids), processes * 4) or 1
+        shards = [(
+            [n for n in fault_ids[start::shard_count] if n in all_ids],
+            [n for n in fault_ids[start::shard_count] if n in remaining_ids]
+        ) for start in range(shard_count)]
+        test_vector_names = [repr(test_vector) for test_vector in test_vectors]
+        fault_coverage_all: List[List[Fault]] = [[] for _ in test_vectors]
+        fault_coverage_list: List[List[Fault]] = [[] for _ in test_vectors]
+        run_shard = functools.partial(_run_shard, test_vector_names, engine, get_all_coverage, get_list_coverage)
+        for shard_all, shard_list in pool.map(run_shard, shards):
+            for detected, ids in zip(fault_coverage_all, shard_all):
+                detected.extend(self.fault_list[n] for n in ids)
+            for detected, ids in zip(fault_coverage_list, shard_list):
+                detected.extend(self.fault_list[n] for n in ids)
+        for detected in fault_coverage_list:
+            remaining_faults.difference_update(detected)
+        return (
+            list(zip(test_vectors, fault_coverage_all)) if get_all_coverage else [],
+            list(zip(test_vectors, fault_coverage_list)) if get_list_coverage else []
+        )
 
     # TODO: 1 cycle with fault, 1 cycle without fault, fault is detected if the PO + FF is different
 
@@ -235,17 +591,49 @@ class CircuitSimulator:
             self.detected = detected
 
     class LineParser:
+        """
+        Single pass bench parser. Every line is tokenized by hand into integer records (a gate code, an
+        INPUT/OUTPUT flag and the fan-in as net indices), so memory grows with the netlist rather than with
+        Gate objects. Nets may be used before they are defined; whether every used net was defined is
+        checked once the whole file is read.
+        """
         @dataclass
         class Gates:
-            # gates: OrderedDict[str, Gate]
-            gates: OrderedDict[str, Gate]
-            inputs: Dict[str, List[str]]
-            node_types: Dict[str, str]
+            names: List[str]
+            gate_types: np.ndarray
+            io: np.ndarray
+            fanin_offsets: np.ndarray
+            fanin: np.ndarray
 
-            def __init__(self, gates, inputs, node_types):
-                self.gates = gates
-                self.inputs = inputs
-                self.node_types = node_types
+            def __init__(self, names, gate_types, io, fanin_offsets, fanin, gate_map):
+                self.names = names
+                self.gate_types = gate_types
+                self.io = io
+                self.fanin_offsets = fanin_offsets
+                self.fanin = fanin
+                self.gate_map = gate_map
+
+            @functools.cached_property
+            def gates(self) -> OrderedDict[str, Gate]:
+                """A Gate object for every net, only built for the Node based simulators"""
+                classes = {gate_codes[gate_type]: gate_class for gate_type, gate_class in self.gate_map.items()}
+                return collections.OrderedDict(
+                    (name, classes.get(code, Gate)(name)) for name, code in zip(self.names, self.gate_types.tolist())
+                )
+
+            @functools.cached_property
+            def inputs(self) -> Dict[str, List[str]]:
+                fanin = self.fanin.tolist()
+                offsets = self.fanin_offsets.tolist()
+                return {
+                    name: [self.names[i] for i in fanin[offsets[n]:offsets[n + 1]]]
+                    for n, name in enumerate(self.names) if offsets[n] != offsets[n + 1]
+                }
+
+            @functools.cached_property
+            def node_types(self) -> Dict[str, str]:
+                io_names = ("INTERM.", "INPUT", "OUTPUT")
+                return {name: io_names[io] for name, io in zip(self.names, self.io.tolist()) if io}
 
         @functools.cached_property
         def gate_map(self):
@@ -253,83 +641,206 @@ class CircuitSimulator:
                     "NOR": NorGate, "BUFF": BuffGate, "XOR": XorGate, "NOT": NotGate,
                     "DFF": FlipFlop}
 
+        single_input = {"BUFF", "NOT", "DFF"}
+        # Record kinds of the INPUT and OUTPUT lines; gate lines use their gate code
+        input_line, output_line = -1, -2
+
         def __init__(self, bench):
             self.file = bench
-            self.pattern_gate = "(\S+) = ([A-Z]+)\((.+)\)"
-            self.pattern_io = "([A-Z]+)\((.+)\)"
-            self.gates: OrderedDict[str, Gate] = collections.OrderedDict()
-            self.inputs: Dict[str, List[str]] = {}
-            self.node_types: Dict[str, str] = {}
+            # Nets are numbered in the order their names are first seen, and renumbered once parsed
+            self.names: List[str] = []
+            self.index: Dict[str, int] = {}
+            # One (net, kind, fan-in start, fan-in count) record per line
+            self.records = array.array('q')
+            self.fanin = array.array('q')
 
         def parse_file(self) -> Gates:
             """Parse a circuit bench file"""
+            parse_line = self.parse_line
             with open(self.file) as f:
                 for line in f:
-                    self.parse_line(line)
-            return self.Gates(self.gates, self.inputs, self.node_types)
+                    parse_line(line)
+            return self.gates()
+
+        def net(self, name: str) -> int:
+            n = self.index.setdefault(name, len(self.names))
+            if n == len(self.names):
+                self.names.append(name)
+            return n
 
         def parse_line(self, line: str):
-            """Parse a circuit bench line"""
-            if line.startswith('#') or line == '\n':
-                pass
-            elif groups := match(self.pattern_gate, line):
-                # Line matches the format
-                # name = GATE(input, input)
-                name = groups.group(1)
-                inputs = groups.group(3).split(', ')
-                gate_type = self.gate_map[groups.group(2)]
-                self.gates[name] = gate_type(name)
-                self.inputs[name] = inputs
-            elif groups := match(self.pattern_io, line):
-                # Line matches the format
-                # INPUT/OUTPUT(name)
-                io = groups.group(1)
-                name = groups.group(2)
-                self.gates.setdefault(name, Gate(name))
-                self.node_types[name] = io
-                if not io == "INPUT" and not io == "OUTPUT":
+            """Parse a circuit bench line: name = GATE(input, input), INPUT(name) or OUTPUT(name)"""
+            # Names never hold whitespace, so all of it is dropped before the line is split
+            tokens = ''.join(line.split())
+            if not tokens or tokens[0] == '#':
+                return
+            open_paren = tokens.find('(')
+            if open_paren < 0 or tokens[-1] != ')':
+                raise exceptions.ParseLineError(line)
+            equals = tokens.find('=', 0, open_paren)
+            if equals < 0:
+                io = tokens[:open_paren]
+                name = tokens[open_paren + 1:-1]
+                if not name or (io != "INPUT" and io != "OUTPUT"):
                     raise exceptions.ParseLineError(line)
-            else:
+                self.records.extend((self.net(name), self.input_line if io == "INPUT" else self.output_line, 0, 0))
+                return
+            name = tokens[:equals]
+            gate_type = tokens[equals + 1:open_paren]
+            inputs = tokens[open_paren + 1:-1].split(',')
+            if not name or gate_type not in self.gate_map or not all(inputs):
                 raise exceptions.ParseLineError(line)
+            if len(inputs) != 1 and gate_type in self.single_input:
+                raise exceptions.ParseInputNumberError(line)
+            index = self.index
+            fanin = [index.get(input_name) for input_name in inputs]
+            if None in fanin:
+                fanin = [self.net(input_name) for input_name in inputs]
+            self.records.extend((self.net(name), gate_codes[gate_type], len(self.fanin), len(inputs)))
+            self.fanin.extend(fanin)
 
-    def compile(self, gates: LineParser.Gates):
-        self.nodes = CircuitSimulator.Nodes()
-        for name, gate in gates.gates.items():
-            node = Node(gate)
-            node.type = gates.node_types.get(name, "INTERM.")
-            if node.type == "INTERM.":
-                self.nodes.intermediate_nodes[name] = node
-            elif node.type == "INPUT":
-                self.nodes.input_nodes[name] = node
-            elif node.type == "OUTPUT":
-                self.nodes.output_nodes[name] = node
-            if node.gate.type == "DFF":
-                self.nodes.flip_flops.append(node)
-        for name, input_names in gates.inputs.items():
-            self.nodes[name].input_nodes = [self.nodes[input_name] for input_name in input_names]
-            for input_name in input_names:
-                self.nodes[input_name].output_nodes.append(self.nodes[name])
-        for name, node_type in gates.node_types.items():
-            self.nodes[name].type = node_type
-        pass
+        def reference(self, name: str) -> str:
+            """The first line of the bench using the net as an input, only looked up to report an error"""
+            with open(self.file) as f:
+                for line in f:
+                    tokens = ''.join(line.split())
+                    if '=' in tokens and name in tokens[tokens.find('(') + 1:-1].split(','):
+                        return line
+            return name
 
-    class Nodes:
-        """A structure of nodes allowing for finding a Node by name, or iterating across specific node types"""
+        @staticmethod
+        def last(nets: np.ndarray, rows: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+            """The nets of the rows and the last of the rows for each of them"""
+            rows = rows[::-1]
+            unique, first = np.unique(nets[rows], return_index=True)
+            return unique, rows[first]
 
-        def __init__(self):
-            self.input_nodes: OrderedDict[str, Node] = collections.OrderedDict()
-            self.intermediate_nodes: Dict[str, Node] = {}
-            self.output_nodes: OrderedDict[str, Node] = collections.OrderedDict()
-            self.flip_flops: List[Node] = []
+        def gates(self) -> Gates:
+            """Check that every net used was defined, then renumber the nets in the order they were declared"""
+            records = np.array(self.records, np.int64).reshape(-1, 4)
+            nets, kinds = records[:, 0], records[:, 1]
+            gate_types = np.zeros(len(self.names), np.uint8)
+            io = np.zeros(len(self.names), np.uint8)
+            starts = np.zeros(len(self.names), np.int64)
+            counts = np.zeros(len(self.names), np.int64)
+            defined = np.zeros(len(self.names), bool)
+            # A gate defined twice keeps its last definition, and a net keeps the last of its INPUT/OUTPUT lines
+            gate_nets, rows = self.last(nets, np.flatnonzero(kinds >= 0))
+            gate_types[gate_nets] = kinds[rows]
+            starts[gate_nets] = records[rows, 2]
+            counts[gate_nets] = records[rows, 3]
+            defined[gate_nets] = True
+            io_nets, rows = self.last(nets, np.flatnonzero(kinds < 0))
+            io[io_nets] = np.where(kinds[rows] == self.input_line, INPUT, OUTPUT)
+            defined[nets[kinds == self.input_line]] = True
+            for n in np.flatnonzero(~defined).tolist():
+                if io[n] == OUTPUT:
+                    raise exceptions.ParseNoGateError(self.names[n])
+                raise exceptions.ParseInputNotFoundError(self.reference(self.names[n]), self.names[n])
+            _, first = np.unique(nets, return_index=True)
+            declared = nets[np.sort(first)]
+            renumber = np.empty(len(self.names), np.int64)
+            renumber[declared] = np.arange(len(declared))
+            counts = counts[declared]
+            fanin_offsets = np.zeros(len(declared) + 1, np.int64)
+            np.cumsum(counts, out=fanin_offsets[1:])
+            positions = np.repeat(starts[declared] - fanin_offsets[:-1], counts) + np.arange(int(fanin_offsets[-1]))
+            fanin = renumber[np.array(self.fanin, np.int64)[positions]].astype(np.int32)
+            return self.Gates(
+                [self.names[n] for n in declared.tolist()], gate_types[declared], io[declared], fanin_offsets, fanin,
+                self.gate_map
+            )
+
+    @functools.cached_property
+    def cache_key(self) -> str:
+        return self.cache.key(self.kwargs['bench'])
+
+    def parse(self) -> Tuple[LineParser.Gates, Optional[ArrayNetlist]]:
+        """The gates of the bench, along with its netlist when the cache has it"""
+        parser = self.LineParser(self.kwargs['bench'])
+        if self.cache is None:
+            return parser.parse_file(), None
+        arrays = self.cache.load(self.cache_key, "netlist")
+        names = self.cache.load_names(self.cache_key) if arrays is not None else None
+        if names is None:
+            gates = parser.parse_file()
+            netlist = ArrayNetlist.from_gates(gates)
+            # The names go first, a netlist entry is only ever read along with them
+            self.cache.save_names(self.cache_key, netlist.names)
+            self.cache.save(self.cache_key, "netlist", netlist.arrays)
+            return gates, netlist
+        netlist = ArrayNetlist.from_arrays(names, arrays)
+        return parser.Gates(
+            names, netlist.gate_types, netlist.io, netlist.fanin_offsets, netlist.fanin, parser.gate_map
+        ), netlist
+
+    def compile(self, gates: LineParser.Gates, netlist: Optional[ArrayNetlist] = None):
+        self.netlist = netlist if netlist is not None else ArrayNetlist.from_gates(gates)
+        self.nodes = self.Nodes(self.netlist, gates)
+        self.kernel: Union[GeneratedKernel, VectorizedKernel, None] = \
+            GeneratedKernel(self.netlist) if self.kwargs.get('generate_code') else \
+            VectorizedKernel(self.netlist) if self.kwargs.get('vectorize') else None
+
+    class Nodes:
+        """
+        A view of the netlist as Node objects, allowing for finding a Node by name, or iterating across specific
+        node types. The structure lives in the ArrayNetlist; Node objects are only built once something asks
+        for them, so the array based engines never pay for them.
+        """
+        def __init__(self, netlist: ArrayNetlist, gates: 'CircuitSimulator.LineParser.Gates'):
+            self.netlist = netlist
+            self.gates = gates
             self.faulty_node: Union[InputFault, Node, None] = None
 
+        def make_node(self, gate: Gate) -> Node:
+            return Node(gate)
+
+        @functools.cached_property
+        def node_list(self) -> List[Node]:
+            """Every node, indexed like the nets of the netlist"""
+            netlist = self.netlist
+            node_list = [self.make_node(gate) for gate in self.gates.gates.values()]
+            node_types = ("INTERM.", "INPUT", "OUTPUT")
+            for node, io, level, fanin, fanout in zip(
+                    node_list, netlist.io.tolist(), netlist.levels.tolist(),
+                    netlist.fanin_lists(), netlist.fanout_lists()
+            ):
+                node.type = node_types[io]
+                node.level = level
+                node.input_nodes = [node_list[n] for n in fanin]
+                node.output_nodes = [node_list[n] for n in fanout]
+            return node_list
+
+        @functools.cached_property
+        def input_nodes(self) -> OrderedDict[str, Node]:
+            return collections.OrderedDict(
+                (self.netlist.names[n], self.node_list[n]) for n in self.netlist.inputs.tolist()
+            )
+
+        @functools.cached_property
+        def intermediate_nodes(self) -> Dict[str, Node]:
+            return {
+                self.netlist.names[n]: self.node_list[n]
+                for n in np.flatnonzero(self.netlist.io == INTERMEDIATE).tolist()
+            }
+
+        @functools.cached_property
+        def output_nodes(self) -> OrderedDict[str, Node]:
+            return collections.OrderedDict(
+                (self.netlist.names[n], self.node_list[n]) for n in self.netlist.outputs.tolist()
+            )
+
+        @functools.cached_property
+        def flip_flops(self) -> List[Node]:
+            return [self.node_list[n] for n in self.netlist.flip_flops.tolist()]
+
         def capture(self):
             for flip_flop in self.flip_flops:
                 flip_flop.gate.capture()
 
         @functools.cached_property
         def _nodes(self) -> Dict[str, Node]:
-            return {**self.input_nodes, **self.intermediate_nodes, **self.output_nodes}
+            return dict(zip(self.netlist.names, self.node_list))
 
         @functools.cached_property
         def scan_in_nodes(self) -> List[Union[Node, InputFault]]:
@@ -340,15 +851,18 @@ class CircuitSimulator:
             return [*self.output_nodes.values(), *self.flip_flops]
 
         def __contains(self, item: str):
-            return True if self._nodes.get(item) else False
+            return item in self.netlist.index
 
         def __getitem__(self, item: str):
             return self._nodes[item]
 
         def __iter__(self) -> Node:
-            for node in self._nodes.values():
+            for node in self.node_list:
                 yield node
 
+        def __len__(self):
+            return len(self.netlist)
+
         def __str__(self):
             return str({
                 "input_nodes": self.input_nodes,
@@ -358,19 +872,261 @@ class CircuitSimulator:
             })
 
         def __repr__(self):
-            return ', '.join(repr(node) for node in self._nodes.values())
+            return ', '.join(repr(node) for node in self.node_list)
+
+        @functools.cached_property
+        def levels(self) -> List[List[Node]]:
+            """
+            Nodes by topological level: the inputs and flip flops (and undriven nodes) make up level 0
+            and every other node sits one level above its highest input
+            """
+            return [[self.node_list[n] for n in level] for level in self.netlist.level_lists()]
 
         @functools.cached_property
-        def full_propagation_path(self) -> List[Set[Node]]:
-            result = [frontier := {
-                output_node for node
-                in self.scan_in_nodes
-                for output_node in node.outputs_that_are_not_flip_flops
-            }]
-            while (frontier := {
-                output_node for node
-                in frontier
-                for output_node in node.outputs_that_are_not_flip_flops
-            }):
-                result.append(frontier)
+        def full_propagation_path(self) -> List[List[Node]]:
+            """Every gate that is evaluated when a vector is applied, by level"""
+            return self.levels[1:]
+
+
+class EngineTest(unittest.TestCase):
+    bench = os.path.join(os.path.dirname(os.path.abspath(__file__)), "circuit.bench")
+
+    def setUp(self) -> None:
+        super(EngineTest, self).setUp()
+        self.circuit = CircuitSimulator(bench=self.bench)
+        self.test_vectors = [TestVector(format(n, "04b")) for n in range(16)]
+
+    def test_parallel_good_outputs(self):
+        self.assertEqual(
+            [[str(value) for value in values] for values in self.circuit.good_outputs(self.test_vectors)],
+            [[str(value) for value in values] for values in self.circuit.good_outputs(self.test_vectors, "parallel")],
+            'parallel engine disagrees with serial engine'
+        )
+        self.assertEqual(
+            self.circuit.parallel_simulator.output_values(self.test_vectors),
+            ParallelSimulator(self.circuit.netlist, GeneratedKernel(self.circuit.netlist)).output_values(
+                self.test_vectors
+            ),
+            'generated kernel disagrees with parallel engine'
+        )
+        self.assertEqual(
+            self.circuit.parallel_simulator.output_values(self.test_vectors),
+            ParallelSimulator(self.circuit.netlist, VectorizedKernel(self.circuit.netlist)).output_values(
+                self.test_vectors
+            ),
+            'vectorized kernel disagrees with parallel engine'
+        )
+
+    def test_ppsfp_fault_coverage(self):
+        serial = self.circuit.fault_coverage_all(self.test_vectors, self.circuit.faults)
+        parallel = self.circuit.parallel_simulator.fault_coverage_all(self.test_vectors, self.circuit.faults)
+        for (tv, serial_faults), (_, parallel_faults) in zip(serial, parallel):
+            self.assertEqual(set(serial_faults), set(parallel_faults), f'ppsfp disagrees with serial on {tv}')
+        remaining_faults = self.circuit.faults.copy()
+        first_detected = self.circuit.parallel_simulator.fault_coverage_list(self.test_vectors, remaining_faults)
+        self.assertEqual(
+            set(self.circuit.faults).difference(remaining_faults),
+            {fault for _, faults in first_detected for fault in faults},
+            'detected faults were not removed from the remaining faults'
+        )
+
+    def test_deductive_fault_coverage(self):
+        for test_vector in self.test_vectors:
+            self.assertEqual(set(self.circuit.detect_faults(test_vector)),
+                             set(self.circuit.deductive_simulator.detect_faults(test_vector)),
+                             f'deductive disagrees with serial on {test_vector}')
+
+    def test_concurrent_fault_coverage(self):
+        remaining_faults = self.circuit.faults.copy()
+        concurrent_remaining_faults = self.circuit.faults.copy()
+        for (tv, faults), (_, concurrent_faults) in zip(
+                self.circuit.fault_coverage_list(self.test_vectors, remaining_faults),
+                self.circuit.concurrent_simulator.fault_coverage_list(self.test_vectors, concurrent_remaining_faults)):
+            self.assertEqual(set(faults), set(concurrent_faults), f'concurrent disagrees with serial on {tv}')
+        self.assertEqual(remaining_faults, concurrent_remaining_faults)
+
+    def test_critical_path_fault_coverage(self):
+        serial = self.circuit.fault_coverage_all(self.test_vectors, self.circuit.faults)
+        traced = self.circuit.critical_path_tracer.fault_coverage_all(self.test_vectors, self.circuit.faults)
+        for (tv, serial_faults), (_, traced_faults) in zip(serial, traced):
+            self.assertEqual(set(serial_faults), set(traced_faults), f'critical path disagrees with serial on {tv}')
+
+    def test_incremental_apply_vector(self):
+        incremental = CircuitSimulator(bench=self.bench, incremental=True)
+        test_vectors = [*self.test_vectors, TestVector("1U0U"), TestVector("0110"), *reversed(self.test_vectors)]
+        for test_vector in test_vectors:
+            self.circuit.apply_vector(test_vector)
+            incremental.apply_vector(test_vector)
+            self.assertEqual([node.value for node in self.circuit.nodes], [node.value for node in incremental.nodes],
+                             f'incremental application disagrees on {test_vector}')
+        self.assertGreater(incremental.evaluations_saved, 0)
+        self.assertEqual(self.circuit.evaluations_saved, 0)
+
+    def test_fault_overlay_leaves_good_machine(self):
+        self.circuit.apply_vector(self.test_vectors[5])
+        values = [node.value for node in self.circuit.nodes]
+        input_nodes = [list(node.input_nodes) for node in self.circuit.nodes]
+        for fault in self.circuit.faults:
+            self.circuit.detect_fault(fault)
+        self.assertEqual(values, [node.value for node in self.circuit.nodes])
+        self.assertEqual(input_nodes, [node.input_nodes for node in self.circuit.nodes])
+
+    def test_collapsed_fault_coverage(self):
+        collapsed_faults = self.circuit.collapsed_faults()
+        self.assertLess(len(collapsed_faults.representatives), len(self.circuit.faults))
+        result = self.circuit.run_batch(0x12, {2, 3})
+        collapsed_result = self.circuit.run_batch(0x12, {2, 3}, collapse=True)
+        for (tv, faults), (_, collapsed) in zip(result.fault_coverage_all, collapsed_result.fault_coverage_all):
+            self.assertEqual(set(faults), set(collapsed), f'collapsed coverage disagrees on {tv}')
+        for (tv, faults), (_, collapsed) in zip(result.fault_coverage_list, collapsed_result.fault_coverage_list):
+            self.assertEqual(set(faults), set(collapsed), f'collapsed coverage disagrees on {tv}')
+        self.assertEqual(result.remaining_faults, collapsed_result.remaining_faults)
+
+    def test_sharded_fault_coverage(self):
+        # Several batches, so list coverage has dropped faults that all coverage still reports
+        for kwargs in ({}, dict(engine="ppsfp", vector_count=40, batch_size=8)):
+            result = self.circuit.run_batch(0x12, {2, 3}, **kwargs)
+            sharded_result = self.circuit.run_batch(0x12, {2, 3}, processes=2, **kwargs)
+            self.assertEqual(len(result.fault_coverage_all), len(sharded_result.fault_coverage_all))
+            for (tv, faults), (_, sharded) in zip(result.fault_coverage_all, sharded_result.fault_coverage_all):
+                self.assertEqual(set(faults), set(sharded), f'sharded coverage disagrees on {tv}')
+            for (tv, faults), (_, sharded) in zip(result.fault_coverage_list, sharded_result.fault_coverage_list):
+                self.assertEqual(set(faults), set(sharded), f'sharded coverage disagrees on {tv}')
+            self.assertEqual(result.remaining_faults, sharded_result.remaining_faults)
+
+    def test_sharded_main_arguments(self):
+        # main builds the simulator from every argument it parses, all of which the workers are passed
+        from main import parse_arguments
+        args = parse_arguments(['--no-prompt', '-mp', '--no-cache', '-b', self.bench])
+        circuit = CircuitSimulator(**vars(args))
+        result = circuit.run_batch(args.seed, {2, 3}, vector_count=16)
+        sharded_result = circuit.run_batch(args.seed, {2, 3}, vector_count=16, processes=2)
+        self.assertEqual(
+            [(tv, set(faults)) for tv, faults in result.fault_coverage_list],
+            [(tv, set(faults)) for tv, faults in sharded_result.fault_coverage_list]
+        )
+        self.assertEqual(result.remaining_faults, sharded_result.remaining_faults)
+
+    def test_circuit_cache(self):
+        with tempfile.TemporaryDirectory() as directory:
+            compiled = CircuitSimulator(bench=self.bench, cache=directory)
+            compiled.collapsed_faults()
+            cached = CircuitSimulator(bench=self.bench, cache=directory)
+            self.assertEqual(cached.netlist.names, self.circuit.netlist.names)
+            for name, values in self.circuit.netlist.arrays.items():
+                self.assertTrue(np.array_equal(values, cached.netlist.arrays[name]), f'cached {name} differs')
+            self.assertEqual(
+                {cached.fault_ids[fault] for fault in cached.collapsed_faults().representatives},
+                {self.circuit.fault_ids[fault] for fault in self.circuit.collapsed_faults().representatives},
+                'cached collapsed faults differ'
+            )
+            self.assertEqual(
+                [(str(tv), {str(fault) for fault in faults}) for tv, faults in cached.run_batch(
+                    0x12, {2, 3}, collapse=True
+                ).fault_coverage_list],
+                [(str(tv), {str(fault) for fault in faults}) for tv, faults in self.circuit.run_batch(
+                    0x12, {2, 3}, collapse=True
+                ).fault_coverage_list]
+            )
+
+    def test_streamed_vectors(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "vectors.txt")
+            with VectorLog(path) as log:
+                result = self.circuit.run_batch(0x12, {2, 3}, engine="ppsfp", vector_count=1000, batch_size=4,
+                                                target_coverage=0.5, log=log)
+            with open(path) as f:
+                logged = f.read().split()
+        # The run stops after the first batch reaching the target, with whole batches logged
+        self.assertGreaterEqual(len(self.circuit.faults) - len(result.remaining_faults), len(self.circuit.faults) / 2)
+        self.assertLess(len(result.fault_coverage_list), 1000)
+        self.assertEqual(len(logged) % 4, 0)
+        self.assertEqual(logged[:len(result.fault_coverage_list)], [str(tv) for tv, _ in result.fault_coverage_list])
+
+    def test_fault_dictionary(self):
+        with tempfile.TemporaryDirectory() as directory:
+            circuit = CircuitSimulator(bench=self.bench, cache=directory)
+            with circuit.open_dictionary():
+                first = circuit.run_batch(0x12, {2, 3}, collapse=True)
+            circuit = CircuitSimulator(bench=self.bench, cache=directory)
+            dictionary = circuit.open_dictionary()
+            self.assertEqual(len(dictionary), len({tv for tv, _ in first.fault_coverage_all}))
+            # Every vector is known, so nothing is simulated
+            circuit.detect_fault = None
+            second = circuit.run_batch(0x12, {2, 3})
+        expected = self.circuit.run_batch(0x12, {2, 3})
+        # The circuits differ, so faults are compared by name
+        for result in (first, second):
+            for (tv, faults), (_, known) in zip(expected.fault_coverage_all, result.fault_coverage_all):
+                self.assertEqual(sorted(map(str, faults)), sorted(map(str, known)), f'dictionary disagrees on {tv}')
+            for (tv, faults), (_, known) in zip(expected.fault_coverage_list, result.fault_coverage_list):
+                self.assertEqual(sorted(map(str, faults)), sorted(map(str, known)), f'dictionary disagrees on {tv}')
+            self.assertEqual(sorted(map(str, expected.remaining_faults)), sorted(map(str, result.remaining_faults)))
+
+    def test_fault_dictionary_unknown(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "dictionary")
+            with FaultDictionary(path, 8, 4) as dictionary:
+                dictionary.add(TestVector("1U0U"), [1, 2])
+                dictionary.add(TestVector("1000"), [3])
+            dictionary = FaultDictionary(path, 8, 4)
+            self.assertEqual(dictionary.get(TestVector("1U0U")), [1, 2])
+            self.assertEqual(dictionary.get(TestVector("1000")), [3])
+            self.assertEqual(dictionary.first_detecting(1), TestVector("1U0U"))
+            # Saving again merges the new vectors into the sorted keys of the saved ones
+            with dictionary:
+                dictionary.add(TestVector("0000"), [4])
+                dictionary.add(TestVector("1000"), [5])
+            dictionary = FaultDictionary(path, 8, 4)
+            self.assertEqual(len(dictionary), 3)
+            self.assertEqual(dictionary.get(TestVector("0000")), [4])
+            self.assertEqual(dictionary.get(TestVector("1000")), [3])
+            self.assertIsNone(dictionary.get(TestVector("1U00")))
+            self.assertNotIn(TestVector("1111"), dictionary)
+
+    def test_diagnose(self):
+        def failures(fault: Fault) -> Set[Tuple[int, int]]:
+            result = set()
+            for n, test_vector in enumerate(self.test_vectors):
+                self.circuit.apply_vector(test_vector)
+                with self.circuit.apply_fault(fault) as overlay:
+                    result.update(
+                        (n, output) for output, node in enumerate(self.circuit.nodes.output_nodes.values())
+                        if overlay.value(node).propagates_fault
+                    )
             return result
+
+        for fault in self.circuit.fault_list:
+            observed = failures(fault)
+            candidates = self.circuit.diagnose(self.test_vectors, observed, len(self.circuit.fault_list))
+            if not observed:
+                self.assertEqual(candidates, [])
+                continue
+            exact = [candidate for candidate, score in candidates if score == 1.0]
+            self.assertIn(fault, exact)
+            self.assertEqual(exact, [candidate for candidate, _ in candidates[:len(exact)]])
+            for candidate in exact:
+                self.assertEqual(failures(candidate), observed, f'{candidate} does not explain {fault}')
+
+
+class LineParserTest(unittest.TestCase):
+    def parse(self, text: str) -> CircuitSimulator.LineParser.Gates:
+        with tempfile.TemporaryDirectory() as directory:
+            bench = os.path.join(directory, "test.bench")
+            with open(bench, 'w') as f:
+                f.write(text)
+            return CircuitSimulator.LineParser(bench).parse_file()
+
+    def test_parse(self):
+        gates = self.parse("# c\nINPUT( a )\nINPUT(b)\n\tOUTPUT(y)\ny=AND(a,b ,x)\nx  =  NOT( a )\n")
+        self.assertEqual(gates.names, ['a', 'b', 'y', 'x'])
+        self.assertEqual(gates.inputs, {'y': ['a', 'b', 'x'], 'x': ['a']})
+        self.assertEqual(gates.node_types, {'a': "INPUT", 'b': "INPUT", 'y': "OUTPUT"})
+        with self.assertRaises(exceptions.ParseInputNotFoundError):
+            self.parse("INPUT(a)\nOUTPUT(y)\ny = AND(a, z)\n")
+        with self.assertRaises(exceptions.ParseNoGateError):
+            self.parse("INPUT(a)\nOUTPUT(y)\nOUTPUT(z)\ny = NOT(a)\n")
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,73 @@
+from typing import List, Dict, Tuple, Callable
+from array_netlist import ArrayNetlist, gate_names
+
+
+class GeneratedKernel:
+    """
+    Good machine simulation as generated Python. Every net gets two locals holding its ones and zeros
+    rails (see parallel.py) and every gate becomes a line of bitwise expressions, written in level order,
+    so one call of the function evaluates the circuit for every vector packed into the rails.
+
+    The function takes the rails of the primary inputs and returns the rails of every net, indexed like
+    the nets of the ArrayNetlist, plus the trailing pin slot used by ParallelSimulator.
+    """
+
+    def __init__(self, netlist: ArrayNetlist):
+        self.source = self.generate(netlist)
+        namespace: Dict[str, Callable] = {}
+        exec(compile(self.source, f"<generated {len(self.source.splitlines())} lines>", 'exec'), namespace)
+        self.function: Callable[[List[int], List[int]], Tuple[List[int], List[int]]] = namespace['simulate']
+
+    def __call__(self, ones: List[int], zeros: List[int]) -> Tuple[List[int], List[int]]:
+        return self.function(ones, zeros)
+
+    @staticmethod
+    def generate(netlist: ArrayNetlist) -> str:
+        assigned = set()
+        lines = ["def simulate(ones, zeros):"]
+        inputs = netlist.inputs.tolist()
+        if inputs:
+            lines.append("    %s, = ones" % ', '.join(f"v{n}_1" for n in inputs))
+            lines.append("    %s, = zeros" % ', '.join(f"v{n}_0" for n in inputs))
+            assigned.update(inputs)
+        # Flip flops and undriven nets are never evaluated here, they stay U
+        for n in netlist.sources.tolist():
+            if n not in assigned:
+                lines.append(f"    v{n}_1 = v{n}_0 = 0")
+        for n in netlist.order.tolist():
+            lines.extend(f"    {line}" for line in GeneratedKernel.gate_lines(
+                n, gate_names[int(netlist.gate_types[n])], netlist.fanin_of(n).tolist()
+            ))
+            assigned.add(n)
+        lines.append("    return [%s, 0], [%s, 0]" % (
+            ', '.join(f"v{n}_1" if n in assigned else '0' for n in range(len(netlist))),
+            ', '.join(f"v{n}_0" if n in assigned else '0' for n in range(len(netlist)))
+        ))
+        return '\n'.join(lines) + '\n'
+
+    @staticmethod
+    def gate_lines(n: int, gate_type: str, fanin: List[int]) -> List[str]:
+        ones = [f"v{i}_1" for i in fanin]
+        zeros = [f"v{i}_0" for i in fanin]
+        one, zero = f"v{n}_1", f"v{n}_0"
+        inverting = gate_type in ("NAND", "NOR", "XNOR", "NOT")
+        if gate_type in ("XOR", "XNOR"):
+            lines = [f"{one}, {zero} = {ones[0]}, {zeros[0]}"]
+            lines.extend(
+                f"{one}, {zero} = ({one} & {z}) | ({zero} & {o}), ({one} & {o}) | ({zero} & {z})"
+                for o, z in zip(ones[1:], zeros[1:])
+            )
+            if inverting:
+                lines.append(f"{one}, {zero} = {zero}, {one}")
+            return lines
+        if gate_type in ("AND", "NAND"):
+            one_expression, zero_expression = ' & '.join(ones), ' | '.join(zeros)
+        elif gate_type in ("OR", "NOR"):
+            one_expression, zero_expression = ' | '.join(ones), ' & '.join(zeros)
+        elif gate_type in ("BUFF", "NOT"):
+            one_expression, zero_expression = ones[0], zeros[0]
+        else:
+            one_expression, zero_expression = '0', '0'
+        if inverting:
+            one_expression, zero_expression = zero_expression, one_expression
+        return [f"{one}, {zero} = {one_expression}, {zero_expression}"]
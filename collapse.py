@@ -0,0 +1,147 @@
+from typing import Dict, List, Set, Iterable, Tuple, Optional, Sequence
+import numpy as np
+from nodes import Node, value_1
+from faults import Fault
+from testvector import TestVector
+
+# (input stuck-at, output stuck-at) pairs for which a fault on an input pin of the gate is equivalent to a
+# fault on its output
+equivalent_values: Dict[str, List[Tuple[int, int]]] = {
+    "AND": [(0, 0)], "NAND": [(0, 1)], "OR": [(1, 1)], "NOR": [(1, 0)],
+    "BUFF": [(0, 0), (1, 1)], "NOT": [(0, 1), (1, 0)]
+}
+# (input stuck-at, output stuck-at) for which the output fault dominates every input fault: any vector
+# detecting one of the input faults detects the output fault too
+dominant_values: Dict[str, Tuple[int, int]] = {"AND": (1, 1), "NAND": (1, 0), "OR": (0, 0), "NOR": (0, 1)}
+
+FaultKey = Tuple[Node, Optional[Node], int]
+
+
+class CollapsedFaults:
+    """
+    The fault universe collapsed into classes of equivalent faults: input pin faults that are equivalent to
+    a fault on the gate output, and the only branch of a stem that is not a primary output, which is
+    equivalent to the stem. Flip flops are left out, as scan observes them directly.
+
+    With dominance, the class of an output fault that dominates the input faults of its gate is dropped as
+    well. It is credited whenever one of the input faults is detected, which may miss vectors that
+    detect only the output fault, so coverage is a lower bound.
+    """
+
+    def __init__(self, nodes: Iterable[Node], faults: Iterable[Fault], dominance: bool = False):
+        nodes = list(nodes)
+        self.universe: Set[Fault] = set(faults)
+        self.lookup: Dict[FaultKey, Fault] = {
+            (fault.node, fault.input_node, 1 if fault.stuck_at is value_1 else 0): fault for fault in self.universe
+        }
+        self.parent: Dict[Fault, Fault] = {fault: fault for fault in self.universe}
+        for node in nodes:
+            if node.gate.type == "DFF":
+                continue
+            for input_node in node.input_nodes:
+                for input_value, output_value in equivalent_values.get(node.gate.type, []):
+                    self.union((node, input_node, input_value), (node, None, output_value))
+            if len(node.output_nodes) == 1 and node.type != "OUTPUT" and node.output_nodes[0].gate.type != "DFF":
+                for value in (0, 1):
+                    self.union((node, None, value), (node.output_nodes[0], node, value))
+        # Every fault of a class, keyed by the representative of the class
+        self.classes: Dict[Fault, List[Fault]] = {}
+        for fault in self.universe:
+            self.classes.setdefault(self.find(fault), []).append(fault)
+        # Dropped representatives, keyed by the representatives whose detection credits them
+        self.dominators: Dict[Fault, List[Fault]] = {}
+        if dominance:
+            self.drop_dominators(nodes)
+        dropped = {fault for dominators in self.dominators.values() for fault in dominators}
+        self.representatives: Set[Fault] = set(self.classes).difference(dropped)
+
+    def to_arrays(self, fault_list: Sequence[Fault]) -> Dict[str, np.ndarray]:
+        """The classes and dominators as indices into fault_list: the representative of every fault, and
+        (representative, dropped representative) pairs"""
+        fault_ids = {fault: n for n, fault in enumerate(fault_list)}
+        return {
+            "roots": np.array([fault_ids[self.find(fault)] for fault in fault_list], np.int64),
+            "dominators": np.array([
+                (fault_ids[fault], fault_ids[dominator])
+                for fault, dominators in self.dominators.items() for dominator in dominators
+            ], np.int64).reshape(-1, 2)
+        }
+
+    @classmethod
+    def from_arrays(cls, fault_list: Sequence[Fault], arrays: Dict[str, np.ndarray]) -> 'CollapsedFaults':
+        collapsed = cls.__new__(cls)
+        collapsed.universe = set(fault_list)
+        collapsed.lookup = {}
+        roots = [fault_list[n] for n in arrays["roots"].tolist()]
+        collapsed.parent = dict(zip(fault_list, roots))
+        collapsed.classes = {}
+        for fault, root in zip(fault_list, roots):
+            collapsed.classes.setdefault(root, []).append(fault)
+        collapsed.dominators = {}
+        for fault, dominator in arrays["dominators"].tolist():
+            collapsed.dominators.setdefault(fault_list[fault], []).append(fault_list[dominator])
+        dropped = {fault for dominators in collapsed.dominators.values() for fault in dominators}
+        collapsed.representatives = set(collapsed.classes).difference(dropped)
+        return collapsed
+
+    def find(self, fault: Fault) -> Fault:
+        while self.parent[fault] is not fault:
+            self.parent[fault] = self.parent[self.parent[fault]]
+            fault = self.parent[fault]
+        return fault
+
+    def union(self, first: FaultKey, second: FaultKey):
+        if first in self.lookup and second in self.lookup:
+            first_root, second_root = self.find(self.lookup[first]), self.find(self.lookup[second])
+            if first_root is not second_root:
+                self.parent[second_root] = first_root
+
+    def drop_dominators(self, nodes: List[Node]):
+        dropped: Set[Fault] = set()
+        # Classes that have to be simulated because they credit a dropped class
+        needed: Set[Fault] = set()
+        for node in nodes:
+            if node.gate.type not in dominant_values or len(node.input_nodes) < 2:
+                continue
+            input_value, output_value = dominant_values[node.gate.type]
+            if (node, None, output_value) not in self.lookup:
+                continue
+            dominator = self.find(self.lookup[node, None, output_value])
+            dominated = {
+                self.find(self.lookup[key]) for key in (
+                    (node, input_node, input_value) for input_node in node.input_nodes
+                ) if key in self.lookup
+            }
+            if not dominated or dominator in dominated or dominator in needed or dominator in dropped or \
+                    dominated.intersection(dropped):
+                continue
+            dropped.add(dominator)
+            needed.update(dominated)
+            for fault in dominated:
+                self.dominators.setdefault(fault, []).append(dominator)
+
+    def expand(self, representatives: Iterable[Fault]) -> List[Fault]:
+        """Every fault of the universe detected along with the given detected representatives"""
+        result: List[Fault] = []
+        seen: Set[Fault] = set()
+        for representative in representatives:
+            for root in (representative, *self.dominators.get(representative, ())):
+                if root not in seen:
+                    seen.add(root)
+                    result.extend(self.classes[root])
+        return result
+
+    def expand_coverage_all(self, coverage: List[Tuple[TestVector, List[Fault]]]) \
+            -> List[Tuple[TestVector, List[Fault]]]:
+        return [(test_vector, self.expand(faults)) for test_vector, faults in coverage]
+
+    def expand_coverage_list(self, coverage: List[Tuple[TestVector, List[Fault]]]) \
+            -> Tuple[List[Tuple[TestVector, List[Fault]]], Set[Fault]]:
+        """The coverage of the universe, and the faults of the universe that remain undetected"""
+        remaining_faults = set(self.universe)
+        result = []
+        for test_vector, faults in coverage:
+            detected = [fault for fault in self.expand(faults) if fault in remaining_faults]
+            remaining_faults.difference_update(detected)
+            result.append((test_vector, detected))
+        return result, remaining_faults
@@ -0,0 +1,174 @@
+from typing import List, Tuple, Iterable, Sequence, Set, Callable, Optional
+import heapq
+from nodes import value_0, value_1
+from faults import Fault
+from testvector import TestVector
+from parallel import ParallelSimulator
+from deductive import DeductiveSimulator
+
+# Gate functions over sets of lanes: each input is the set of lanes in which it is 1, and mask is every lane.
+# Lanes are vectors for the good machine (a single lane) and faults for the bad gate copies.
+
+
+def _and(inputs: List[int], mask: int) -> int:
+    result = mask
+    for bits in inputs:
+        result &= bits
+    return result
+
+
+def _nand(inputs: List[int], mask: int) -> int:
+    return mask & ~_and(inputs, mask)
+
+
+def _or(inputs: List[int], mask: int) -> int:
+    result = 0
+    for bits in inputs:
+        result |= bits
+    return result
+
+
+def _nor(inputs: List[int], mask: int) -> int:
+    return mask & ~_or(inputs, mask)
+
+
+def _xor(inputs: List[int], mask: int) -> int:
+    result = 0
+    for bits in inputs:
+        result ^= bits
+    return result
+
+
+def _xnor(inputs: List[int], mask: int) -> int:
+    return mask & ~_xor(inputs, mask)
+
+
+def _buff(inputs: List[int], mask: int) -> int:
+    return inputs[0]
+
+
+def _not(inputs: List[int], mask: int) -> int:
+    return mask & ~inputs[0]
+
+
+binary_functions = {
+    "AND": _and, "NAND": _nand, "OR": _or, "NOR": _nor, "XOR": _xor, "XNOR": _xnor, "BUFF": _buff, "NOT": _not
+}
+
+
+class ConcurrentSimulator(DeductiveSimulator):
+    """
+    Concurrent fault simulation. Every net keeps the faults under which its value diverges from the good
+    machine (the bad gate records, stored as a bitset like the deductive fault lists), and the records
+    persist from one vector to the next. Applying a vector only schedules the gates driven by inputs
+    that changed; a gate re-evaluates its good copy and a bad copy for every fault diverging at its inputs
+    or local to it, and only passes events on when its value or records changed. The bad copies of a gate
+    are evaluated together, one fault per bit.
+
+    Records are two-valued, so a circuit with flip flops or undriven nets, which leave nets at U, is handed
+    to the parallel simulator instead.
+    """
+
+    def __init__(self, parallel_simulator: ParallelSimulator, faults: Iterable[Fault]):
+        super(ConcurrentSimulator, self).__init__(parallel_simulator, faults)
+        self.fanout_positions: List[Tuple[int, ...]] = [
+            tuple(sorted({
+                self.parallel.position[output_net] for output_net in fanout
+                if output_net in self.parallel.position
+            }))
+            for fanout in self.parallel.fanout
+        ]
+        self.gates: List[Tuple[int, Callable, Tuple[int, ...], Tuple[Tuple[int, int], ...], List[int], int]] = [
+            (n, binary_functions.get(gate_type), fanin, pin_bits, self.stem_bits[n],
+             self.stem_bits[n][0] | self.stem_bits[n][1] | sum(bits[0] | bits[1] for bits in pin_bits))
+            for n, gate_type, fanin, pin_bits in self.schedule
+        ]
+        self.unknown_sources = bool(self.parallel.flip_flop_indices) or \
+            any(function is None for _, function, _, _, _, _ in self.gates)
+        self.values: Optional[List[int]] = None
+        self.lists: List[int] = []
+        # Faults for which self.lists are complete
+        self.state_alive = 0
+        self.evaluations = 0
+
+    def reset(self):
+        self.values = None
+
+    def apply_vector(self, test_vector: TestVector, alive: int = -1) -> int:
+        """Apply the vector as an event on the previous state; returns the bits of the alive faults detected"""
+        queue: List[int] = []
+        queued: Set[int] = set()
+        if self.values is None or alive & ~self.state_alive:
+            self.values = [-1] * (self.parallel.pin_slot + 1)
+            self.lists = [0] * (self.parallel.pin_slot + 1)
+            self.state_alive = alive
+            queue = list(range(len(self.gates)))
+            queued = set(queue)
+        # Gates that fire drop the records of faults that are not alive
+        self.state_alive &= alive
+        values = self.values
+        lists = self.lists
+        for n, value in zip(self.parallel.input_indices, test_vector):
+            value = 1 if value is value_1 else 0
+            if value != values[n]:
+                values[n] = value
+                lists[n] = self.stem_bits[n][1 - value]
+                for position in self.fanout_positions[n]:
+                    if position not in queued:
+                        queued.add(position)
+                        heapq.heappush(queue, position)
+        while queue:
+            position = heapq.heappop(queue)
+            n, function, fanin, pin_bits, stem_bits, local_bits = self.gates[position]
+            inputs = [values[source] for source in fanin]
+            good = function(inputs, 1)
+            candidates = local_bits
+            for source in fanin:
+                candidates |= lists[source]
+            candidates &= alive
+            fault_list = 0
+            if candidates:
+                # For each bad copy, the faults under which the input is 1
+                bad = [
+                    candidates & ~lists[source] if value else candidates & lists[source]
+                    for source, value in zip(fanin, inputs)
+                ]
+                for pin, (stuck_at_0, stuck_at_1) in enumerate(pin_bits):
+                    if stuck_at_0 | stuck_at_1:
+                        bad[pin] = (bad[pin] & ~stuck_at_0) | (candidates & stuck_at_1)
+                bad_value = (function(bad, candidates) & ~stem_bits[0]) | (candidates & stem_bits[1])
+                fault_list = candidates & ~bad_value if good else bad_value
+            self.evaluations += 1
+            if good != values[n] or fault_list != lists[n]:
+                values[n] = good
+                lists[n] = fault_list
+                for next_position in self.fanout_positions[n]:
+                    if next_position not in queued:
+                        queued.add(next_position)
+                        heapq.heappush(queue, next_position)
+        detected = 0
+        for n in self.parallel.output_indices:
+            detected |= lists[n]
+        return detected & alive
+
+    def _known(self, test_vector: TestVector) -> bool:
+        return not self.unknown_sources and all(value is value_0 or value is value_1 for value in test_vector)
+
+    def detected_bits(self, test_vectors: Sequence[TestVector], alive: int = -1) -> List[int]:
+        return [
+            self.apply_vector(test_vector, alive) if self._known(test_vector) else
+            self._detected_bits_unknown(test_vector, alive)
+            for test_vector in test_vectors
+        ]
+
+    def fault_coverage_list(self, test_vectors: Sequence[TestVector],
+                            remaining_faults: Set[Fault]) -> List[Tuple[TestVector, List[Fault]]]:
+        """Faults are dropped as soon as they are detected; their records fade as the gates holding them fire"""
+        alive = self.bits(remaining_faults)
+        result = []
+        for test_vector in test_vectors:
+            bits = self.detected_bits([test_vector], alive)[0]
+            alive &= ~bits
+            result.append((test_vector, self.faults(bits)))
+        remaining_faults.intersection_update(self.faults(alive))
+        return result
@@ -0,0 +1,128 @@
+from typing import List, Tuple, Iterable, Sequence, Optional
+from functools import reduce
+import operator
+from nodes import value_1
+from faults import Fault
+from testvector import TestVector
+from parallel import ParallelSimulator
+from deductive import DeductiveSimulator
+
+
+def sensitive_pins(controlling: List[int], lanes: int) -> List[int]:
+    """Lanes in which flipping each pin flips the gate: it is the only controlling pin, or none is"""
+    suffix = [0] * (len(controlling) + 1)
+    for pin in reversed(range(len(controlling))):
+        suffix[pin] = suffix[pin + 1] | controlling[pin]
+    uncontrolled = lanes & ~suffix[0]
+    result = []
+    prefix = 0
+    for pin, bits in enumerate(controlling):
+        result.append((bits & ~(prefix | suffix[pin + 1])) | uncontrolled)
+        prefix |= bits
+    return result
+
+
+class CriticalPathTracer(DeductiveSimulator):
+    """
+    Critical path tracing. A net is critical for a vector if flipping it flips a primary output, and a
+    fault is detected exactly when its net (or pin) is critical and the good value opposes the stuck-at.
+    Criticality is traced backward from the primary outputs through the sensitive pins of every gate,
+    so fanout-free regions cost one backward pass. A stem reaches the outputs along several paths, so
+    its criticality comes from flipping it and evaluating its cone forward instead.
+
+    Every vector of a batch is traced at once, one lane per vector as in the parallel simulator; vectors
+    that leave a net at U are handed to the parallel simulator instead.
+    """
+
+    def __init__(self, parallel_simulator: ParallelSimulator, faults: Iterable[Fault]):
+        super(CriticalPathTracer, self).__init__(parallel_simulator, faults)
+        parallel = self.parallel
+        # Pins reading each net, as (schedule position, pin)
+        self.fanout_pins: List[List[Tuple[int, int]]] = [[] for _ in range(parallel.pin_slot)]
+        for position, (_, _, fanin) in enumerate(parallel.schedule):
+            for pin, source in enumerate(fanin):
+                self.fanout_pins[source].append((position, pin))
+        self.outputs = set(parallel.output_indices)
+        scheduled = {n for n, _, _ in parallel.schedule}
+        self.reverse_order: List[int] = [
+            *(n for n, _, _ in reversed(parallel.schedule)),
+            *(n for n in range(parallel.pin_slot) if n not in scheduled)
+        ]
+        # (net, stuck-at, bit) for stem faults and (position, pin, source, stuck-at, bit) for pin faults
+        self.stem_faults: List[Tuple[int, int, int]] = []
+        self.pin_faults: List[Tuple[int, int, int, int, int]] = []
+        for fault, k in self.fault_ids.items():
+            value = 1 if fault.stuck_at is value_1 else 0
+            n = parallel.index[fault.node.name]
+            if fault.input_node is None:
+                self.stem_faults.append((n, value, 1 << k))
+            elif n in parallel.position:
+                source = parallel.index[fault.input_node.name]
+                _, _, fanin = parallel.schedule[parallel.position[n]]
+                self.pin_faults.append((parallel.position[n], fanin.index(source), source, value, 1 << k))
+
+    def critical_lanes(self, ones: List[int], zeros: List[int], lanes: int) \
+            -> Tuple[List[int], List[Optional[List[int]]]]:
+        """The lanes in which every net, and every pin of the schedule, is critical; rails must be two-valued"""
+        parallel = self.parallel
+        schedule = parallel.schedule
+        critical = [0] * parallel.pin_slot
+        pin_critical: List[Optional[List[int]]] = [None] * len(schedule)
+        bad_ones, bad_zeros = ones[:], zeros[:]
+        for n in self.reverse_order:
+            fanout_pins = self.fanout_pins[n]
+            if n in self.outputs:
+                critical[n] = lanes
+            elif len(fanout_pins) == 1:
+                position, pin = fanout_pins[0]
+                critical[n] = pin_critical[position][pin]
+            elif fanout_pins:
+                critical[n] = parallel.observable(n, ones, zeros, bad_ones, bad_zeros) & lanes
+            position = parallel.position.get(n)
+            if position is None:
+                continue
+            _, function, fanin = schedule[position]
+            if not critical[n]:
+                pin_critical[position] = [0] * len(fanin)
+                continue
+            gate_type = self.schedule[position][1]
+            if gate_type in ("AND", "NAND"):
+                sensitive = sensitive_pins([zeros[source] for source in fanin], lanes)
+            elif gate_type in ("OR", "NOR"):
+                sensitive = sensitive_pins([ones[source] for source in fanin], lanes)
+            else:
+                sensitive = [lanes] * len(fanin)
+            pin_critical[position] = [critical[n] & bits for bits in sensitive]
+        return critical, pin_critical
+
+    def detected_bits(self, test_vectors: Sequence[TestVector], alive: int = -1) -> List[int]:
+        result: List[int] = []
+        for start in range(0, len(test_vectors), self.parallel.word_size):
+            batch = test_vectors[start:start + self.parallel.word_size]
+            ones, zeros = self.parallel.simulate(batch)
+            lanes = (1 << len(batch)) - 1
+            unknown = reduce(operator.or_, (
+                ~(ones[n] | zeros[n]) & lanes for n in range(self.parallel.pin_slot)
+            ), 0)
+            known = lanes & ~unknown
+            detected = [0] * len(batch)
+            if known:
+                critical, pin_critical = self.critical_lanes(ones, zeros, known)
+                masks: List[Tuple[int, int]] = [
+                    (bit, critical[n] & (zeros[n] if value else ones[n]))
+                    for n, value, bit in self.stem_faults if alive & bit
+                ]
+                masks.extend(
+                    (bit, pin_critical[position][pin] & (zeros[source] if value else ones[source]))
+                    for position, pin, source, value, bit in self.pin_faults if alive & bit
+                )
+                for bit, mask in masks:
+                    while mask:
+                        lane = mask & -mask
+                        detected[lane.bit_length() - 1] |= bit
+                        mask ^= lane
+            for lane, test_vector in enumerate(batch):
+                if unknown >> lane & 1:
+                    detected[lane] = self._detected_bits_unknown(test_vector, alive)
+            result.extend(detected)
+        return result
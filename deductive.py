@@ -0,0 +1,127 @@
+from typing import List, Dict, Tuple, Iterable, Sequence, Set
+from functools import reduce
+import operator
+from nodes import value_1
+from faults import Fault, FaultBitsets
+from testvector import TestVector
+from parallel import ParallelSimulator
+from array_netlist import gate_names
+
+# Value on an input that decides the output of the gate by itself
+controlling_values = {"AND": 0, "NAND": 0, "OR": 1, "NOR": 1}
+
+
+class DeductiveSimulator(FaultBitsets):
+    """
+    Deductive fault simulation. Alongside the good value of every net, a fault list is propagated: the set
+    of faults that would flip that net. Fault lists are held as bitsets in ints, bit k standing for
+    self.fault_list[k], so one pass over the schedule yields every fault detected by a vector.
+
+    Deduction only holds for two-valued nets; vectors that leave a net at U are handed to the
+    parallel simulator instead.
+    """
+
+    def __init__(self, parallel_simulator: ParallelSimulator, faults: Iterable[Fault]):
+        self.parallel = parallel_simulator
+        self.fault_list: List[Fault] = list(faults)
+        self.fault_ids: Dict[Fault, int] = {fault: n for n, fault in enumerate(self.fault_list)}
+        # stem_bits[net][v] holds the faults forcing the net to v
+        self.stem_bits: List[List[int]] = [[0, 0] for _ in range(self.parallel.pin_slot)]
+        pin_faults: Dict[Tuple[int, int], List[int]] = {}
+        for fault, n in self.fault_ids.items():
+            value = 1 if fault.stuck_at is value_1 else 0
+            node = self.parallel.index[fault.node.name]
+            if fault.input_node is None:
+                self.stem_bits[node][value] |= 1 << n
+            else:
+                pin_faults.setdefault((node, self.parallel.index[fault.input_node.name]), [0, 0])[value] |= 1 << n
+        gate_types = self.parallel.netlist.gate_types.tolist()
+        self.schedule: List[Tuple[int, str, Tuple[int, ...], Tuple[Tuple[int, int], ...]]] = [
+            (n, gate_names[gate_types[n]], fanin, tuple(
+                tuple(pin_faults.get((n, source), (0, 0))) if fanin.index(source) == pin else (0, 0)
+                for pin, source in enumerate(fanin)
+            ))
+            for n, _, fanin in self.parallel.schedule
+        ]
+
+    def fault_lists(self, values: List[int], alive: int = -1) -> List[int]:
+        """Fault list of every net given the two-valued good machine; only faults in alive are kept"""
+        stem_bits = self.stem_bits
+        lists = [0] * len(values)
+        for n in self.parallel.input_indices:
+            lists[n] = stem_bits[n][1 - values[n]] & alive
+        for n, gate_type, fanin, pin_bits in self.schedule:
+            # A pin sees the faults of its driver, plus its own fault opposing the driver's value
+            pins = [lists[source] | (bits[1 - values[source]] & alive) for source, bits in zip(fanin, pin_bits)]
+            controlling_value = controlling_values.get(gate_type)
+            if controlling_value is not None:
+                controlling = [pin for source, pin in zip(fanin, pins) if values[source] == controlling_value]
+                if controlling:
+                    # The output flips only if every controlling input flips and no other input does
+                    fault_list = reduce(operator.and_, controlling)
+                    fault_list &= ~reduce(operator.or_, (
+                        pin for source, pin in zip(fanin, pins) if values[source] != controlling_value
+                    ), 0)
+                else:
+                    fault_list = reduce(operator.or_, pins)
+            elif gate_type == "XOR" or gate_type == "XNOR":
+                fault_list = reduce(operator.xor, pins)
+            elif pins:
+                fault_list = pins[0]
+            else:
+                fault_list = 0
+            lists[n] = fault_list | (stem_bits[n][1 - values[n]] & alive)
+        return lists
+
+    def detected_bits(self, test_vectors: Sequence[TestVector], alive: int = -1) -> List[int]:
+        """Bitset of the faults detected by each test vector"""
+        result: List[int] = []
+        for start in range(0, len(test_vectors), self.parallel.word_size):
+            batch = test_vectors[start:start + self.parallel.word_size]
+            ones, zeros = self.parallel.simulate(batch)
+            lanes = (1 << len(batch)) - 1
+            unknown = reduce(operator.or_, (
+                ~(ones[n] | zeros[n]) & lanes for n in range(self.parallel.pin_slot)
+            ), 0)
+            for lane, test_vector in enumerate(batch):
+                if unknown >> lane & 1:
+                    result.append(self._detected_bits_unknown(test_vector, alive))
+                    continue
+                values = [one >> lane & 1 for one in ones]
+                lists = self.fault_lists(values, alive)
+                result.append(reduce(operator.or_, (lists[n] for n in self.parallel.output_indices), 0) & alive)
+        return result
+
+    def _detected_bits_unknown(self, test_vector: TestVector, alive: int) -> int:
+        faults = [fault for fault, n in self.fault_ids.items() if alive >> n & 1]
+        return self.bits(self.parallel.detection_masks([test_vector], faults))
+
+    def output_values(self, test_vectors: Sequence[TestVector]):
+        return self.parallel.output_values(test_vectors)
+
+    def detect_faults(self, tv: TestVector) -> List[Fault]:
+        return self.faults(self.detected_bits([tv])[0])
+
+    def detect_and_eliminate_faults(self, tv: TestVector, faults: Set[Fault]) -> List[Fault]:
+        detected_faults = self.faults(self.detected_bits([tv], self.bits(faults))[0])
+        faults.difference_update(detected_faults)
+        return detected_faults
+
+    def fault_coverage_all(self, test_vectors: Sequence[TestVector],
+                           faults: Iterable[Fault]) -> List[Tuple[TestVector, List[Fault]]]:
+        return list(zip(test_vectors, (
+            self.faults(bits) for bits in self.detected_bits(test_vectors, self.bits(faults))
+        )))
+
+    def fault_coverage_list(self, test_vectors: Sequence[TestVector],
+                            remaining_faults: Set[Fault]) -> List[Tuple[TestVector, List[Fault]]]:
+        alive = self.bits(remaining_faults)
+        result = []
+        for start in range(0, len(test_vectors), self.parallel.word_size):
+            batch = test_vectors[start:start + self.parallel.word_size]
+            for test_vector, bits in zip(batch, self.detected_bits(batch, alive)):
+                bits &= alive
+                alive &= ~bits
+                result.append((test_vector, self.faults(bits)))
+        remaining_faults.intersection_update(self.faults(alive))
+        return result
@@ -0,0 +1,107 @@
+import hashlib
+import itertools
+from typing import Dict, List, Iterable, Sequence, Tuple
+import numpy as np
+from faults import Fault
+from parallel import ParallelSimulator
+from testvector import TestVector
+
+
+class SignatureIndex:
+    """
+    The pass/fail signature of every fault over a test set: which outputs fail on which vectors when the
+    fault is present. A failing position is a (vector, output) pair, numbered vector * outputs + output.
+    Faults are their indices into the fault_list of the circuit. Signatures are sparse, as most faults fail
+    few positions, so the index is inverted and held in three arrays:
+    faults[offsets[position]:offsets[position + 1]] are the faults failing the position, in order
+    counts[fault] is how many positions the fault fails
+    A query only reads the faults of the positions a device failed.
+    """
+    # Faults whose signatures are transposed at once while building, bounding the memory it takes
+    chunk_size = 1024
+
+    def __init__(self, offsets: np.ndarray, faults: np.ndarray, counts: np.ndarray, outputs: int):
+        self.offsets = offsets
+        self.faults = faults
+        self.counts = counts
+        self.outputs = outputs
+        self.fault_count = len(counts)
+
+    def __len__(self):
+        """The number of positions"""
+        return len(self.offsets) - 1
+
+    @staticmethod
+    def key(test_vectors: Sequence[TestVector]) -> str:
+        digest = hashlib.sha256()
+        for test_vector in test_vectors:
+            digest.update(f"{test_vector!r}\n".encode())
+        return digest.hexdigest()
+
+    @classmethod
+    def build(cls, simulator: ParallelSimulator, test_vectors: Sequence[TestVector],
+              fault_list: Sequence[Fault]) -> 'SignatureIndex':
+        """Simulate every fault against every vector, keeping the outputs each fault fails"""
+        outputs = len(simulator.output_indices)
+        positions: List[np.ndarray] = []
+        faults: List[np.ndarray] = []
+        for start, errors in simulator.output_error_masks(test_vectors, fault_list):
+            lanes = min(simulator.word_size, len(test_vectors) - start)
+            lane_bytes = (lanes + 7) // 8
+            word_positions, word_faults = [], []
+            for first in range(0, len(fault_list), cls.chunk_size):
+                chunk = list(itertools.islice(errors, cls.chunk_size))
+                words = np.frombuffer(b''.join(
+                    error.to_bytes(lane_bytes, 'little') for fault_errors in chunk for error in fault_errors
+                ), np.uint8).reshape(len(chunk), outputs, lane_bytes)
+                fault, output, lane = np.nonzero(np.unpackbits(words, axis=2, count=lanes, bitorder='little'))
+                word_positions.append((start + lane) * outputs + output)
+                word_faults.append(first + fault)
+            word_positions, word_faults = np.concatenate(word_positions), np.concatenate(word_faults)
+            # Faults come out in order within each position, as the sort is stable
+            order = np.argsort(word_positions, kind='stable')
+            positions.append(word_positions[order])
+            faults.append(word_faults[order].astype(np.int32))
+        positions = np.concatenate(positions) if positions else np.zeros(0, np.int64)
+        offsets = np.zeros(len(test_vectors) * outputs + 1, np.int64)
+        np.cumsum(np.bincount(positions, minlength=len(offsets) - 1), out=offsets[1:])
+        faults = np.concatenate(faults) if faults else np.zeros(0, np.int32)
+        return cls(offsets, faults, np.bincount(faults, minlength=len(fault_list)), outputs)
+
+    def to_arrays(self) -> Dict[str, np.ndarray]:
+        return {
+            "offsets": self.offsets, "faults": self.faults, "counts": self.counts,
+            "outputs": np.array([self.outputs], np.int64)
+        }
+
+    @classmethod
+    def from_arrays(cls, arrays: Dict[str, np.ndarray]) -> 'SignatureIndex':
+        return cls(arrays["offsets"], arrays["faults"], arrays["counts"], int(arrays["outputs"][0]))
+
+    def positions(self, failures: Iterable[Tuple[int, int]]) -> np.ndarray:
+        """Failing positions from (vector, output) pairs"""
+        pairs = np.array(list(failures), np.int64).reshape(-1, 2)
+        vectors, outputs = pairs[:, 0], pairs[:, 1]
+        if (pairs < 0).any() or (outputs >= self.outputs).any() or (vectors * self.outputs >= len(self)).any():
+            raise IndexError("A failure lies outside of the test set")
+        return np.unique(vectors * self.outputs + outputs)
+
+    def diagnose(self, failures: Iterable[Tuple[int, int]], count: int = 10) -> List[Tuple[int, float]]:
+        """
+        The faults best explaining the failing (vector, output) pairs observed on a device, best first. A
+        fault scores the positions both it and the device fail over the positions either of them fails, so
+        1.0 is a fault failing exactly the observed positions. Faults failing none of them are left out.
+        """
+        positions = self.positions(failures)
+        if not len(positions):
+            return []
+        starts, stops = self.offsets[positions], self.offsets[positions + 1]
+        # Every entry of the positions' slices of faults at once: each slice's start, shifted to stay contiguous
+        lengths = stops - starts
+        shifts = np.repeat(starts - np.cumsum(lengths) + lengths, lengths)
+        matched = np.bincount(self.faults[np.arange(len(shifts)) + shifts], minlength=self.fault_count)
+        candidates = np.flatnonzero(matched)
+        matched = matched[candidates]
+        scores = matched / (len(positions) + self.counts[candidates] - matched)
+        best = np.argsort(-scores, kind='stable')[:count]
+        return list(zip(candidates[best].tolist(), scores[best].tolist()))
@@ -0,0 +1,150 @@
+import os
+import shutil
+import tempfile
+from typing import Dict, List, Optional, Iterable, Tuple
+import numpy as np
+from testvector import TestVector
+
+
+class FaultDictionary:
+    """
+    Every fault each simulated vector detects, kept on disk so no vector is simulated twice against a circuit.
+    Faults are their indices into the fault_list of the circuit. The dictionary is three arrays, memory-mapped
+    once saved:
+    vectors[row] is a vector, as big endian bytes of its bits
+    unknown[row] is the U positions of the vector, as big endian bytes of its unknown mask
+    detected[row] is the set of faults it detects, as a bitset packed by np.packbits
+    first[fault] is the row of the first vector detecting the fault, or -1
+    keys[n] is the bytes of a vector followed by those of its unknown mask, in sorted order, and order[n] its row
+    Vectors are looked up by binary search over the mapped keys, so opening the dictionary reads none of its rows.
+    Vectors added since the last save are held in memory, and indexed by their key, until the next one.
+    """
+
+    def __init__(self, path: str, fault_count: int, width: int):
+        self.path = path
+        self.fault_count = fault_count
+        self.width = width
+        self.vector_bytes = (width + 7) // 8
+        self.fault_bytes = (fault_count + 7) // 8
+        self.key_type = np.dtype((np.void, 2 * self.vector_bytes))
+        if os.path.isdir(path):
+            self.load()
+        else:
+            self.vectors = np.zeros((0, self.vector_bytes), np.uint8)
+            self.unknown = np.zeros((0, self.vector_bytes), np.uint8)
+            self.detected = np.zeros((0, self.fault_bytes), np.uint8)
+            self.first = np.full(fault_count, -1, np.int64)
+            self.keys, self.order = self.sort_keys(self.vectors, self.unknown)
+        self.new_index: Dict[bytes, int] = {}
+        self.new_vectors: List[bytes] = []
+        self.new_unknown: List[bytes] = []
+        self.new_detected: List[np.ndarray] = []
+
+    def load(self):
+        self.vectors = np.load(os.path.join(self.path, "vectors.npy"), mmap_mode='r')
+        self.unknown = np.load(os.path.join(self.path, "unknown.npy"), mmap_mode='r')
+        self.detected = np.load(os.path.join(self.path, "detected.npy"), mmap_mode='r')
+        self.first = np.array(np.load(os.path.join(self.path, "first.npy")))
+        self.keys = np.load(os.path.join(self.path, "keys.npy"), mmap_mode='r').view(self.key_type).ravel()
+        self.order = np.load(os.path.join(self.path, "order.npy"), mmap_mode='r')
+
+    def sort_keys(self, vectors: np.ndarray, unknown: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """The key of every row, sorted, and the row of every sorted key"""
+        keys = np.ascontiguousarray(np.concatenate([vectors, unknown], axis=1)).view(self.key_type).ravel()
+        order = np.argsort(keys, kind='stable')
+        return keys[order], order
+
+    def __len__(self):
+        return len(self.keys) + len(self.new_index)
+
+    def __contains__(self, test_vector: TestVector):
+        return self.find(self.key(test_vector)) is not None
+
+    def key(self, test_vector: TestVector) -> bytes:
+        return int(test_vector).to_bytes(self.vector_bytes, 'big') + \
+            test_vector.unknown.to_bytes(self.vector_bytes, 'big')
+
+    def find(self, key: bytes) -> Optional[int]:
+        """The row of the vector of the key, or None if it was never simulated"""
+        n = self.new_index.get(key)
+        if n is not None:
+            return n
+        position = int(np.searchsorted(self.keys, np.frombuffer(key, self.key_type)[0]))
+        if position < len(self.keys) and self.keys[position].tobytes() == key:
+            return int(self.order[position])
+        return None
+
+    def vector(self, bits: bytes, unknown: bytes) -> TestVector:
+        return TestVector.packed(int.from_bytes(bits, 'big'), self.width, int.from_bytes(unknown, 'big'))
+
+    def row(self, n: int) -> np.ndarray:
+        saved = len(self.vectors)
+        return self.detected[n] if n < saved else self.new_detected[n - saved]
+
+    def get(self, test_vector: TestVector) -> Optional[List[int]]:
+        """The faults the vector detects, or None if it was never simulated"""
+        n = self.find(self.key(test_vector))
+        if n is None:
+            return None
+        return np.flatnonzero(np.unpackbits(self.row(n), count=self.fault_count)).tolist()
+
+    def add(self, test_vector: TestVector, fault_ids: Iterable[int]):
+        key = self.key(test_vector)
+        if self.find(key) is not None:
+            return
+        n = self.new_index[key] = len(self)
+        bits = np.zeros(self.fault_count, np.uint8)
+        bits[np.fromiter(fault_ids, np.int64)] = 1
+        self.first[(bits == 1) & (self.first < 0)] = n
+        self.new_vectors.append(key[:self.vector_bytes])
+        self.new_unknown.append(key[self.vector_bytes:])
+        self.new_detected.append(np.packbits(bits))
+
+    def first_detecting(self, fault_id: int) -> Optional[TestVector]:
+        n = int(self.first[fault_id])
+        if n < 0:
+            return None
+        saved = len(self.vectors)
+        if n < saved:
+            return self.vector(self.vectors[n].tobytes(), self.unknown[n].tobytes())
+        return self.vector(self.new_vectors[n - saved], self.new_unknown[n - saved])
+
+    def save(self):
+        """Write the dictionary to a new directory and swap it in, so a reader never sees half of it"""
+        if not self.new_vectors:
+            return
+        vectors = np.concatenate([
+            self.vectors, np.frombuffer(b''.join(self.new_vectors), np.uint8).reshape(-1, self.vector_bytes)
+        ])
+        unknown = np.concatenate([
+            self.unknown, np.frombuffer(b''.join(self.new_unknown), np.uint8).reshape(-1, self.vector_bytes)
+        ])
+        detected = np.concatenate([self.detected, np.array(self.new_detected, np.uint8).reshape(-1, self.fault_bytes)])
+        keys, order = self.sort_keys(vectors, unknown)
+        parent = os.path.dirname(os.path.abspath(self.path))
+        os.makedirs(parent, exist_ok=True)
+        temporary = tempfile.mkdtemp(dir=parent)
+        np.save(os.path.join(temporary, "vectors.npy"), vectors)
+        np.save(os.path.join(temporary, "unknown.npy"), unknown)
+        np.save(os.path.join(temporary, "detected.npy"), detected)
+        np.save(os.path.join(temporary, "first.npy"), self.first)
+        np.save(os.path.join(temporary, "keys.npy"), keys.view(np.uint8).reshape(-1, 2 * self.vector_bytes))
+        np.save(os.path.join(temporary, "order.npy"), order)
+        if os.path.isdir(self.path):
+            old = tempfile.mkdtemp(dir=parent)
+            os.rename(self.path, os.path.join(old, "dictionary"))
+            os.rename(temporary, self.path)
+            shutil.rmtree(old, ignore_errors=True)
+        else:
+            os.rename(temporary, self.path)
+        self.load()
+        self.new_index = {}
+        self.new_vectors = []
+        self.new_unknown = []
+        self.new_detected = []
+
+    def __enter__(self) -> 'FaultDictionary':
+        return self
+
+    def __exit__(self, *args):
+        self.save()
@@ -1,3 +1,4 @@
+from typing import List, Dict, Iterable
 from nodes import Node, Value
 import functools
 
@@ -25,3 +26,23 @@ class Fault:
 
     # def __eq__(self, fault: str):
     #     return repr(self) == fault
+
+
+class FaultBitsets:
+    """Sets of faults held as bitsets in ints, bit k standing for self.fault_list[k]"""
+    fault_list: List[Fault]
+    fault_ids: Dict[Fault, int]
+
+    def bits(self, faults: Iterable[Fault]) -> int:
+        bits = 0
+        for fault in faults:
+            bits |= 1 << self.fault_ids[fault]
+        return bits
+
+    def faults(self, bits: int) -> List[Fault]:
+        result = []
+        while bits:
+            bit = bits & -bits
+            result.append(self.fault_list[bit.bit_length() - 1])
+            bits ^= bit
+        return result
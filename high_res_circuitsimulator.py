@@ -1,81 +1,187 @@
-from high_res_nodes import *
 from circuitsimulator import *
+from high_resolution import HighResolutionSimulator
+from sequential import SequentialSimulator, sequential_depth
+import scan_circuit_simulator
 
 
 class HighResCircuitSimulator(CircuitSimulator):
     def __init__(self, **kwargs):
-        self.kwargs = kwargs
-        gates = self.LineParser(kwargs['bench']).parse_file()
-        self.nodes = self.compile(gates)
-        self.faulty_node: Optional[Node, InputFault ] = None
-        self.fault: Optional[Fault] = None
+        super().__init__(**kwargs)
         self.active_nodes: Set[Node] = set()
         self.leftover_nodes: Set[Node] = set()
         self.faulty_node: Set[Node] = set()
-        self.tv = None
-        self.tv_lookup: DefaultDict[TestVector, Set[Fault]] = defaultdict(self)
-
-    @functools.cached_property
-    def initial_frontier(self) -> Set[Node]:
-        return {
-            output_node for node
-            in self.nodes.input_nodes.values()
-            for output_node in node.output_nodes
-        }.union(
-            output_node for node
-            in self.nodes.flip_flops
-            for output_node in node.output_nodes
-        )
+        # Bitset of the faults the vector last applied detects, simulated once detect_fault is first asked
+        self.detected: Optional[int] = None
 
     @functools.cached_property
     def scan(self) -> List[Node]:
         return [*self.nodes.input_nodes, *self.nodes.flip_flops]
 
-    def detect_faults(self, test_vector: TestVector) -> List[Fault]:
-        self.apply_vector(test_vector)
-        result: List[HighResolutionValue]
+    @functools.cached_property
+    def parallel_simulator(self) -> ScanParallelSimulator:
+        return ScanParallelSimulator(self.netlist)
+
+    @functools.cached_property
+    def high_resolution_simulator(self) -> HighResolutionSimulator:
+        return HighResolutionSimulator(self.parallel_simulator, self.fault_list)
+
+    @functools.cached_property
+    def engines(self) -> Dict[str, Any]:
+        return {"serial": self, "parallel": self.parallel_simulator, "ppsfp": self.parallel_simulator,
+                "high_res": self.high_resolution_simulator, "sequential": self.sequential_simulator}
+
+    def run_batch(self, *args, engine: str = "serial", **kwargs) -> CircuitSimulator.Result:
+        if self.dictionary is not None and engine == "sequential":
+            raise ValueError("The fault dictionary holds full scan coverage, which the sequential engine does not give")
+        return super().run_batch(*args, engine=engine, **kwargs)
+
+    def vector_width(self, engine: str = "serial") -> int:
+        """The sequential engine only loads the primary inputs and the scanned flip flops from a vector"""
+        if engine == "sequential":
+            return len(self.nodes.input_nodes) + len(self.scan_flip_flops)
+        return super().vector_width(engine)
+
+    def detect_fault(self, fault: Fault, overlay: FaultOverlay = None) -> bool:
+        """Whether the vector last applied detects the fault, scanned out as in detect_faults; no overlay is used"""
+        if self.detected is None:
+            self.detected = self.high_resolution_simulator.detected_bits(self.tv)
+        return bool(self.detected >> self.high_resolution_simulator.fault_ids[fault] & 1)
+
+    def detect_faults(self, test_vector: TestVector, faults: Iterable[Fault] = None) -> List[Fault]:
+        return self.high_resolution_simulator.detect_faults(test_vector, faults)
+
+    def detect_and_eliminate_faults(self, test_vector: TestVector, faults: Set[Fault]) -> List[Fault]:
+        detected_faults = self.known_faults(test_vector, faults)
+        if detected_faults is None:
+            detected_faults = self.detect_faults(test_vector, faults)
+        faults.difference_update(detected_faults)
+        return detected_faults
 
     def apply_vector(self, test_vector: TestVector):
-        self.active_nodes = self.initial_frontier.copy()
+        self.tv = test_vector
+        self.detected = None
         nodes = itertools.chain(self.nodes.input_nodes.values(), self.nodes.flip_flops)
         for node, value in zip(nodes, test_vector):
             node.vector_assignment = value
             node.value = node.vector_assignment
+        self.propagate(self.nodes.full_propagation_path)
 
     @functools.cached_property
     def ff_length(self) -> int:
         return len(self.nodes.flip_flops)
 
+    @functools.cached_property
+    def scan_flip_flops(self) -> List[int]:
+        """The flip flops on a scan chain, the rest of them only being set by clocking the circuit"""
+        return [self.netlist.index[name] for name in self.kwargs.get('scan_flip_flops', ())]
+
     @functools.cached_property
     def flip_flop_resolution_length(self) -> int:
-        """How many cycles must be run for a fault to be detected in any flip flop"""
-        try:
-            return max(
-                self._flip_flop_length(flip_flop)
-                for flip_flop in self.nodes.flip_flops
+        """
+        How many cycles must be run for a fault to be detected in any flip flop: one, and one more for every flip
+        flop between the fault and an output or scanned flip flop, as counted by sequential_depth
+        """
+        return sequential_depth(self.netlist, self.scan_flip_flops) + 1
+
+    @functools.cached_property
+    def sequential_simulator(self) -> SequentialSimulator:
+        """Clocks every pattern for the cycles given to the simulator, or else flip_flop_resolution_length"""
+        return SequentialSimulator(
+            self.netlist, self.kwargs.get('cycles') or self.flip_flop_resolution_length, self.scan_flip_flops
+        )
+
+
+class HighResEngineTest(unittest.TestCase):
+    sequential_bench = '\n'.join([
+        "INPUT(a)", "INPUT(b)", "OUTPUT(y)", "OUTPUT(z)", "q1 = DFF(a)", "q2 = DFF(q1)", "y = AND(q2, b)",
+        "q3 = DFF(n4)", "q4 = DFF(q3)", "n4 = NOT(q4)", "z = BUFF(q4)"
+    ])
+
+    def test_fault_overlay(self):
+        # Full scan of a combinational bench only differs from the overlay where a U reaches an output
+        circuit = HighResCircuitSimulator(bench=EngineTest.bench)
+        reference = CircuitSimulator(bench=EngineTest.bench)
+        for test_vector in (TestVector("0110"), TestVector("1101")):
+            circuit.apply_vector(test_vector)
+            reference.apply_vector(test_vector)
+            self.assertEqual(
+                [repr(fault) for fault in circuit.fault_list if circuit.detect_fault(fault)],
+                [repr(fault) for fault in reference.fault_list if reference.detect_fault(fault)]
             )
-        except ValueError:
-            return 0
-
-    def _flip_flop_length(self, flip_flop: FlipFlop) -> int:
-        """How many cycles must be run for a fault to be detected in the given fault"""
-        lengths = []
-        frontier_nodes: List[Node] = flip_flop.output_nodes
-        traversed_flip_flops: Set[FlipFlop] = {flip_flop}
-        for node in frontier_nodes:
-            if isinstance(node, FlipFlop):
-                lengths.append(self._flip_flop_length(node))
-                if node in traversed_flip_flops:
-                    raise RuntimeError("A fault would require infinite cycles to be detected")
-                traversed_flip_flops.add(node)
-            else:
-                frontier_nodes.extend(node.output_nodes)
-        return max(lengths) if lengths else 1
-
-    class LineParser(CircuitSimulator.LineParser):
-        @functools.cached_property
-        def gate_map(self):
-            return {"AND": AndGate, "OR": OrGate, "NAND": NandGate, "XNOR": XnorGate,
-                    "NOR": NorGate, "BUFF": BuffGate, "XOR": XorGate, "NOT": NotGate,
-                    "DFF": FlipFlop}
 
+    def test_detect_fault_matches_detect_faults(self):
+        # q is scanned out, so a vector loading 1 into a and b detects q SA-0 on it and on its D pin
+        with tempfile.TemporaryDirectory() as directory:
+            bench = os.path.join(directory, "dff.bench")
+            with open(bench, 'w') as f:
+                f.write('\n'.join(["INPUT(a)", "INPUT(b)", "OUTPUT(y)", "y = AND(a, b)", "q = DFF(y)"]))
+            circuit = HighResCircuitSimulator(bench=bench)
+        for test_vector in (TestVector("110"), TestVector("U10"), TestVector("011")):
+            circuit.apply_vector(test_vector)
+            self.assertEqual(
+                [repr(fault) for fault in circuit.fault_list if circuit.detect_fault(fault)],
+                [repr(fault) for fault in circuit.fault_list if fault in set(circuit.detect_faults(test_vector))],
+                f'detect_fault disagrees with detect_faults on {test_vector}'
+            )
+        circuit.apply_vector(TestVector("110"))
+        self.assertTrue(all(
+            circuit.detect_fault(fault) for fault in circuit.fault_list if repr(fault) in ("q-0", "q-y-0")
+        ))
+
+    def test_detect_faults_matches_scan(self):
+        with tempfile.TemporaryDirectory() as directory:
+            bench = os.path.join(directory, "scan.bench")
+            with open(bench, 'w') as f:
+                f.write(scan_circuit_simulator.ScanEngineTest.bench)
+            circuit = HighResCircuitSimulator(bench=bench)
+            scan_circuit = scan_circuit_simulator.ScanCircuitSimulator(bench=bench)
+        for test_vector in (TestVector("011010"), TestVector("100101"), TestVector("1U0110"), TestVector("U1U0U1")):
+            self.assertEqual(
+                set(map(repr, circuit.detect_faults(test_vector))),
+                set(map(repr, scan_circuit.detect_faults(test_vector))),
+                f'high resolution engine disagrees with serial scan on {test_vector}'
+            )
+
+    def test_sequential_cycles(self):
+        # A fault on a needs three cycles to reach y from U state, or two to be scanned out of q2
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "sequential.bench")
+            with open(path, 'w') as f:
+                f.write(self.sequential_bench)
+            circuit = HighResCircuitSimulator(bench=path)
+            scanned = HighResCircuitSimulator(bench=path, scan_flip_flops=["q2"], cycles=2)
+        self.assertEqual(circuit.flip_flop_resolution_length, 3)
+        fault = next(fault for fault in circuit.fault_list if repr(fault) == "a-0")
+        self.assertEqual(circuit.sequential_simulator.fault_coverage_all([TestVector("11")], [fault])[0][1], [fault])
+        self.assertEqual(
+            SequentialSimulator(circuit.netlist, 2).fault_coverage_all([TestVector("11")], [fault])[0][1], []
+        )
+        fault = next(fault for fault in scanned.fault_list if repr(fault) == "a-0")
+        self.assertEqual(scanned.sequential_simulator.fault_coverage_all([TestVector("100")], [fault])[0][1], [fault])
+
+    def test_sequential_vector_width(self):
+        # Only a, b and the scanned q2 are loaded, the last bit being q2's rather than q1's
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "sequential.bench")
+            with open(path, 'w') as f:
+                f.write(self.sequential_bench)
+            scanned = HighResCircuitSimulator(bench=path, scan_flip_flops=["q2"], cycles=2)
+        result = scanned.run_batch(0x12, {2, 3}, engine="sequential")
+        self.assertEqual({len(tv) for tv, _ in result.fault_coverage_all}, {3})
+        self.assertEqual({len(tv) for tv, _ in scanned.run_batch(0x12, {2, 3}).fault_coverage_all}, {6})
+
+    def test_sequential_shards(self):
+        # The workers get scan_flip_flops, so the sharded run scans q2 out as well
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "sequential.bench")
+            with open(path, 'w') as f:
+                f.write(self.sequential_bench)
+            circuit = HighResCircuitSimulator(bench=path, cache=directory, scan_flip_flops=["q2"], cycles=2)
+            result = circuit.run_batch(0x12, {2, 3}, engine="sequential")
+            sharded_result = circuit.run_batch(0x12, {2, 3}, engine="sequential", processes=2)
+            with circuit.open_dictionary():
+                with self.assertRaises(ValueError):
+                    circuit.run_batch(0x12, {2, 3}, engine="sequential")
+        for (tv, faults), (_, sharded) in zip(result.fault_coverage_all, sharded_result.fault_coverage_all):
+            self.assertEqual(set(map(repr, faults)), set(map(repr, sharded)), f'sharded coverage disagrees on {tv}')
+        self.assertEqual(set(map(repr, result.remaining_faults)), set(map(repr, sharded_result.remaining_faults)))
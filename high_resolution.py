@@ -0,0 +1,123 @@
+from typing import List, Dict, Tuple, Iterable, Optional, Sequence, Set, Callable
+from nodes import value_1
+from faults import Fault, FaultBitsets
+from testvector import TestVector
+from parallel import ScanParallelSimulator, pack
+
+# Lanes forced to 1 and lanes forced to 0
+Forces = Tuple[int, int]
+
+
+class HighResolutionSimulator(FaultBitsets):
+    """
+    Full scan fault simulation with the results of ScanCircuitSimulator, simulating the good machine and every
+    faulty machine of a vector together. Lane 0 of the rails is the good machine and lane k + 1 the machine with
+    self.fault_list[k], so the ones and zeros rails of a net hold its high resolution value, good and bad, for
+    every fault at once. One pass over the schedule per vector yields every fault the vector detects.
+
+    A stuck-at line is forced in the lanes of its faults as the schedule reaches it, U included, and a faulty pin
+    reads its driver through a slot of its own. A fault is detected wherever a scanned out value differs from
+    lane 0.
+    """
+
+    def __init__(self, parallel_simulator: ScanParallelSimulator, faults: Iterable[Fault]):
+        self.parallel = parallel_simulator
+        self.fault_list: List[Fault] = list(faults)
+        self.fault_ids: Dict[Fault, int] = {fault: n for n, fault in enumerate(self.fault_list)}
+        self.lanes = (1 << len(self.fault_list) + 1) - 1
+        stems: Dict[int, List[int]] = {}
+        pins: Dict[Tuple[int, int], List[int]] = {}
+        # Faults on a flip flop, or on its D pin, only force the value it captures
+        self.captures: Dict[int, Forces] = {}
+        captures: Dict[int, List[int]] = {}
+        for fault, n in self.fault_ids.items():
+            lane = 1 << n + 1
+            value = 1 if fault.stuck_at is value_1 else 0
+            node = self.parallel.index[fault.node.name]
+            if node in self.parallel.flip_flops:
+                captures.setdefault(node, [0, 0])[value] |= lane
+            elif fault.input_node is None:
+                stems.setdefault(node, [0, 0])[value] |= lane
+            else:
+                pins.setdefault((node, self.parallel.index[fault.input_node.name]), [0, 0])[value] |= lane
+        self.captures = {node: (one, zero) for node, (zero, one) in captures.items()}
+        # Nets that are not scheduled, the inputs and undriven nets, are forced once loaded
+        self.source_stems: List[Tuple[int, int, int]] = [
+            (node, one, zero) for node, (zero, one) in stems.items() if node not in self.parallel.position
+        ]
+        self.slots = self.parallel.pin_slot
+        self.schedule: List[Tuple[int, Callable, Tuple[int, ...], Tuple[Tuple[int, int, int, int], ...],
+                                  Optional[Forces]]] = []
+        for n, function, fanin in self.parallel.schedule:
+            pin_forces = []
+            for source in dict.fromkeys(fanin):
+                forces = pins.get((n, source))
+                if forces is not None:
+                    pin = fanin.index(source)
+                    fanin = (*fanin[:pin], self.slots, *fanin[pin + 1:])
+                    pin_forces.append((self.slots, source, forces[1], forces[0]))
+                    self.slots += 1
+            stem = stems.get(n)
+            self.schedule.append((n, function, fanin, tuple(pin_forces), (stem[1], stem[0]) if stem else None))
+
+    def simulate(self, test_vector: TestVector) -> Tuple[List[int], List[int]]:
+        """The ones and zeros rails of every net, lane 0 being the good machine"""
+        lanes = self.lanes
+        ones = [0] * self.slots
+        zeros = [0] * self.slots
+        for n, (one, zero) in zip(self.parallel.input_indices, pack([test_vector], len(self.parallel.input_indices))):
+            ones[n] = lanes if one else 0
+            zeros[n] = lanes if zero else 0
+        for n, one, zero in self.source_stems:
+            ones[n] = (ones[n] | one) & ~zero
+            zeros[n] = (zeros[n] | zero) & ~one
+        for n, function, fanin, pin_forces, stem in self.schedule:
+            for slot, source, one, zero in pin_forces:
+                ones[slot] = (ones[source] | one) & ~zero
+                zeros[slot] = (zeros[source] | zero) & ~one
+            if stem is None:
+                ones[n], zeros[n] = function(ones, zeros, fanin)
+            else:
+                one, zero = function(ones, zeros, fanin)
+                ones[n] = (one | stem[0]) & ~stem[1]
+                zeros[n] = (zero | stem[1]) & ~stem[0]
+        return ones, zeros
+
+    def detected_bits(self, test_vector: TestVector) -> int:
+        """Bitset of the faults the vector detects, bit k standing for self.fault_list[k]"""
+        lanes = self.lanes
+        ones, zeros = self.simulate(test_vector)
+        detected = 0
+        for n, captured in zip(self.parallel.scan_out_indices, self.parallel.output_indices):
+            one, zero = ones[captured], zeros[captured]
+            forces = self.captures.get(n)
+            if forces is not None:
+                one, zero = (one | forces[0]) & ~forces[1], (zero | forces[1]) & ~forces[0]
+            detected |= (one ^ (lanes if one & 1 else 0)) | (zero ^ (lanes if zero & 1 else 0))
+        return detected >> 1
+
+    def output_values(self, test_vectors: Sequence[TestVector]):
+        return self.parallel.output_values(test_vectors)
+
+    def detect_faults(self, tv: TestVector, faults: Iterable[Fault] = None) -> List[Fault]:
+        detected = self.detected_bits(tv)
+        return self.faults(detected if faults is None else detected & self.bits(faults))
+
+    def detect_and_eliminate_faults(self, tv: TestVector, faults: Set[Fault]) -> List[Fault]:
+        detected_faults = self.detect_faults(tv, faults)
+        faults.difference_update(detected_faults)
+        return detected_faults
+
+    def fault_coverage_all(self, test_vectors: Sequence[TestVector],
+                           faults: Iterable[Fault]) -> List[Tuple[TestVector, List[Fault]]]:
+        """Every fault detected by each test vector"""
+        alive = self.bits(faults)
+        return [(test_vector, self.faults(self.detected_bits(test_vector) & alive)) for test_vector in test_vectors]
+
+    def fault_coverage_list(self, test_vectors: Sequence[TestVector],
+                            remaining_faults: Set[Fault]) -> List[Tuple[TestVector, List[Fault]]]:
+        """The faults first detected by each test vector; detected faults are removed from remaining_faults"""
+        return [
+            (test_vector, self.detect_and_eliminate_faults(test_vector, remaining_faults))
+            for test_vector in test_vectors
+        ]
@@ -5,8 +5,10 @@ from testvector import *
 from scan_circuit_simulator import *
 from interface import *
 import argparse
+import os
 from nodes import *
 import csv
+from contextlib import nullcontext
 
 configs = [
     ("n-bit counter", set()),
@@ -25,12 +27,33 @@ class Args(argparse.Namespace):
     multiprocessing: bool
     verbose: bool
     compare: bool
+    generate_code: bool
+    vectorize: bool
+    incremental: bool
+    collapse: bool
+    dominance: bool
+    cache: Optional[str]
+    vector_count: Optional[int]
+    target_coverage: Optional[float]
+    log_vectors: Optional[str]
+    dictionary: bool
+    engine: str
 
 
-def fault_coverage_comparison(circuit: Union[CircuitSimulator, ScanCircuitSimulator], args: Type[Args]):
+def processes(args: Args) -> int:
+    return (os.cpu_count() or 1) if args.multiprocessing else 1
+
+
+def batch_arguments(args: Args) -> Dict[str, Any]:
+    return dict(vector_count=args.vector_count, target_coverage=args.target_coverage, engine=args.engine)
+
+
+def fault_coverage_comparison(circuit: Union[CircuitSimulator, ScanCircuitSimulator], args: Args):
     results = [
         (name,
-         circuit.run_batch(args.seed, taps, get_all_coverage=False, sequential=args.sequential).fault_coverage_list)
+         circuit.run_batch(args.seed, taps, get_all_coverage=False, sequential=args.sequential,
+                           collapse=args.collapse, dominance=args.dominance,
+                           processes=processes(args), **batch_arguments(args)).fault_coverage_list)
         for (name, taps) in configs
     ]
     with open("_%s_seed_%s.csv" % (args.bench, hex(args.seed)), 'w') as f:
@@ -40,8 +63,11 @@ def fault_coverage_comparison(circuit: Union[CircuitSimulator, ScanCircuitSimula
             w.writerows([name, tv, *faults] for tv, faults in fault_coverage_list)
 
 
-def fault_coverage(circuit: Union[CircuitSimulator, ScanCircuitSimulator], args: Type[Args]):
-    result = circuit.run_batch(args.seed, args.taps, sequential=args.sequential)
+def fault_coverage(circuit: Union[CircuitSimulator, ScanCircuitSimulator], args: Args):
+    with VectorLog(args.log_vectors) if args.log_vectors else nullcontext() as log:
+        result = circuit.run_batch(args.seed, args.taps, sequential=args.sequential,
+                                   collapse=args.collapse, dominance=args.dominance, processes=processes(args),
+                                   log=log, **batch_arguments(args))
     with open("_%s_remaining_faults.csv" % args.bench, 'w', newline='') as f:
         w = csv.writer(f)
         w.writerow([str(fault) for fault in result.remaining_faults])
@@ -59,20 +85,51 @@ def fault_coverage(circuit: Union[CircuitSimulator, ScanCircuitSimulator], args:
             fault_writer.writerow(faults)
 
 
-def main():
+def parse_arguments(argv: Optional[List[str]] = None) -> Args:
     parser = argparse.ArgumentParser()
     parser.add_argument('-b', '--bench', type=str, default='circuit.bench', help='input bench file')
     parser.add_argument('-s', '--seed', type=str, default='0x123456789abc', help='seed for tv generation')
     parser.add_argument('-t', '--taps', type=list, default=[2, 7], help='tuple in LFSR')
     parser.add_argument('--no-prompt', dest='prompt', action='store_false', default=True)
-    parser.add_argument('-mp', '--multiprocessing', dest='multiprocessing', default=False, action='store_true')
+    parser.add_argument('-mp', '--multiprocessing', dest='multiprocessing', default=False, action='store_true',
+                        help='shard the faults across a process per core')
     parser.add_argument('--no-verbose', dest='verbose', default=True, action='store_false')
     parser.add_argument('-c', '--compare', dest='compare', default=False, action='store_true')
     parser.add_argument('-sq', '--sequential', dest='sequential', default=False, action='store_true')
-    args = parser.parse_args(namespace=Args)
+    parser.add_argument('-g', '--generate-code', dest='generate_code', default=False, action='store_true',
+                        help='simulate the good machine with Python generated from the bench')
+    parser.add_argument('--incremental', dest='incremental', default=False, action='store_true',
+                        help='apply each vector to the good machine by re-evaluating only what it changes')
+    parser.add_argument('-vec', '--vectorize', dest='vectorize', default=False, action='store_true',
+                        help='simulate the good machine with NumPy, one operation per level and gate type')
+    parser.add_argument('--collapse', dest='collapse', default=False, action='store_true',
+                        help='simulate one fault per class of equivalent faults')
+    parser.add_argument('--dominance', dest='dominance', default=False, action='store_true',
+                        help='collapse, and skip faults dominating the input faults of their gate')
+    parser.add_argument('--cache', type=str, default='.circuit_cache',
+                        help='directory keeping compiled benches between runs')
+    parser.add_argument('--no-cache', dest='cache', action='store_const', const=None)
+    parser.add_argument('--no-dictionary', dest='dictionary', action='store_false', default=True,
+                        help='simulate every vector, rather than reading the faults of known vectors from the cache')
+    parser.add_argument('-e', '--engine', type=str, default='serial',
+                        choices=['serial', 'parallel', 'ppsfp', 'deductive', 'concurrent', 'critical_path'],
+                        help='fault simulation engine; sequential benches only have serial and parallel/ppsfp')
+    parser.add_argument('-n', '--vector-count', dest='vector_count', type=int, default=None,
+                        help='vectors to simulate, 2^inputs up to 100 by default')
+    parser.add_argument('--target-coverage', dest='target_coverage', type=float, default=None,
+                        help='stop once this fraction of the faults is detected')
+    parser.add_argument('--log-vectors', dest='log_vectors', type=str, default=None,
+                        help='file to write every vector simulated to')
+    # An instance, so that vars() only holds the arguments, and the simulators can be built from them
+    args = parser.parse_args(argv, namespace=Args())
     if type(args.seed) is str:
         args.seed = int(args.seed, 16 if args.seed.startswith('0x') else \
             2 if args.seed.startswith('0b') else 1)
+    return args
+
+
+def main():
+    args = parse_arguments()
     if args.prompt:
         new_args = prompt_arguments()
         for attribute, new_value in new_args.items():
@@ -89,10 +146,12 @@ def main():
     else:
         circuit_simulator = CircuitSimulator(**vars(args))
     print("%s" % len(circuit_simulator.faults))
-    if args.compare:
-        fault_coverage_comparison(circuit_simulator, args)
-    else:
-        fault_coverage(circuit_simulator, args)
+    with circuit_simulator.open_dictionary() if args.dictionary and args.cache and not args.dominance else \
+            nullcontext():
+        if args.compare:
+            fault_coverage_comparison(circuit_simulator, args)
+        else:
+            fault_coverage(circuit_simulator, args)
 
 
 if __name__ == '__main__':
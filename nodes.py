@@ -7,48 +7,56 @@ from functools import singledispatch, lru_cache
 from typing import List, Type, Union, Any, Dict, Optional, Tuple, Iterable, Iterator, Set, Generator
 
 
-class Value:
-    # __slots__ = 'value', 'key'
+class Value(int):
+    """
+    One of the five values 0, 1, D, D' and U. Values are singletons, compared with is, and each one is also the
+    small int (0, 1, 2, 3 and 4 respectively) that indexes the truth tables below.
+    """
 
     __init__map = {0: 0, "0": 0, '1': 1, 1: 1, "D": "D", "d": "D",
                    "D'": "D'", "d'": "D'", "U": "U", "u": "U"}
 
     __key__map = {0: "_zero", 1: "_one", 'U': '_unknown', "D'": "_dprime", 'D': '_d'}
 
-    @lru_cache(5)
-    def __new__(cls, value):
-        return super(Value, cls).__new__(cls)
+    __code__map = {0: 0, 1: 1, "D": 2, "D'": 3, "U": 4}
 
-    def __init__(self, value: Union[str, int]):
+    _instances: Dict[Tuple[type, Any], 'Value'] = {}
+
+    def __new__(cls, value: Union[str, int]):
+        try:
+            return cls._instances[cls, value]
+        except KeyError:
+            pass
+        try:
+            name = Value.__init__map[value]
+        except KeyError:
+            raise ValueError(f"Cannot be turned into Value: {value}")
         try:
-            self.value = Value.__init__map[value]
+            self = cls._instances[cls, name]
         except KeyError:
-            raise Value(f"Cannot be turned into Value: {value}")
-        self.key = self.__key__map[self.value]
+            self = cls._instances[cls, name] = super(Value, cls).__new__(cls, Value.__code__map[name])
+            self.value = name
+            self.key = Value.__key__map[name]
+            self.propagates_fault = name == "D" or name == "D'"
+        cls._instances[cls, value] = self
+        return self
+
+    def __reduce__(self):
+        return type(self), (self.value,)
 
-    @lru_cache(25)
     def __eq__(self, other):
         return self is other
 
-    @lru_cache(5)
+    def __ne__(self, other):
+        return self is not other
+
+    __hash__ = int.__hash__
+
     def __invert__(self) -> 'Value':
-        if self is value_0:
-            return value_1
-        elif self is value_1:
-            return value_0
-        elif self is value_D:
-            return value_DP
-        elif self is value_DP:
-            return value_D
-        else:
-            return value_U
-
-    @lru_cache(5)
+        return invert_table[self]
+
     def __bool__(self):
-        if self is value_U:
-            return False
-        else:
-            return True
+        return self is not value_U
 
     def __str__(self):
         return str(self.value)
@@ -56,15 +64,7 @@ class Value:
     def __repr__(self):
         return repr(self.value)
 
-    def __hash__(self):
-        return hash(self.value)
-
-    @functools.cached_property
-    def propagates_fault(self) -> bool:
-        if self is value_0 or self is value_1 or self is value_U:
-            return False
-        else:
-            return True
+    __format__ = object.__format__
 
 
 value_1 = Value(1)
@@ -73,6 +73,68 @@ value_D = Value("D")
 value_DP = Value("D'")
 value_U = Value("U")
 
+# Truth tables, indexed by the int of each Value
+values = (value_0, value_1, value_D, value_DP, value_U)
+invert_table = (value_1, value_0, value_DP, value_D, value_U)
+# Gates of any number of inputs fold their inputs into a mask of the values seen, one bit per value
+value_bits = (1, 2, 4, 8, 16)
+
+
+def _and_of_mask(mask: int) -> Value:
+    if mask & value_bits[value_0] or mask & value_bits[value_D] and mask & value_bits[value_DP]:
+        return value_0
+    elif mask & value_bits[value_U]:
+        return value_U
+    elif mask & value_bits[value_D]:
+        return value_D
+    elif mask & value_bits[value_DP]:
+        return value_DP
+    return value_1
+
+
+def _or_of_mask(mask: int) -> Value:
+    if mask & value_bits[value_1] or mask & value_bits[value_D] and mask & value_bits[value_DP]:
+        return value_1
+    elif mask & value_bits[value_U]:
+        return value_U
+    elif mask & value_bits[value_D]:
+        return value_D
+    elif mask & value_bits[value_DP]:
+        return value_DP
+    return value_0
+
+
+def _xor(first: Value, second: Value) -> Value:
+    """Parity of the good machine and of the faulty machine, taken separately"""
+    if first is value_U or second is value_U:
+        return value_U
+    good = (first is value_1 or first is value_D) ^ (second is value_1 or second is value_D)
+    bad = (first is value_1 or first is value_DP) ^ (second is value_1 or second is value_DP)
+    return {(0, 0): value_0, (1, 1): value_1, (1, 0): value_D, (0, 1): value_DP}[good, bad]
+
+
+def _propagate_fault(value: Value, stuck_at: Value) -> Value:
+    if not stuck_at:
+        return value
+    elif stuck_at is value_1:
+        return value_DP if value is value_0 else value
+    else:
+        return value_D if value is value_1 else value
+
+
+and_table = tuple(_and_of_mask(mask) for mask in range(32))
+nand_table = tuple(invert_table[value] for value in and_table)
+or_table = tuple(_or_of_mask(mask) for mask in range(32))
+nor_table = tuple(invert_table[value] for value in or_table)
+# 5x5 tables for the common two input gates, and for folding XOR, which is associative
+and_pairs = tuple(tuple(and_table[value_bits[a] | value_bits[b]] for b in values) for a in values)
+nand_pairs = tuple(tuple(nand_table[value_bits[a] | value_bits[b]] for b in values) for a in values)
+or_pairs = tuple(tuple(or_table[value_bits[a] | value_bits[b]] for b in values) for a in values)
+nor_pairs = tuple(tuple(nor_table[value_bits[a] | value_bits[b]] for b in values) for a in values)
+xor_pairs = tuple(tuple(_xor(a, b) for b in values) for a in values)
+# propagate_fault_table[stuck_at][value]
+propagate_fault_table = tuple(tuple(_propagate_fault(value, stuck_at) for value in values) for stuck_at in values)
+
 
 class Gate:
     def __subclasscheck__(self, subclass):
@@ -117,8 +179,16 @@ class Gate:
         self._d = False
 
     def logic(self) -> Value:
+        return self.evaluate([node.value for node in self.input_nodes])
+
+    def evaluate(self, values: List[Value]) -> Value:
+        """Output of the gate for the given input values; a wire keeps whatever it was assigned"""
         return self.value
 
+    def restore(self, value: Value):
+        """Put back a value read from the value property"""
+        self.value = value
+
     @property
     def stuck_at(self):
         return self.node.stuck_at
@@ -137,6 +207,7 @@ class Node:
         self.type = "INTERM."
         self.corridor = False
         self.implication = value_U
+        self.level = 0
 
     def __repr__(self):
         return self.name
@@ -147,6 +218,7 @@ class Node:
     def __hash__(self):
         return hash(self.name)
 
+    @property
     def name(self) -> str:
         return self.gate.name
 
@@ -190,59 +262,105 @@ class Node:
         return self.value.propagates_fault
 
     @staticmethod
-    @lru_cache(15)
-    def propagate_fault(value: Value, stuck_at: Value):
-        if not stuck_at:
-            return value
-        elif stuck_at is value_1:
-            if value is value_0:
-                return value_DP
-            else:
-                return value
-        else:
-            if value is value_1:
-                return value_D
-            else:
-                return value
+    def propagate_fault(value: Value, stuck_at: Optional[Value]) -> Value:
+        return value if stuck_at is None else propagate_fault_table[stuck_at][value]
 
-    @property
-    def fault_propagation_path(self) -> Generator[Set['Node'], None, None]:
-        frontier = {self}
-        yield frontier
-        while (any(node.value.propagates_fault for node in frontier) and
-               (frontier := {
-                   output_node for node
-                   in frontier
-                   for output_node in node.output_nodes
-               })
-        ):
-            yield frontier
-
-    # @property
-    # def propagation_path(self) -> Generator[Set['Node'], None, None]:
-    #     yield (frontier := {self})
-    #     while (frontier := {
-    #         output_node for node
-    #         in frontier
-    #         for output_node in node.output_nodes
-    #     }):
-    #         yield frontier
     @functools.cached_property
-    def propagation_path(self) -> List[Set['Node']]:
-        result = [frontier := {self}]
-        while (frontier := {
-            output_node for node
-            in frontier
-            for output_node in node.output_nodes
-        }):
-            result.append(frontier)
-        return result
+    def propagation_path(self) -> List[List['Node']]:
+        """The node and its fanout cone up to the flip flops, by level, so every node is evaluated once"""
+        cone = {self}
+        frontier = [self]
+        while frontier:
+            for output_node in frontier.pop().outputs_that_are_not_flip_flops:
+                if output_node not in cone:
+                    cone.add(output_node)
+                    frontier.append(output_node)
+        return levelized(cone)
 
     @functools.cached_property
     def outputs_that_are_not_flip_flops(self) -> List['Node']:
         return [output_node for output_node in self.output_nodes if not isinstance(output_node.gate, FlipFlop)]
 
 
+def levelized(nodes: Iterable[Node]) -> List[List[Node]]:
+    """Group nodes by their level, lowest first"""
+    levels: Dict[int, List[Node]] = {}
+    for node in nodes:
+        levels.setdefault(node.level, []).append(node)
+    return [levels[level] for level in sorted(levels)]
+
+
+class FaultOverlay:
+    """
+    A fault laid over the good machine without touching the netlist: the faulty node, the index of the faulty
+    pin among its input_nodes (None for the node's own output), and the stuck-at value. The faulty machine
+    is held in values, which maps every node the fault changed to its value; all other nodes keep their
+    good value. Clearing the overlay is all it takes to get back to the good machine.
+    """
+    __slots__ = 'node', 'pin', 'stuck_at', 'values'
+
+    def __init__(self):
+        self.node: Optional[Node] = None
+        self.pin: Optional[int] = None
+        self.stuck_at: Optional[Value] = None
+        self.values: Dict[Node, Value] = {}
+
+    def inject(self, node: Node, stuck_at: Value, input_node: Optional[Node] = None):
+        """Fault the node, or its first pin reading input_node, and propagate the effect over the good machine"""
+        self.node = node
+        # A gate reading the faulty input on several pins is faulted on the first of them, as InputFault does;
+        # every engine compiles pin faults the same way, so they all agree on which pin that is
+        self.pin = None if input_node is None else node.input_nodes.index(input_node)
+        self.stuck_at = stuck_at
+        self.values.clear()
+        self.propagate()
+
+    def clear(self):
+        self.node = self.pin = self.stuck_at = None
+        self.values.clear()
+
+    def value(self, node: Node) -> Value:
+        return self.values.get(node, node.value)
+
+    def evaluate(self, node: Node) -> Value:
+        values = self.values
+        if node is self.node:
+            if self.pin is None:
+                return node.propagate_fault(node.value, self.stuck_at)
+            inputs = [values.get(input_node, input_node.value) for input_node in node.input_nodes]
+            inputs[self.pin] = node.propagate_fault(inputs[self.pin], self.stuck_at)
+            return node.gate.evaluate(inputs)
+        return node.gate.evaluate([values.get(input_node, input_node.value) for input_node in node.input_nodes])
+
+    def propagate(self):
+        """
+        Evaluate the cone of the faulty node by level, skipping gates none of whose inputs changed, until no
+        changed value is left to propagate
+        """
+        path = self.node.propagation_path
+        values = self.values
+        # A flip flop only shows the value it captured, so a fault on it changes nothing here
+        if isinstance(self.node.gate, FlipFlop):
+            return
+        value = self.evaluate(self.node)
+        if value is self.node.value:
+            return
+        values[self.node] = value
+        # Highest level that a changed value can still reach
+        horizon = max((output_node.level for output_node in self.node.outputs_that_are_not_flip_flops), default=0)
+        for nodes in path[1:]:
+            if nodes[0].level > horizon:
+                break
+            for node in nodes:
+                if any(input_node in values for input_node in node.input_nodes):
+                    value = self.evaluate(node)
+                    if value is not node.value:
+                        values[node] = value
+                        horizon = max([
+                            horizon, *(output_node.level for output_node in node.outputs_that_are_not_flip_flops)
+                        ])
+
+
 class InputFault(Node):
     __slots__ = 'output_nodes', 'genuine_node', 'stuck_at'
 
@@ -279,146 +397,70 @@ class InputFault(Node):
         return self.propagate_fault(self.genuine_node.value, self.stuck_at)
 
     @property
-    def fault_propagation_path(self) -> Generator[Set['Node'], None, None]:
-        return self.output_nodes[0].fault_propagation_path
-        # return self.genuine_node.fault_propagation_path
-
-    @property
-    def propagation_path(self) -> Generator[Set['Node'], None, None]:
+    def propagation_path(self) -> List[List['Node']]:
         return self.output_nodes[0].propagation_path
 
 
-class AndGate(Gate):
+class TableGate(Gate):
+    """A gate looked up in truth tables: pair_table for two inputs, table over the mask of the values seen otherwise"""
+    table: Tuple[Value, ...] = ()
+    pair_table: Tuple[Tuple[Value, ...], ...] = ()
+
+    def evaluate(self, values: List[Value]) -> Value:
+        if len(values) == 2:
+            return self.pair_table[values[0]][values[1]]
+        mask = 0
+        for value in values:
+            mask |= value_bits[value]
+        return self.table[mask]
+
+
+class AndGate(TableGate):
+    table = and_table
+    pair_table = and_pairs
+
     def __init__(self, name):
         super().__init__(name)
         self.type = "AND"
 
-    def logic(self) -> Value:
-        self._reset_logic()
-        for node in self.input_nodes:
-            if node.value is value_0:
-                return value_0
-            self.__dict__[node.value.key] = True
-        return self._logic(self._d, self._dprime, self._unknown)
-
-    @staticmethod
-    @lru_cache(8)
-    def _logic(_d, _dprime, _unknown):
-        if _d and _dprime:
-            return value_0
-        elif _unknown:
-            return value_U
-        elif _d:
-            return value_D
-        elif _dprime:
-            return value_DP
-        return value_1
-
 
 class NandGate(AndGate):
+    table = nand_table
+    pair_table = nand_pairs
+
     def __init__(self, name):
         super().__init__(name)
         self.type = "NAND"
 
-    def logic(self) -> Value:
-        return ~(super().logic())
 
+class OrGate(TableGate):
+    table = or_table
+    pair_table = or_pairs
 
-class OrGate(Gate):
     def __init__(self, name):
         super().__init__(name)
         self.type = "OR"
 
-    def logic(self) -> Value:
-        self._reset_logic()
-        for node in self.input_nodes:
-            if node.value is value_1:
-                return value_1
-            self.__dict__[node.value.key] = True
-        return self._logic(self._d, self._dprime, self._unknown)
-
-    @staticmethod
-    @lru_cache(25)
-    def _logic(_d, _dprime, _unknown):
-        if _d and _dprime:
-            return value_1
-        elif _unknown:
-            return value_U
-        elif _d:
-            return value_D
-        elif _dprime:
-            return value_DP
-        else:
-            return value_0
-
 
 class NorGate(OrGate):
+    table = nor_table
+    pair_table = nor_pairs
+
     def __init__(self, name):
         super().__init__(name)
         self.type = "NOR"
 
-    def logic(self) -> Value:
-        return ~(super().logic())
-
 
 class XorGate(Gate):
     def __init__(self, name):
         super().__init__(name)
         self.type = "XOR"
 
-    _xor_map = {
-        value_1: True,
-        value_DP: True,
-        value_D: True
-    }
-
-    def logic(self) -> Value:
-        self._reset_logic()
-        d_acceptable = True
-        dprime_acceptable = True
-        for node in self.input_nodes:
-            if self._one and node.value is value_1:
-                return value_0
-            elif self._dprime and node.value is value_DP:
-                dprime_acceptable = False
-            elif self._dprime and node.value is value_D:
-                d_acceptable = False
-            self.__dict__[node.value.key] = True
-        return self._logic(self._one, self._d, self._dprime, self._unknown,
-                           d_acceptable, dprime_acceptable)
-
-    @staticmethod
-    @lru_cache(64)
-    def _logic(one, d, dprime, unknown, d_acceptable, dprime_acceptable):
-        if unknown:
-            return value_U
-        if dprime and d:
-            if one:
-                return value_0
-            elif d_acceptable and dprime_acceptable:
-                return value_1
-            elif d_acceptable:
-                return value_D
-            elif dprime_acceptable:
-                return value_DP
-            else:
-                return value_0
-        elif dprime:
-            if one:
-                return value_D
-            elif dprime_acceptable:
-                return value_DP
-            else:
-                return value_0
-        elif d:
-            if one:
-                return value_DP
-            elif d_acceptable:
-                return value_D
-            else:
-                return value_0
-        else:
-            return value_0
+    def evaluate(self, values: List[Value]) -> Value:
+        result = value_0
+        for value in values:
+            result = xor_pairs[result][value]
+        return result
 
 
 class XnorGate(XorGate):
@@ -426,8 +468,8 @@ class XnorGate(XorGate):
         super().__init__(name)
         self.type = "XNOR"
 
-    def logic(self) -> Value:
-        return ~(super(XnorGate, self).logic())
+    def evaluate(self, values: List[Value]) -> Value:
+        return invert_table[super(XnorGate, self).evaluate(values)]
 
 
 class BuffGate(Gate):
@@ -435,8 +477,8 @@ class BuffGate(Gate):
         super(BuffGate, self).__init__(name)
         self.type = "BUFF"
 
-    def logic(self) -> Value:
-        return self.input_nodes[0].value
+    def evaluate(self, values: List[Value]) -> Value:
+        return values[0]
 
 
 class NotGate(BuffGate):
@@ -444,8 +486,8 @@ class NotGate(BuffGate):
         super().__init__(name)
         self.type = "NOT"
 
-    def logic(self) -> Value:
-        return ~self.input_nodes[0].value
+    def evaluate(self, values: List[Value]) -> Value:
+        return invert_table[values[0]]
 
 
 class FlipFlop(Gate):
@@ -455,8 +497,8 @@ class FlipFlop(Gate):
         self.data = value_U
         self.data_new = value_U
 
-    def logic(self) -> Value:
-        return self.input_nodes[0].value
+    def evaluate(self, values: List[Value]) -> Value:
+        return values[0]
 
     @property
     def value(self) -> Value:
@@ -480,3 +522,6 @@ class FlipFlop(Gate):
     def clear(self):
         self.data = self.node.vector_assignment
         self.data_new = self.node.vector_assignment
+
+    def restore(self, value: Value):
+        self.data = self.data_new = value
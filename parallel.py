@@ -0,0 +1,367 @@
+from typing import List, Dict, Tuple, Iterable, Iterator, Callable, Sequence, Set, Optional
+from nodes import Value, value_0, value_1, value_U
+from faults import Fault
+from testvector import TestVector
+from array_netlist import ArrayNetlist, gate_names
+
+# A net is held as two rails of bits, one lane per test vector:
+#   ones:  lane is set if the net is 1
+#   zeros: lane is set if the net is 0
+# A lane set in neither rail is U. Python ints give us as many lanes as we want.
+Rails = Tuple[int, int]
+
+
+def _and(ones: List[int], zeros: List[int], fanin: Sequence[int]) -> Rails:
+    one, zero = -1, 0
+    for i in fanin:
+        one &= ones[i]
+        zero |= zeros[i]
+    return one, zero
+
+
+def _nand(ones: List[int], zeros: List[int], fanin: Sequence[int]) -> Rails:
+    one, zero = _and(ones, zeros, fanin)
+    return zero, one
+
+
+def _or(ones: List[int], zeros: List[int], fanin: Sequence[int]) -> Rails:
+    one, zero = 0, -1
+    for i in fanin:
+        one |= ones[i]
+        zero &= zeros[i]
+    return one, zero
+
+
+def _nor(ones: List[int], zeros: List[int], fanin: Sequence[int]) -> Rails:
+    one, zero = _or(ones, zeros, fanin)
+    return zero, one
+
+
+def _xor(ones: List[int], zeros: List[int], fanin: Sequence[int]) -> Rails:
+    one, zero = 0, -1
+    for i in fanin:
+        o, z = ones[i], zeros[i]
+        one, zero = (one & z) | (zero & o), (one & o) | (zero & z)
+    return one, zero
+
+
+def _xnor(ones: List[int], zeros: List[int], fanin: Sequence[int]) -> Rails:
+    one, zero = _xor(ones, zeros, fanin)
+    return zero, one
+
+
+def _buff(ones: List[int], zeros: List[int], fanin: Sequence[int]) -> Rails:
+    return ones[fanin[0]], zeros[fanin[0]]
+
+
+def _not(ones: List[int], zeros: List[int], fanin: Sequence[int]) -> Rails:
+    return zeros[fanin[0]], ones[fanin[0]]
+
+
+def _wire(ones: List[int], zeros: List[int], fanin: Sequence[int]) -> Rails:
+    return 0, 0
+
+
+gate_functions: Dict[str, Callable[[List[int], List[int], Sequence[int]], Rails]] = {
+    "AND": _and, "NAND": _nand, "OR": _or, "NOR": _nor, "XOR": _xor, "XNOR": _xnor,
+    "BUFF": _buff, "NOT": _not, "WIRE": _wire
+}
+
+
+def pack(test_vectors: Sequence[TestVector], width: int) -> List[Rails]:
+    """Transpose test vectors into one pair of rails per bit position"""
+    return TestVector.lanes(test_vectors, width)
+
+
+def unpack(rails: Rails, lane: int) -> Value:
+    one, zero = rails
+    if one >> lane & 1:
+        return value_1
+    elif zero >> lane & 1:
+        return value_0
+    else:
+        return value_U
+
+
+# A fault compiled against the schedule: the net whose good value activates the fault, the stuck-at value,
+# the slot whose rails are forced, and the gates downstream of that slot in evaluation order (None for a flip flop
+# fault under scan, see ScanParallelSimulator)
+CompiledFault = Tuple[int, int, int, Optional[List[Tuple[int, Callable, Tuple[int, ...]]]]]
+
+
+class ParallelSimulator:
+    """
+    Bit-parallel simulation. Every gate is evaluated once per batch of vectors, with each vector
+    occupying one bit lane of the rails.
+
+    Faults are simulated with parallel-pattern single-fault propagation (PPSFP): a fault is injected
+    once per batch and only its fanout cone is re-evaluated against the cached good machine rails.
+    """
+    word_size = 256
+
+    def __init__(self, netlist: ArrayNetlist, kernel: Optional[Callable] = None):
+        self.netlist = netlist
+        # Generated good machine function replacing the walk over the schedule, see codegen.py
+        self.kernel = kernel
+        self.index: Dict[str, int] = netlist.index
+        # Rails of a faulty input pin are forced in this extra slot, past the last net
+        self.pin_slot = len(netlist)
+        self.input_indices: List[int] = netlist.inputs.tolist()
+        self.output_indices: List[int] = netlist.outputs.tolist()
+        self.flip_flop_indices: List[int] = netlist.flip_flops.tolist()
+        fanin = netlist.fanin_lists()
+        gate_types = netlist.gate_types.tolist()
+        self.schedule: List[Tuple[int, Callable, Tuple[int, ...]]] = [
+            (n, gate_functions[gate_names[gate_types[n]]], tuple(fanin[n])) for n in netlist.order.tolist()
+        ]
+        self.position: Dict[int, int] = {entry[0]: n for n, entry in enumerate(self.schedule)}
+        self.fanout: List[List[int]] = netlist.fanout_lists()
+        self._cones: Dict[int, List[Tuple[int, Callable, Tuple[int, ...]]]] = {}
+        self._compiled_faults: Dict[Fault, CompiledFault] = {}
+
+    def simulate(self, test_vectors: Sequence[TestVector]) -> Tuple[List[int], List[int]]:
+        """Simulate every vector at once; returns the ones and zeros rails of every net"""
+        if self.kernel is not None:
+            rails = pack(test_vectors, len(self.input_indices))
+            return self.kernel([one for one, _ in rails], [zero for _, zero in rails])
+        ones = [0] * (self.pin_slot + 1)
+        zeros = [0] * (self.pin_slot + 1)
+        for n, (one, zero) in zip(self.input_indices, pack(test_vectors, len(self.input_indices))):
+            ones[n] = one
+            zeros[n] = zero
+        for n, function, fanin in self.schedule:
+            ones[n], zeros[n] = function(ones, zeros, fanin)
+        return ones, zeros
+
+    def output_values(self, test_vectors: Sequence[TestVector]) -> List[List[Value]]:
+        """The primary output values of each test vector"""
+        ones, zeros = self.simulate(test_vectors)
+        return [
+            [unpack((ones[n], zeros[n]), lane) for n in self.output_indices]
+            for lane in range(len(test_vectors))
+        ]
+
+    def cone(self, net: int) -> List[Tuple[int, Callable, Tuple[int, ...]]]:
+        """The scheduled gates driven, directly or not, by the given net, in evaluation order"""
+        try:
+            return self._cones[net]
+        except KeyError:
+            pass
+        positions: Set[int] = set()
+        frontier = [net]
+        while frontier:
+            for output_net in self.fanout[frontier.pop()]:
+                position = self.position.get(output_net)
+                if position is not None and position not in positions:
+                    positions.add(position)
+                    frontier.append(output_net)
+        cone = self._cones[net] = [self.schedule[position] for position in sorted(positions)]
+        return cone
+
+    def compile_fault(self, fault: Fault) -> CompiledFault:
+        try:
+            return self._compiled_faults[fault]
+        except KeyError:
+            pass
+        stuck_at = 1 if fault.stuck_at is value_1 else 0
+        node = self.index[fault.node.name]
+        if fault.input_node is None:
+            compiled = (node, stuck_at, node, self.cone(node))
+        else:
+            source = self.index[fault.input_node.name]
+            position = self.position.get(node)
+            if position is None:
+                # The faulty pin belongs to a flip flop, which is never evaluated here
+                cone = []
+            else:
+                _, function, fanin = self.schedule[position]
+                pin = fanin.index(source)
+                fanin = (*fanin[:pin], self.pin_slot, *fanin[pin + 1:])
+                cone = [(node, function, fanin), *self.cone(node)]
+            compiled = (source, stuck_at, self.pin_slot, cone)
+        self._compiled_faults[fault] = compiled
+        return compiled
+
+    def detect(self, fault: Fault, ones: List[int], zeros: List[int],
+               bad_ones: List[int], bad_zeros: List[int], unknown: bool) -> int:
+        """
+        Lanes in which the fault reaches a primary output. bad_ones and bad_zeros must hold a copy of the
+        good machine rails; they are restored before returning.
+        """
+        detected = 0
+        for errors in self.output_errors(fault, ones, zeros, bad_ones, bad_zeros, unknown):
+            detected |= errors
+        return detected
+
+    def output_errors(self, fault: Fault, ones: List[int], zeros: List[int],
+                      bad_ones: List[int], bad_zeros: List[int], unknown: bool) -> List[int]:
+        """The lanes in which the fault flips each primary output, with the same contract as detect"""
+        source, stuck_at, slot, cone = self.compile_fault(fault)
+        # A stuck-at line only differs from the good machine where the good value is known
+        defined = ones[source] | zeros[source]
+        if stuck_at:
+            bad_ones[slot], bad_zeros[slot] = defined, 0
+        else:
+            bad_ones[slot], bad_zeros[slot] = 0, defined
+        if unknown:
+            errors = self._detect_unknown(source, slot, cone, ones, zeros, bad_ones, bad_zeros)
+        else:
+            for n, function, fanin in cone:
+                bad_ones[n], bad_zeros[n] = function(bad_ones, bad_zeros, fanin)
+            errors = [(ones[n] & bad_zeros[n]) | (zeros[n] & bad_ones[n]) for n in self.output_indices]
+        bad_ones[slot], bad_zeros[slot] = ones[slot], zeros[slot]
+        for n, _, _ in cone:
+            bad_ones[n], bad_zeros[n] = ones[n], zeros[n]
+        return errors
+
+    def observable(self, net: int, ones: List[int], zeros: List[int],
+                   bad_ones: List[int], bad_zeros: List[int]) -> int:
+        """
+        Lanes in which flipping the net flips a primary output; the rails must be two-valued. bad_ones and
+        bad_zeros must hold a copy of the good machine rails; they are restored before returning.
+        """
+        cone = self.cone(net)
+        bad_ones[net], bad_zeros[net] = zeros[net], ones[net]
+        for n, function, fanin in cone:
+            bad_ones[n], bad_zeros[n] = function(bad_ones, bad_zeros, fanin)
+        detected = 0
+        for n in self.output_indices:
+            detected |= (ones[n] & bad_zeros[n]) | (zeros[n] & bad_ones[n])
+        bad_ones[net], bad_zeros[net] = ones[net], zeros[net]
+        for n, _, _ in cone:
+            bad_ones[n], bad_zeros[n] = ones[n], zeros[n]
+        return detected
+
+    def _detect_unknown(self, source: int, slot: int, cone: List[Tuple[int, Callable, Tuple[int, ...]]],
+                        ones: List[int], zeros: List[int], bad_ones: List[int], bad_zeros: List[int]) -> List[int]:
+        """
+        Five-valued logic has no value for a net that is known in one machine but not the other, so such
+        a net becomes U in both. Following that requires evaluating the good machine in the cone as well.
+        """
+        good_ones = ones[:]
+        good_zeros = zeros[:]
+        good_ones[slot], good_zeros[slot] = ones[source], zeros[source]
+        for n, function, fanin in cone:
+            good_one, good_zero = function(good_ones, good_zeros, fanin)
+            bad_one, bad_zero = function(bad_ones, bad_zeros, fanin)
+            known = (good_one | good_zero) & (bad_one | bad_zero)
+            good_ones[n], good_zeros[n] = good_one & known, good_zero & known
+            bad_ones[n], bad_zeros[n] = bad_one & known, bad_zero & known
+        return [(good_ones[n] & bad_zeros[n]) | (good_zeros[n] & bad_ones[n]) for n in self.output_indices]
+
+    def detection_masks(self, test_vectors: Sequence[TestVector], faults: Iterable[Fault],
+                        drop: bool = False) -> Dict[Fault, int]:
+        """
+        For every detected fault, the lanes (indices into test_vectors) of the vectors that detect it.
+        With drop, a fault is no longer simulated after the word in which it was first detected.
+        """
+        masks: Dict[Fault, int] = {}
+        remaining = list(faults)
+        for start in range(0, len(test_vectors), self.word_size):
+            batch = test_vectors[start:start + self.word_size]
+            ones, zeros = self.simulate(batch)
+            lanes = (1 << len(batch)) - 1
+            unknown = any(~(ones[n] | zeros[n]) & lanes for n in range(self.pin_slot))
+            bad_ones, bad_zeros = ones[:], zeros[:]
+            for fault in remaining:
+                detected = self.detect(fault, ones, zeros, bad_ones, bad_zeros, unknown)
+                if detected:
+                    masks[fault] = masks.get(fault, 0) | detected << start
+            if drop:
+                remaining = [fault for fault in remaining if fault not in masks]
+        return masks
+
+    def output_error_masks(self, test_vectors: Sequence[TestVector],
+                           faults: Iterable[Fault]) -> Iterator[Tuple[int, Iterator[List[int]]]]:
+        """
+        For every word of test_vectors, the index of its first vector and the output_errors of each fault, which
+        have to be consumed before the next word
+        """
+        for start in range(0, len(test_vectors), self.word_size):
+            batch = test_vectors[start:start + self.word_size]
+            ones, zeros = self.simulate(batch)
+            lanes = (1 << len(batch)) - 1
+            unknown = any(~(ones[n] | zeros[n]) & lanes for n in range(self.pin_slot))
+            bad_ones, bad_zeros = ones[:], zeros[:]
+            yield start, (self.output_errors(fault, ones, zeros, bad_ones, bad_zeros, unknown) for fault in faults)
+
+    def fault_coverage_all(self, test_vectors: Sequence[TestVector],
+                           faults: Iterable[Fault]) -> List[Tuple[TestVector, List[Fault]]]:
+        """Every fault detected by each test vector"""
+        detected: List[List[Fault]] = [[] for _ in test_vectors]
+        for fault, mask in self.detection_masks(test_vectors, faults).items():
+            while mask:
+                lane = mask & -mask
+                detected[lane.bit_length() - 1].append(fault)
+                mask ^= lane
+        return list(zip(test_vectors, detected))
+
+    def fault_coverage_list(self, test_vectors: Sequence[TestVector],
+                            remaining_faults: Set[Fault]) -> List[Tuple[TestVector, List[Fault]]]:
+        """The faults first detected by each test vector; detected faults are removed from remaining_faults"""
+        detected: List[List[Fault]] = [[] for _ in test_vectors]
+        for fault, mask in self.detection_masks(test_vectors, remaining_faults, drop=True).items():
+            detected[(mask & -mask).bit_length() - 1].append(fault)
+            remaining_faults.discard(fault)
+        return list(zip(test_vectors, detected))
+
+
+class ScanParallelSimulator(ParallelSimulator):
+    """
+    Bit-parallel full scan simulation, giving the results of ScanCircuitSimulator. Flip flop outputs are
+    pseudo-primary inputs, loaded from each vector after the primary inputs, and the D inputs of the flip flops
+    are pseudo-primary outputs, scanned out after the primary outputs once the flip flops capture them.
+
+    Both machines are three-valued: a stuck-at line is forced in every lane, U lanes included, and a fault is
+    detected wherever a scanned out value differs from the good one. A fault on a flip flop, or on its D pin,
+    only changes the value the flip flop captures.
+    """
+
+    def __init__(self, netlist: ArrayNetlist):
+        # The kernels only load the primary inputs, so the schedule is always walked
+        super().__init__(netlist)
+        fanin = netlist.fanin_lists()
+        self.flip_flops: Set[int] = set(self.flip_flop_indices)
+        # The nets scanned out, and the nets their values are captured from
+        self.scan_out_indices: List[int] = self.output_indices + self.flip_flop_indices
+        self.output_indices = [fanin[n][0] if n in self.flip_flops else n for n in self.scan_out_indices]
+        self.input_indices = self.input_indices + self.flip_flop_indices
+        # Lanes of the vectors last simulated, which the stuck-at lines are forced in
+        self.lanes = 0
+
+    def simulate(self, test_vectors: Sequence[TestVector]) -> Tuple[List[int], List[int]]:
+        self.lanes = (1 << len(test_vectors)) - 1
+        return super().simulate(test_vectors)
+
+    def compile_fault(self, fault: Fault) -> CompiledFault:
+        """Faults on flip flops have no cone, as they never reach the combinational logic"""
+        try:
+            return self._compiled_faults[fault]
+        except KeyError:
+            pass
+        node = self.index[fault.node.name]
+        if node not in self.flip_flops:
+            return super().compile_fault(fault)
+        compiled = self._compiled_faults[fault] = (node, 1 if fault.stuck_at is value_1 else 0, node, None)
+        return compiled
+
+    def output_errors(self, fault: Fault, ones: List[int], zeros: List[int],
+                      bad_ones: List[int], bad_zeros: List[int], unknown: bool) -> List[int]:
+        """The lanes in which the fault changes each scanned out value; unknown makes no difference here"""
+        source, stuck_at, slot, cone = self.compile_fault(fault)
+        if cone is None:
+            return [
+                self.lanes & ~(ones[captured] if stuck_at else zeros[captured]) if n == source else 0
+                for n, captured in zip(self.scan_out_indices, self.output_indices)
+            ]
+        if stuck_at:
+            bad_ones[slot], bad_zeros[slot] = self.lanes, 0
+        else:
+            bad_ones[slot], bad_zeros[slot] = 0, self.lanes
+        for n, function, fanin in cone:
+            bad_ones[n], bad_zeros[n] = function(bad_ones, bad_zeros, fanin)
+        errors = [(ones[n] ^ bad_ones[n]) | (zeros[n] ^ bad_zeros[n]) for n in self.output_indices]
+        bad_ones[slot], bad_zeros[slot] = ones[slot], zeros[slot]
+        for n, _, _ in cone:
+            bad_ones[n], bad_zeros[n] = ones[n], zeros[n]
+        return errors
@@ -3,6 +3,19 @@ from itertools import zip_longest
 
 
 class ScanCircuitSimulator(CircuitSimulator):
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        # The good value scanned out of every scan out node by the last scan_test
+        self.expected: Dict[ScanNode, Value] = {}
+
+    @functools.cached_property
+    def parallel_simulator(self) -> ScanParallelSimulator:
+        return ScanParallelSimulator(self.netlist)
+
+    @functools.cached_property
+    def engines(self) -> Dict[str, Any]:
+        """The deductive, concurrent and critical path engines do not know about scan"""
+        return {"serial": self, "parallel": self.parallel_simulator, "ppsfp": self.parallel_simulator}
 
     @staticmethod
     def identical(first: List[Value], second: List[Value]) -> bool:
@@ -17,7 +30,7 @@ class ScanCircuitSimulator(CircuitSimulator):
     def scan_out(self) -> List[Value]:
         return [node.value for node in self.nodes.scan_out_nodes]
 
-    def propagate(self, path: Iterable[Set['ScanNode']]):
+    def propagate(self, path: Iterable[List['ScanNode']]):
         for nodes in path:
             for node in nodes:
                 node.logic()
@@ -28,103 +41,79 @@ class ScanCircuitSimulator(CircuitSimulator):
             node.update()
 
     @contextmanager
-    def apply_fault(self, fault: Fault):
+    def apply_fault(self, fault: Fault) -> Generator[List['ScanNode'], None, None]:
+        """
+        Lay the fault over the good machine left by scan_test, propagating it through its cone and capturing it
+        into the flip flops the cone reaches; yields the scan out nodes written. Every other flip flop would
+        capture its good value, so only these are evaluated, and only the nodes written are restored after.
+        """
         self.fault = fault
         if fault.input_node:
             self.nodes.faulty_node = ScanInputFault(fault.node, fault.input_node, fault.stuck_at)
         else:
             fault.node.stuck_at = fault.stuck_at
             self.nodes.faulty_node = fault.node
-        self.propagate(self.nodes.faulty_node.propagation_path)
-        self.nodes.capture()
-        yield
-        self.nodes.faulty_node.local_reset()
-        self.nodes.reset_state()
-
-    def detect_fault(self, fault: Fault) -> List[Value]:
-        with self.apply_fault(fault):
-            return self.scan_out()
-
-    def detect_faults(self, tv: TestVector) -> List[Fault]:
+        faulty_node = self.nodes.faulty_node
+        propagate(faulty_node.propagation_path)
+        for flip_flop in faulty_node.captured_by:
+            flip_flop.logic()
+            flip_flop.update()
+            flip_flop.gate.capture()
+        yield faulty_node.observed
+        faulty_node.local_reset()
+        self.nodes.restore(faulty_node.written)
+
+    def scan_test(self, tv: TestVector) -> List[Value]:
+        """
+        Scan the vector in, capture, and return what is scanned out. The good machine is left as it was before
+        the capture, for apply_fault, and its scan out values are kept in expected.
+        """
         self.scan_in(tv)
         self.propagate(self.nodes.full_propagation_path)
         self.nodes.save_state()
-        # self.propagate(self.nodes.full_propagation_path)
         self.nodes.capture()
         scan_out = self.scan_out()
+        self.expected = dict(zip(self.nodes.scan_out_nodes, scan_out))
         self.nodes.reset_state()
-        # return [
-        #     fault for fault in self.faults
-        #     if not self.identical(scan_out, self.detect_fault(fault))
-        # ]
-        result = [
-            fault for fault in self.faults
-            if not self.identical(scan_out, self.detect_fault(fault))
-        ]
-        return result
+        return scan_out
 
+    def detect_fault(self, fault: Fault) -> List[Value]:
+        """The values scanned out with the fault present, after scan_test"""
+        with self.apply_fault(fault) as observed:
+            changed = {node: node.value for node in observed}
+        return [changed.get(node, self.expected[node]) for node in self.nodes.scan_out_nodes]
 
+    def fault_detected(self, fault: Fault) -> bool:
+        with self.apply_fault(fault) as observed:
+            return any(node.value is not self.expected[node] for node in observed)
 
+    def detect_faults(self, tv: TestVector, faults: Iterable[Fault] = None) -> List[Fault]:
+        self.scan_test(tv)
+        return [fault for fault in (self.faults if faults is None else faults) if self.fault_detected(fault)]
 
     def detect_and_eliminate_faults(self, tv: TestVector, remaining_faults: Set[Fault]) -> List[Fault]:
-        known_faults = self.tv_lookup[tv]
-        detected_faults = remaining_faults.intersection(known_faults)
-        undetected_faults = remaining_faults.difference(known_faults)
-        self.scan_in(tv)
-        self.propagate(self.nodes.full_propagation_path)
-        self.nodes.save_state()
-        self.nodes.capture()
-        scan_out = self.scan_out()
-        self.nodes.reset_state()
-        # result = [
-        #     fault for fault in remaining_faults
-        #     if not self.identical(scan_out, self.detect_fault(fault))
-        # ]
-        detected_faults.update(
-            fault for fault in undetected_faults
-            if not self.identical(scan_out, self.detect_fault(fault))
-        )
+        detected_faults = self.known_faults(tv, remaining_faults)
+        if detected_faults is None:
+            self.scan_test(tv)
+            detected_faults = [fault for fault in remaining_faults if self.fault_detected(fault)]
         remaining_faults.difference_update(detected_faults)
-        known_faults.update(detected_faults)
-        return list(detected_faults)
-
-    def compile(self, gates: CircuitSimulator.LineParser.Gates):
-        self.nodes = self.Nodes()
-        for name, gate in gates.gates.items():
-            node = ScanNode(gate)
-            node.type = gates.node_types.get(name, "INTERM.")
-            if node.type == "INTERM.":
-                self.nodes.intermediate_nodes[name] = node
-            elif node.type == "INPUT":
-                self.nodes.input_nodes[name] = node
-            elif node.type == "OUTPUT":
-                self.nodes.output_nodes[name] = node
-            if node.gate.type == "DFF":
-                self.nodes.flip_flops.append(node)
-        for name, input_names in gates.inputs.items():
-            self.nodes[name].input_nodes = [self.nodes[input_name] for input_name in input_names]
-            for input_name in input_names:
-                self.nodes[input_name].output_nodes.append(self.nodes[name])
-        for name, node_type in gates.node_types.items():
-            self.nodes[name].type = node_type
+        return detected_faults
 
     class Nodes(CircuitSimulator.Nodes):
-        def __init__(self):
-            self.input_nodes: OrderedDict[str, ScanNode] = collections.OrderedDict()
-            self.intermediate_nodes: Dict[str, ScanNode] = {}
-            self.output_nodes: OrderedDict[str, ScanNode] = collections.OrderedDict()
-            self.flip_flops: List[ScanNode] = []
-            self.faulty_node: Union[InputFault, Node, None] = None
-            self._state: List[Value] = []
+        def make_node(self, gate: Gate) -> 'ScanNode':
+            return ScanNode(gate)
 
         def save_state(self):
-            self._state = [node.value for node in self]
+            for node in self:
+                node.saved = node.value
+
+        def restore(self, nodes: Iterable['ScanNode']):
+            """Put back the values of the given nodes as of save_state"""
+            for node in nodes:
+                node.gate.restore(node.saved)
 
         def reset_state(self):
-            for ff in self.flip_flops:
-                ff.gate.clear()
-            for node, value in zip(self, self._state):
-                node.value = value
+            self.restore(self)
 
         def clear(self):
             for flip_flop in self.flip_flops:
@@ -142,6 +131,9 @@ class ScanNode(Node):
         self.type = "INTERM."
         self.corridor = False
         self.implication = value_U
+        self.level = 0
+        # The value as of the last Nodes.save_state
+        self.saved: Value = value_U
 
     def __repr__(self):
         return self.name
@@ -203,16 +195,31 @@ class ScanNode(Node):
         else:
             return value
 
+
+    @functools.cached_property
+    def captured_by(self) -> List['ScanNode']:
+        """The flip flops capturing a value from the propagation path, the only ones a fault here reaches"""
+        flip_flops: Dict[ScanNode, None] = {}
+        for nodes in self.propagation_path:
+            for node in nodes:
+                if isinstance(node.gate, FlipFlop):
+                    flip_flops[node] = None
+                    continue
+                for output_node in node.output_nodes:
+                    if isinstance(output_node.gate, FlipFlop):
+                        flip_flops[output_node] = None
+        return list(flip_flops)
+
+    @functools.cached_property
+    def written(self) -> List['ScanNode']:
+        """Every node a fault here writes to: the propagation path and the flip flops capturing from it"""
+        captured = set(self.captured_by)
+        return [node for nodes in self.propagation_path for node in nodes if node not in captured] + self.captured_by
+
     @functools.cached_property
-    def propagation_path(self):
-        result = [frontier := {self}]
-        while (frontier := {
-            output_node for node
-            in frontier
-            for output_node in node.outputs_that_are_not_flip_flops
-        }):
-            result.append(frontier)
-        return result
+    def observed(self) -> List['ScanNode']:
+        """The nodes written that are scanned out"""
+        return [node for node in self.written if node.type == "OUTPUT" or isinstance(node.gate, FlipFlop)]
 
 
 class ScanInputFault(ScanNode):
@@ -255,5 +262,72 @@ class ScanInputFault(ScanNode):
         return self.propagate_fault(self.genuine_node.value, self.stuck_at)
 
     @property
-    def propagation_path(self) -> Generator[Set['Node'], None, None]:
+    def propagation_path(self) -> List[List['ScanNode']]:
         return self.output_nodes[0].propagation_path
+
+    @property
+    def captured_by(self) -> List['ScanNode']:
+        return self.output_nodes[0].captured_by
+
+    @property
+    def written(self) -> List['ScanNode']:
+        return self.output_nodes[0].written
+
+    @property
+    def observed(self) -> List['ScanNode']:
+        return self.output_nodes[0].observed
+
+
+class ScanEngineTest(unittest.TestCase):
+    # Two inputs and four flip flops, so vectors are six wide: q1 is both a primary output and the D input of q2,
+    # q3 captures the primary output y, and q3 and q4 feed each other, through z one way and w and y the other
+    bench = '\n'.join([
+        "INPUT(a)", "INPUT(b)", "OUTPUT(q1)", "OUTPUT(y)",
+        "q1 = DFF(a)", "q2 = DFF(q1)", "q3 = DFF(y)", "q4 = DFF(z)",
+        "y = NAND(q2, b, w)", "z = XOR(q3, a)", "w = OR(q4, b)"
+    ])
+
+    def setUp(self) -> None:
+        super(ScanEngineTest, self).setUp()
+        with tempfile.TemporaryDirectory() as directory:
+            bench = os.path.join(directory, "scan.bench")
+            with open(bench, 'w') as f:
+                f.write(self.bench)
+            self.circuit = ScanCircuitSimulator(bench=bench)
+
+    def test_parallel_scan_fault_coverage(self):
+        circuit = self.circuit
+        width = len(circuit.nodes.scan_in_nodes)
+        self.assertEqual(width, 6)
+        test_vectors = [TestVector(format(n, f"0{width}b")) for n in range(1 << width)]
+        test_vectors += [TestVector("U1U0U1"), TestVector("0UU1U0")]
+        self.assertEqual(
+            [(tv, set(faults)) for tv, faults in circuit.fault_coverage_all(test_vectors, circuit.faults)],
+            [(tv, set(faults)) for tv, faults in circuit.parallel_simulator.fault_coverage_all(
+                test_vectors, circuit.faults
+            )],
+            'parallel scan engine disagrees with serial scan'
+        )
+
+    def test_signature_index_per_simulator(self):
+        with tempfile.TemporaryDirectory() as directory:
+            bench = os.path.join(directory, "scan.bench")
+            with open(bench, 'w') as f:
+                f.write(self.bench)
+            test_vectors = [TestVector("011010"), TestVector("101101")]
+            scan_index = ScanCircuitSimulator(bench=bench, cache=directory).signature_index(test_vectors)
+            index = CircuitSimulator(bench=bench, cache=directory).signature_index(test_vectors)
+        self.assertEqual(scan_index.outputs, len(self.circuit.parallel_simulator.output_indices))
+        self.assertEqual(index.outputs, len(self.circuit.nodes.output_nodes))
+
+    def test_fault_restores_good_machine(self):
+        def state() -> List[Value]:
+            return [node.value for node in self.circuit.nodes] + \
+                [flip_flop.value_new for flip_flop in self.circuit.nodes.flip_flops]
+
+        for test_vector in (TestVector("011010"), TestVector("1U0110")):
+            self.circuit.scan_test(test_vector)
+            good = state()
+            for fault in self.circuit.fault_list:
+                self.circuit.fault_detected(fault)
+                self.assertEqual(state(), good, f'{fault} left the good machine changed')
@@ -0,0 +1,208 @@
+from typing import List, Dict, Tuple, Iterable, Sequence, Set, Callable
+from faults import Fault
+from testvector import TestVector
+from array_netlist import ArrayNetlist
+from parallel import ParallelSimulator, pack
+
+
+def sequential_depth(netlist: ArrayNetlist, scanned: Iterable[int] = ()) -> int:
+    """
+    The most flip flops a value passes through between the inputs and the outputs, scanned flip flops being
+    inputs and outputs themselves. A loop of flip flops could be gone around forever, so each strongly connected
+    component of the flip flop graph counts as many flip flops as it has: exact when there are no loops, and
+    never less than the longest simple path otherwise.
+    """
+    scanned = set(scanned)
+    flip_flops = [n for n in netlist.flip_flops.tolist() if n not in scanned]
+    is_flip_flop = set(netlist.flip_flops.tolist())
+    fanout = netlist.fanout_lists()
+    # successors[f] are the flip flops capturing, through combinational logic only, a value f drives
+    successors: Dict[int, List[int]] = {}
+    for flip_flop in flip_flops:
+        reached: Set[int] = set()
+        seen = {flip_flop}
+        frontier = [flip_flop]
+        while frontier:
+            for n in fanout[frontier.pop()]:
+                if n in is_flip_flop:
+                    if n not in scanned:
+                        reached.add(n)
+                elif n not in seen:
+                    seen.add(n)
+                    frontier.append(n)
+        successors[flip_flop] = sorted(reached)
+    # Tarjan's algorithm emits every component after the components it reaches
+    index: Dict[int, int] = {}
+    low: Dict[int, int] = {}
+    stack: List[int] = []
+    on_stack: Set[int] = set()
+    component: Dict[int, int] = {}
+    depths: List[int] = []
+    for root in flip_flops:
+        if root in index:
+            continue
+        work = [(root, 0)]
+        while work:
+            n, child = work.pop()
+            if child == 0:
+                index[n] = low[n] = len(index)
+                stack.append(n)
+                on_stack.add(n)
+            if child < len(successors[n]):
+                work.append((n, child + 1))
+                successor = successors[n][child]
+                if successor not in index:
+                    work.append((successor, 0))
+                elif successor in on_stack:
+                    low[n] = min(low[n], index[successor])
+                continue
+            if work:
+                parent = work[-1][0]
+                low[parent] = min(low[parent], low[n])
+            if low[n] == index[n]:
+                members = []
+                while True:
+                    member = stack.pop()
+                    on_stack.discard(member)
+                    members.append(member)
+                    if member == n:
+                        break
+                depth = len(members) + max((
+                    depths[component[successor]] for member in members for successor in successors[member]
+                    if successor in component
+                ), default=0)
+                for member in members:
+                    component[member] = len(depths)
+                depths.append(depth)
+    return max(depths, default=0)
+
+
+class SequentialSimulator(ParallelSimulator):
+    """
+    Bit-parallel fault simulation of a sequential circuit without full scan. Every pattern is clocked for
+    self.cycles cycles from flip flops at U, the primary inputs held at the pattern for all of them, and each
+    pattern is a lane of its own. Scanned flip flops are loaded from the pattern, after the primary inputs,
+    before the first cycle and scanned out after the last one; the primary outputs are observed every cycle.
+
+    A fault is detected where a faulty machine and the good one both know an observed value and disagree. The
+    faulty machines are simulated one fault at a time, re-evaluating the fanout cone of the fault and of every
+    flip flop whose faulty state differs from the good one. A fault on a flip flop forces its state, and a fault
+    on its D pin the value it captures.
+    """
+
+    def __init__(self, netlist: ArrayNetlist, cycles: int, scan_flip_flops: Iterable[int] = ()):
+        super().__init__(netlist)
+        fanin = netlist.fanin_lists()
+        self.cycles = cycles
+        self.flip_flops: Set[int] = set(self.flip_flop_indices)
+        scan_flip_flops = set(scan_flip_flops)
+        self.scan_flip_flops: List[int] = [n for n in self.flip_flop_indices if n in scan_flip_flops]
+        self.input_indices = self.input_indices + self.scan_flip_flops
+        # Every flip flop and the net it captures
+        self.captures: List[Tuple[int, int]] = [(n, fanin[n][0]) for n in self.flip_flop_indices]
+        self.scan_captures: List[Tuple[int, int]] = [(n, fanin[n][0]) for n in self.scan_flip_flops]
+        # Lanes of the patterns last simulated, which the stuck-at lines are forced in
+        self.lanes = 0
+
+    def simulate_cycles(self, test_vectors: Sequence[TestVector]) -> List[Tuple[List[int], List[int]]]:
+        """The ones and zeros rails of every net in every cycle, the flip flops holding their state"""
+        self.lanes = (1 << len(test_vectors)) - 1
+        ones = [0] * (self.pin_slot + 1)
+        zeros = [0] * (self.pin_slot + 1)
+        for n, (one, zero) in zip(self.input_indices, pack(test_vectors, len(self.input_indices))):
+            ones[n] = one
+            zeros[n] = zero
+        cycles = []
+        for cycle in range(self.cycles):
+            if cycle:
+                previous_ones, previous_zeros = ones, zeros
+                ones, zeros = ones[:], zeros[:]
+                for n, captured in self.captures:
+                    ones[n], zeros[n] = previous_ones[captured], previous_zeros[captured]
+            for n, function, fanin in self.schedule:
+                ones[n], zeros[n] = function(ones, zeros, fanin)
+            cycles.append((ones, zeros))
+        return cycles
+
+    def simulate(self, test_vectors: Sequence[TestVector]) -> Tuple[List[int], List[int]]:
+        """The rails of the last cycle"""
+        return self.simulate_cycles(test_vectors)[-1]
+
+    def cone_of(self, cone: List[Tuple[int, Callable, Tuple[int, ...]]], nets: Iterable[int],
+                forced: int) -> List[Tuple[int, Callable, Tuple[int, ...]]]:
+        """The gates of cone and of the cones of the nets, in evaluation order, but for the forced net"""
+        gates = {self.position[gate[0]]: gate for gate in cone}
+        for net in nets:
+            for gate in self.cone(net):
+                if gate[0] != forced:
+                    gates.setdefault(self.position[gate[0]], gate)
+        return [gates[position] for position in sorted(gates)]
+
+    def detect_sequential(self, fault: Fault, cycles: List[Tuple[List[int], List[int]]],
+                          bad_cycles: List[Tuple[List[int], List[int]]], drop: bool = False) -> int:
+        """
+        Lanes of the patterns detecting the fault. bad_cycles must hold a copy of the rails of every cycle; they
+        are restored before returning. With drop, only the first detecting lane matters, so the cycles stop once
+        no lower lane is left undetected.
+        """
+        lanes = self.lanes
+        source, stuck_at, slot, cone = self.compile_fault(fault)
+        forced = (lanes, 0) if stuck_at else (0, lanes)
+        node = self.index[fault.node.name]
+        # A flip flop fault forces what the flip flop captures; any fault but one on a D pin forces its slot as well
+        captured = node if node in self.flip_flops else None
+        injected = captured is None or fault.input_node is None
+        if not injected:
+            cone = []
+        # Faulty state of the flip flops differing from the good one
+        state: Dict[int, Tuple[int, int]] = {}
+        detected = 0
+        for cycle, ((ones, zeros), (bad_ones, bad_zeros)) in enumerate(zip(cycles, bad_cycles)):
+            gates = self.cone_of(cone, state, slot) if state else cone
+            for n, (one, zero) in state.items():
+                bad_ones[n], bad_zeros[n] = one, zero
+            if injected:
+                bad_ones[slot], bad_zeros[slot] = forced
+            for n, function, fanin in gates:
+                bad_ones[n], bad_zeros[n] = function(bad_ones, bad_zeros, fanin)
+            for n in self.output_indices:
+                detected |= (ones[n] & bad_zeros[n]) | (zeros[n] & bad_ones[n])
+            next_state = {}
+            for n, d in self.captures:
+                one, zero = forced if n == captured else (bad_ones[d], bad_zeros[d])
+                if one != ones[d] or zero != zeros[d]:
+                    next_state[n] = one, zero
+            if cycle == len(cycles) - 1:
+                for n, d in self.scan_captures:
+                    one, zero = next_state.get(n, (ones[d], zeros[d]))
+                    detected |= (ones[d] & zero) | (zeros[d] & one)
+            for n in state:
+                bad_ones[n], bad_zeros[n] = ones[n], zeros[n]
+            bad_ones[slot], bad_zeros[slot] = ones[slot], zeros[slot]
+            for n, _, _ in gates:
+                bad_ones[n], bad_zeros[n] = ones[n], zeros[n]
+            state = next_state
+            undetected = ((detected & -detected) - 1 if detected else lanes) if drop else lanes & ~detected
+            if not undetected:
+                break
+        return detected
+
+    def detection_masks(self, test_vectors: Sequence[TestVector], faults: Iterable[Fault],
+                        drop: bool = False) -> Dict[Fault, int]:
+        """
+        For every detected fault, the lanes (indices into test_vectors) of the patterns that detect it. With drop,
+        a fault is no longer simulated once a pattern has detected it.
+        """
+        masks: Dict[Fault, int] = {}
+        remaining = list(faults)
+        for start in range(0, len(test_vectors), self.word_size):
+            batch = test_vectors[start:start + self.word_size]
+            cycles = self.simulate_cycles(batch)
+            bad_cycles = [(ones[:], zeros[:]) for ones, zeros in cycles]
+            for fault in remaining:
+                detected = self.detect_sequential(fault, cycles, bad_cycles, drop)
+                if detected:
+                    masks[fault] = masks.get(fault, 0) | detected << start
+            if drop:
+                remaining = [fault for fault in remaining if fault not in masks]
+        return masks
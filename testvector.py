@@ -1,133 +1,326 @@
-from typing import List, List, Set, Union, Tuple, Optional, Iterable
+from typing import Dict, List, Set, Union, Tuple, Optional, Iterable, Sequence, Iterator
 import functools
 import itertools
-from nodes import Value
+from nodes import Value, value_0, value_1, value_U
 import unittest
 import copy
+import numpy as np
 
 
 class TestVector:
-    __slots__ = ('values')
+    """
+    A vector of 0s, 1s and Us packed into ints. Position i, counted from the left of the printed vector, is
+    bit width - 1 - i of bits, or U if that bit is set in unknown (with the bit of bits clear). Hashing and
+    equality work on the ints, and a contiguous slice is a shift and a mask.
+    """
+    __slots__ = ('bits', 'width', 'unknown')
+
+    # The characters each rail keeps when packing lanes
+    ones_rail = str.maketrans('U', '0')
+    zeros_rail = str.maketrans('01U', '100')
+
     def __init__(self, values: str = ''):
-        self.values = [Value(int(bit)) for bit in values]
+        self.width = len(values)
+        if not values.strip('01'):
+            self.bits = int(values, 2) if values else 0
+            self.unknown = 0
+        else:
+            if values.strip('01Uu'):
+                raise ValueError(f"Test vector of anything but 0, 1 and U: {values}")
+            values = [Value(int(value) if value in '01' else value) for value in values]
+            self.bits = int(''.join('1' if value is value_1 else '0' for value in values), 2)
+            self.unknown = int(''.join('1' if value is value_U else '0' for value in values), 2)
+
+    @classmethod
+    def packed(cls, bits: int, width: int, unknown: int = 0) -> 'TestVector':
+        obj = cls.__new__(cls)
+        obj.bits = bits
+        obj.width = width
+        obj.unknown = unknown
+        return obj
 
     def __repr__(self):
-        return ''.join([str(value) for value in self.values])
+        if not self.width:
+            return ''
+        result = format(self.bits, f"0{self.width}b")
+        if self.unknown:
+            unknown = format(self.unknown, f"0{self.width}b")
+            result = ''.join('U' if u == '1' else bit for bit, u in zip(result, unknown))
+        return result
 
     def __iter__(self):
-        for value in self.values:
-            yield value
+        for character in repr(self):
+            yield value_U if character == 'U' else value_1 if character == '1' else value_0
 
     def __len__(self):
-        return len(self.values)
+        return self.width
 
-    def __eq__(self, other: Union['TestVector']):
-        for self_bit, other_bit in zip(self, other):
-            if self_bit is not other_bit:
-                return False
-        return True
+    def __eq__(self, other: 'TestVector'):
+        return isinstance(other, TestVector) and \
+            self.bits == other.bits and self.width == other.width and self.unknown == other.unknown
 
     def __int__(self):
-        return int(repr(self), 2)
+        return self.bits
 
     def __hash__(self):
-        return hash(repr(self))
-        # return hash(int(self))
+        return hash((self.bits, self.width, self.unknown))
+
+    def __getitem__(self, item) -> Union['TestVector', Value]:
+        if isinstance(item, slice):
+            start, stop, step = item.indices(self.width)
+            if step != 1:
+                return TestVector.from_values(list(self)[item])
+            width = max(stop - start, 0)
+            shift = self.width - start - width
+            mask = (1 << width) - 1
+            return TestVector.packed(self.bits >> shift & mask, width, self.unknown >> shift & mask)
+        if item < 0:
+            item += self.width
+        if not 0 <= item < self.width:
+            raise IndexError("TestVector index out of range")
+        shift = self.width - 1 - item
+        return value_U if self.unknown >> shift & 1 else value_1 if self.bits >> shift & 1 else value_0
 
-    def __getitem__(self, item) -> 'TestVector':
-        return TestVector.from_values(self.values[item])
+    @property
+    def values(self) -> List[Value]:
+        return list(self)
 
     @classmethod
     def from_values(cls, values: Iterable[Value]):
-        obj = TestVector()
-        obj.values = values
-        return obj
+        bits = unknown = width = 0
+        for value in values:
+            bits = bits << 1 | (value is value_1)
+            unknown = unknown << 1 | (value is value_U)
+            width += 1
+        return cls.packed(bits, width, unknown)
 
     @classmethod
     def from_integers(cls, values: List[int]):
-        obj = TestVector()
-        obj.values = [Value(value) for value in values]
-        return obj
+        return cls.from_values(Value(value) for value in values)
 
+    @staticmethod
+    def lanes(test_vectors: Sequence['TestVector'], width: int) -> List[Tuple[int, int]]:
+        """
+        The ones and zeros rails of every position of the vectors, lane n of a rail holding vector n. The
+        transpose is done on the printed vectors, so it runs in C rather than once per bit; positions
+        past the end of a vector are U.
+        """
+        if not test_vectors:
+            return [(0, 0)] * width
+        printed = [repr(test_vector)[:width].ljust(width, 'U') for test_vector in test_vectors]
+        rails = []
+        for column in zip(*printed):
+            # The first vector is lane 0, the least significant bit
+            column = ''.join(reversed(column))
+            rails.append((int(column.translate(TestVector.ones_rail), 2),
+                          int(column.translate(TestVector.zeros_rail), 2)))
+        return rails
+
+
+class TestVectorBatch(Sequence[TestVector]):
+    """
+    Vectors of one width kept as the packed ints of their bits, all known; a TestVector is only made for a
+    vector that is read, so generating a batch costs no Python object per vector.
+    """
+    __slots__ = ('bits', 'width')
+
+    def __init__(self, bits: List[int], width: int):
+        self.bits = bits
+        self.width = width
 
-class LFSR:
-    h: List[int]
+    def __len__(self):
+        return len(self.bits)
 
-    def __init__(self, q: str):
-        self._q = [int(bit) for bit in q]
+    def __getitem__(self, item) -> Union['TestVectorBatch', TestVector]:
+        if isinstance(item, slice):
+            return TestVectorBatch(self.bits[item], self.width)
+        return TestVector.packed(self.bits[item], self.width)
 
-    def __call__(self, *args, **kwargs) -> List[int]:
-        return self.lfsr_algorithm()
+    def __iter__(self) -> Iterator[TestVector]:
+        packed = TestVector.packed
+        width = self.width
+        return (packed(bits, width) for bits in self.bits)
 
-    @property
-    def q(self) -> List[int]:
-        q = self._q
-        q.reverse()
-        return q
+    def __eq__(self, other):
+        if isinstance(other, TestVectorBatch):
+            return self.width == other.width and self.bits == other.bits
+        return isinstance(other, Sequence) and list(self) == list(other)
 
-    @q.setter
-    def q(self, _q: List[int]):
-        self._q = _q
+    def __repr__(self):
+        return f"TestVectorBatch({list(self)})"
 
-    @classmethod
-    def set_taps(cls, h: Set[int]):
-        cls.h = [1, *(1 if n in h else 0 for n in range(1, 8))]
+    def cut(self, width: int) -> 'TestVectorBatch':
+        """The leading width positions of every vector"""
+        shift = self.width - width
+        return self if not shift else TestVectorBatch([bits >> shift for bits in self.bits], width)
 
-    def lfsr_algorithm(self) -> List[int]:
-        q = self.q
-        h = self.h
-        qprime: List[int] = [q[7] * h[0]]
-        qprime.extend((q[7] * h[n] ^ q[n - 1] for n in range(1, 8)))
-        qprime.reverse()
-        self.q = qprime
-        return qprime
 
+class LFSR:
+    """
+    Linear feedback shift register over GF(2) of any degree, with its state kept as an int. The polynomial is
+    x^degree + 1 plus x^tap for every tap strictly between 0 and degree. In Galois form a step multiplies the
+    state by x modulo the polynomial; in Fibonacci form the state shifts left, taking in the parity of the
+    tapped bits. Either way a step is linear, so any number of steps is a GF(2) matrix, kept as the image of
+    every bit of the state. Jumping ahead is a matrix power, and a run of states for registers of up to 64
+    bits is built by doubling, with one NumPy table lookup per byte of state per doubling. The matrices of
+    powers of two steps, and their tables, are kept by the register; any other matrix is built from them.
+    """
+    Matrix = List[int]
+
+    def __init__(self, degree: int, taps: Iterable[int] = (), state: int = 1, galois: bool = True):
+        self.degree = degree
+        self.mask = (1 << degree) - 1
+        self.taps = set(tap for tap in taps if 0 < tap < degree)
+        self.galois = galois
+        # Bits xored in when the msb leaves, in Galois form, or whose parity enters, in Fibonacci form
+        self.feedback = sum(1 << tap for tap in self.taps) | 1 if galois else \
+            sum(1 << degree - 1 - tap for tap in self.taps) | 1 << degree - 1
+        self.state = state & self.mask
+        # The matrix of 2^k steps, by k, and the byte tables of the matrix of steps, by steps
+        self.powers: List[LFSR.Matrix] = []
+        self.tables: Dict[int, List[np.ndarray]] = {}
+
+    def __call__(self) -> int:
+        self.state = self.step(self.state)
+        return self.state
+
+    def step(self, state: int) -> int:
+        if self.galois:
+            return (state << 1 & self.mask) ^ (self.feedback if state >> self.degree - 1 else 0)
+        return (state << 1 & self.mask) | bin(state & self.feedback).count('1') & 1
+
+    def states(self, count: int) -> List[int]:
+        """The next count states, one step at a time"""
+        return [self() for _ in range(count)]
+
+    def jump(self, steps: int):
+        self.state = self.apply(self.matrix(steps), self.state)
 
-class TestVectorGenerator:
-    def __init__(self, seed: int, input_bits: int, taps: Set[int] = ()):
-        LFSR.set_taps(taps)
-        self.input_bits = input_bits
-        tv_length = self.bits_ceiling(input_bits)
-        binary_seed = format(seed, f"0{self.bits_ceiling(seed.bit_length())}b")
-        repetitions = tv_length // len(binary_seed) + (1 if tv_length % len(binary_seed) else 0)
-        binary_seed = (binary_seed * repetitions)[:tv_length]
-        self.lfsrs = [
-            LFSR(q) for q in (
-                binary_seed[n:n + 8]
-                for n in range(0, tv_length, 8)
+    @staticmethod
+    def apply(matrix: Matrix, state: int) -> int:
+        result = 0
+        for column in matrix:
+            if state & 1:
+                result ^= column
+            state >>= 1
+        return result
+
+    @staticmethod
+    def compose(second: Matrix, first: Matrix) -> Matrix:
+        """The matrix of first followed by second"""
+        return [LFSR.apply(second, column) for column in first]
+
+    def power(self, k: int) -> Matrix:
+        """The matrix of 2^k steps"""
+        while len(self.powers) <= k:
+            self.powers.append(
+                self.compose(self.powers[-1], self.powers[-1]) if self.powers else
+                [self.step(1 << bit) for bit in range(self.degree)]
             )
-        ]
+        return self.powers[k]
+
+    def matrix(self, steps: int = 1) -> Matrix:
+        if steps and not steps & steps - 1:
+            return self.power(steps.bit_length() - 1)
+        result = [1 << bit for bit in range(self.degree)]
+        k = 0
+        while steps:
+            if steps & 1:
+                result = self.compose(self.power(k), result)
+            steps >>= 1
+            k += 1
+        return result
 
-    def __call__(self, *args, **kwargs) -> List[TestVector]:
-        # result = set()
-        # while len(result) < self.tv_count:
-        #     tv = TestVector.from_integers([
-        #         integer for integers in
-        #         (lfsr() for lfsr in self.lfsr)
-        #         for integer in integers
-        #     ])
-        #     if tv[:self.input_bits] not in result:
-        #         result.add(tv)
-
-
-        # result = set()
-        # while len(result) < self.tv_count:
-        #     tv = TestVector.from_integers([
-        #         integer for integers in
-        #         (lfsr() for lfsr in self.lfsrs)
-        #         for integer in integers
-        #     ])
-
-        result = [
-            TestVector.from_integers([
-                integer for integers in
-                (lfsr() for lfsr in self.lfsrs)
-                for integer in integers
-            ])
-            for tv in range(0, self.tv_count)
-        ]
+    @functools.cached_property
+    def dtype(self) -> np.dtype:
+        for dtype in (np.uint8, np.uint16, np.uint32, np.uint64):
+            if self.degree <= np.iinfo(dtype).bits:
+                return np.dtype(dtype)
+        raise ValueError(f"NumPy runs take registers of up to 64 bits, not {self.degree}")
+
+    def byte_tables(self, steps: int) -> List[np.ndarray]:
+        """The 256 images of every byte of the state under the matrix of steps, kept for powers of two"""
+        tables = self.tables.get(steps)
+        if tables is None:
+            matrix = self.matrix(steps)
+            tables = [
+                np.array([self.apply(matrix, byte << shift) for byte in range(256)], self.dtype)
+                for shift in range(0, self.degree, 8)
+            ]
+            if not steps & steps - 1:
+                self.tables[steps] = tables
+        return tables
+
+    def advance(self, steps: int, states: np.ndarray) -> np.ndarray:
+        """Every state of the array steps further on, by one table lookup per byte of the states"""
+        result = np.zeros_like(states)
+        for shift, table in zip(range(0, self.degree, 8), self.byte_tables(steps)):
+            result ^= table[(states >> self.dtype.type(shift)) & self.dtype.type(0xff)]
         return result
 
+    def run(self, seeds: Sequence[int], count: int, start: int = 0) -> np.ndarray:
+        """
+        States start + 1 to start + count of a register from every seed, as a count by len(seeds) array. States
+        1 to 2^k are states 0 to 2^k - 1 advanced by the matrix of 2^k steps, so the run doubles every time.
+        """
+        states = np.empty((count, len(seeds)), self.dtype)
+        if not count:
+            return states
+        states[0] = self.advance(start + 1, np.array(seeds, self.dtype))
+        built = 1
+        while built < count:
+            n = min(built, count - built)
+            states[built:built + n] = self.advance(built, states[:n])
+            built += n
+        return states
+
+
+class TestVectorGenerator:
+    """
+    Vectors from one 8 bit Galois LFSR per byte of the vector, all stepping together, each seeded with its
+    byte of the seed repeated over the length of the vector; vector n holds the states after n + 1 steps.
+    """
+    degree = 8
+
+    def __init__(self, seed: int, input_bits: int, taps: Iterable[int] = ()):
+        self.input_bits = input_bits
+        self.tv_length = self.bits_ceiling(input_bits)
+        binary_seed = format(seed, f"0{self.bits_ceiling(seed.bit_length())}b")
+        repetitions = self.tv_length // len(binary_seed) + (1 if self.tv_length % len(binary_seed) else 0)
+        binary_seed = (binary_seed * repetitions)[:self.tv_length]
+        self.lfsr = LFSR(self.degree, taps)
+        self.seeds = [int(binary_seed[n:n + self.degree], 2) for n in range(0, self.tv_length, self.degree)]
+
+    def __call__(self, count: Optional[int] = None, start: int = 0) -> TestVectorBatch:
+        """Vectors start to start + count, tv_count of them by default; any segment costs as much as the first"""
+        count = self.tv_count if count is None else count
+        return self.pack(self.lfsr.run(self.seeds, count, start))
+
+    def pack(self, states: np.ndarray) -> TestVectorBatch:
+        """The vectors of rows of register states"""
+        count = len(states)
+        # Every row of bytes read as one big endian int, 8 bytes at a time
+        padding = -len(self.seeds) % 8
+        words = np.zeros((count, len(self.seeds) + padding), np.uint8)
+        words[:, padding:] = states
+        words = words.view('>u8')
+        bits = words[:, 0].tolist() if words.shape[1] else [0] * count
+        for column in range(1, words.shape[1]):
+            bits = [high << 64 | low for high, low in zip(bits, words[:, column].tolist())]
+        return TestVectorBatch(bits, self.tv_length)
+
+    def batches(self, count: Optional[int] = None, batch_size: int = 4096) -> Iterator[TestVectorBatch]:
+        """
+        The first count vectors, tv_count by default, generated batch_size at a time; every batch after the first
+        is the states of the one before advanced batch_size steps
+        """
+        count = self.tv_count if count is None else count
+        states: Optional[np.ndarray] = None
+        for start in range(0, count, batch_size):
+            n = min(batch_size, count - start)
+            states = self.lfsr.run(self.seeds, n) if states is None else self.lfsr.advance(batch_size, states[:n])
+            yield self.pack(states)
+
     @functools.cached_property
     def tv_count(self):
         tv_count = 2 ** self.input_bits
@@ -138,20 +331,47 @@ class TestVectorGenerator:
         return bits // 8 * 8 + (8 if bits % 8 else 0)
 
     @staticmethod
-    def from_counter(seed: int, input_bits: int) -> List[TestVector]:
-        tv_count = 2 ** input_bits
-        if tv_count > 100:
-            tv_count = 100
+    def counter(seed: int, input_bits: int, count: Optional[int] = None, batch_size: int = 4096) \
+            -> Iterator[TestVectorBatch]:
+        """
+        Counting up from the leading input_bits of the seed, wrapping around at count (at most 2^input_bits,
+        100 by default), batch_size vectors at a time
+        """
+        count = min(2 ** input_bits, 100 if count is None else count)
         seed_length = TestVectorGenerator.bits_ceiling(input_bits) if \
             input_bits > seed.bit_length() else \
             TestVectorGenerator.bits_ceiling(seed.bit_length())
         trimmed_seed = int(format(seed, f"0{seed_length}b")[:input_bits], 2)
-        bitstrings = (format((trimmed_seed + n) % tv_count, f"0{input_bits}b")
-                      for n in range(0, tv_count))
-        result = [TestVector(bitstring) for bitstring in bitstrings]
-        with open(f"_testvectors_from_counter.txt", 'w') as f:
-            f.writelines([f"{tv}\n" for tv in result])
-        return result
+        for start in range(0, count, batch_size):
+            yield TestVectorBatch(
+                [(trimmed_seed + n) % count for n in range(start, min(start + batch_size, count))], input_bits
+            )
+
+    @staticmethod
+    def from_counter(seed: int, input_bits: int, count: Optional[int] = None) -> List[TestVector]:
+        return [
+            test_vector for batch in TestVectorGenerator.counter(seed, input_bits, count) for test_vector in batch
+        ]
+
+
+class VectorLog:
+    """Optional sink for the vectors of a run, one per line, written through a large buffer"""
+
+    def __init__(self, path: str, buffer_size: int = 1 << 20):
+        self.file = open(path, 'w', buffering=buffer_size)
+
+    def write(self, test_vectors: Iterable[TestVector]):
+        self.file.writelines(f"{test_vector}\n" for test_vector in test_vectors)
+
+    def close(self):
+        self.file.close()
+
+    def __enter__(self) -> 'VectorLog':
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
 
 class LFSRTest(unittest.TestCase):
     def setUp(self) -> None:
@@ -196,6 +416,41 @@ class LFSRTest(unittest.TestCase):
         self.assertEqual(len(test_vectors), 100, 'unexpected length')  # Check that we got 16 test vectors
         self.assertEqual(len(test_vectors), len(set(test_vectors)), 'non-unique elements')
 
+    def test_jump(self):
+        for galois in (True, False):
+            lfsr = LFSR(20, {3}, 5, galois)
+            states = lfsr.states(300)
+            jumped = LFSR(20, {3}, 5, galois)
+            jumped.jump(123)
+            self.assertEqual(jumped.state, states[122], 'jumping ahead disagrees with stepping')
+            self.assertEqual(LFSR(20, {3}, 5, galois).run([5], 300)[:, 0].tolist(), states)
+        tvg = TestVectorGenerator(0x1234, 20, {2, 3, 5})
+        self.assertEqual(tvg(50, start=1000), tvg(1050)[1000:], 'segment disagrees with the full sequence')
+        # Only the matrices of powers of two are kept, whatever segments were asked for
+        self.assertEqual(len(tvg.lfsr.powers), 11)
+        self.assertEqual(tvg.lfsr.matrix(1050), LFSR.compose(tvg.lfsr.matrix(26), tvg.lfsr.matrix(1024)))
+        # Batches continue from the one before rather than jumping from the seeds
+        self.assertEqual([bits for batch in tvg.batches(1000, 7) for bits in batch.bits], tvg(1000).bits)
+
+
+class TestVectorTest(unittest.TestCase):
+    def test_packed(self):
+        test_vector = TestVector('01U10')
+        self.assertEqual(repr(test_vector), '01U10')
+        self.assertEqual([str(value) for value in test_vector], ['0', '1', 'U', '1', '0'])
+        self.assertEqual(test_vector[1:4], TestVector('1U1'))
+        self.assertEqual(hash(test_vector[1:4]), hash(TestVector('1U1')))
+        self.assertEqual(test_vector, TestVector.from_values(list(test_vector)))
+        self.assertNotEqual(test_vector[:2], test_vector[:3])
+        self.assertEqual(TestVector.lanes([TestVector('01U'), TestVector('11')], 3), [(2, 1), (3, 0), (0, 0)])
+
+    def test_batch(self):
+        batch = TestVectorGenerator(0x1234, 20, {2, 3, 5})(10)
+        self.assertEqual(len(batch), 10)
+        self.assertEqual([repr(test_vector) for test_vector in batch[2:5]], [repr(batch[n]) for n in range(2, 5)])
+        self.assertEqual(list(batch.cut(20)), [test_vector[:20] for test_vector in batch])
+        self.assertEqual(batch, list(batch))
+
 
 if __name__ == '__main__':
     unittest.main()
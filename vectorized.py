@@ -0,0 +1,90 @@
+from typing import List, Dict, Tuple
+import numpy as np
+from array_netlist import ArrayNetlist, gate_codes
+
+# Rails as in parallel.py, but held in uint64 words: row n of ones and zeros is net n, 64 lanes per word
+WordRails = Tuple[np.ndarray, np.ndarray]
+
+_and_codes = {gate_codes["AND"], gate_codes["NAND"]}
+_or_codes = {gate_codes["OR"], gate_codes["NOR"]}
+_xor_codes = {gate_codes["XOR"], gate_codes["XNOR"]}
+_buff_codes = {gate_codes["BUFF"], gate_codes["NOT"]}
+_inverting_codes = {gate_codes["NAND"], gate_codes["NOR"], gate_codes["XNOR"], gate_codes["NOT"]}
+
+
+def to_words(rails: List[int], words: int) -> np.ndarray:
+    """Python int rails to a (len(rails), words) array of uint64"""
+    return np.frombuffer(
+        b''.join(rail.to_bytes(8 * words, 'little') for rail in rails), dtype='<u8'
+    ).reshape(len(rails), words).astype(np.uint64)
+
+
+def from_words(array: np.ndarray) -> List[int]:
+    """Inverse of to_words"""
+    data = np.ascontiguousarray(array, dtype='<u8').tobytes()
+    width = 8 * array.shape[1]
+    return [int.from_bytes(data[n:n + width], 'little') for n in range(0, len(data), width)]
+
+
+class VectorizedKernel:
+    """
+    Good machine simulation that is parallel across gates as well as across vectors. The gates of every
+    level are grouped by type and fan-in count, and a group is evaluated in one NumPy operation: the fan-in
+    rails are gathered through a (gates, fan-in) index matrix and reduced along the fan-in axis.
+
+    Called like GeneratedKernel, with the Python int rails of the primary inputs, so it can stand in as the
+    kernel of ParallelSimulator; simulate works on the word arrays directly.
+    """
+
+    def __init__(self, netlist: ArrayNetlist):
+        self.netlist = netlist
+        # (code, output nets, fan-in matrix) in evaluation order; groups of one level never depend on each other
+        self.groups: List[Tuple[int, np.ndarray, np.ndarray]] = []
+        fanin_offsets = netlist.fanin_offsets
+        for level in range(len(netlist.level_offsets) - 1):
+            nets = netlist.order[netlist.level_offsets[level]:netlist.level_offsets[level + 1]]
+            codes = netlist.gate_types[nets]
+            counts = fanin_offsets[nets + 1] - fanin_offsets[nets]
+            groups: Dict[Tuple[int, int], np.ndarray] = {}
+            for code, count in set(zip(codes.tolist(), counts.tolist())):
+                groups[code, count] = nets[(codes == code) & (counts == count)]
+            for (code, count), outputs in sorted(groups.items()):
+                fanin = netlist.fanin[fanin_offsets[outputs][:, None] + np.arange(count)]
+                self.groups.append((code, outputs, fanin))
+
+    def simulate(self, ones_in: np.ndarray, zeros_in: np.ndarray) -> WordRails:
+        """Rails of every net, plus the trailing pin slot, given the (inputs, words) rails of the inputs"""
+        words = ones_in.shape[1]
+        ones, zeros = self.netlist.allocate_values(words)
+        ones[self.netlist.inputs] = ones_in
+        zeros[self.netlist.inputs] = zeros_in
+        for code, outputs, fanin in self.groups:
+            one, zero = self.evaluate(code, ones[fanin], zeros[fanin])
+            ones[outputs] = one
+            zeros[outputs] = zero
+        return ones, zeros
+
+    @staticmethod
+    def evaluate(code: int, ones: np.ndarray, zeros: np.ndarray) -> WordRails:
+        """Output rails of a group of gates, given the (gates, fan-in, words) rails of their inputs"""
+        if code in _and_codes:
+            one, zero = np.bitwise_and.reduce(ones, axis=1), np.bitwise_or.reduce(zeros, axis=1)
+        elif code in _or_codes:
+            one, zero = np.bitwise_or.reduce(ones, axis=1), np.bitwise_and.reduce(zeros, axis=1)
+        elif code in _xor_codes:
+            one, zero = ones[:, 0], zeros[:, 0]
+            for pin in range(1, ones.shape[1]):
+                o, z = ones[:, pin], zeros[:, pin]
+                one, zero = (one & z) | (zero & o), (one & o) | (zero & z)
+        elif code in _buff_codes:
+            one, zero = ones[:, 0], zeros[:, 0]
+        else:
+            one = zero = np.zeros((ones.shape[0], ones.shape[2]), np.uint64)
+        if code in _inverting_codes:
+            one, zero = zero, one
+        return one, zero
+
+    def __call__(self, ones: List[int], zeros: List[int]) -> Tuple[List[int], List[int]]:
+        words = max(1, -(-max((rail.bit_length() for rail in (*ones, *zeros)), default=0) // 64))
+        ones_out, zeros_out = self.simulate(to_words(ones, words), to_words(zeros, words))
+        return from_words(ones_out), from_words(zeros_out)